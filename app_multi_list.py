@@ -1,16 +1,19 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import sqlalchemy
 from sqlalchemy import text
-from sqlalchemy.pool import NullPool
 import os
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import re
+import threading
+import time
 from datetime import datetime
 import uuid
 import bcrypt
 
+from chart_features import compute_kline_features
+from db_engine import get_engine
+import kline_chart as kc
+
 # ===========================
 # 1. 資料庫連線與全域設定
 # ===========================
@@ -21,11 +24,7 @@ if not SUPABASE_DB_URL:
     st.error("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
     st.stop()
 
-@st.cache_resource
-def get_engine():
-    return sqlalchemy.create_engine(SUPABASE_DB_URL, poolclass=NullPool)
-
-engine = get_engine()
+engine = get_engine(SUPABASE_DB_URL)
 
 # ===========================
 # 2. 身份驗證與註冊模組
@@ -73,9 +72,47 @@ def update_password(username, old_password, new_password):
 # ===========================
 # 3. DB 操作函式 
 # ===========================
-def clear_db_cache():
-    get_all_lists_db.clear()
-    get_list_data_db.clear()
+# 🚀 自選股 write-through 快取：以使用者為單位，一次載入該使用者全部群組，
+# 寫入時同步更新記憶體中的對應群組，不再每次點擊就清空所有人的快取
+WATCHLIST_TTL = 3600
+WATCHLIST_COLUMNS = ['symbol', 'added_date']
+
+@st.cache_resource(show_spinner=False)
+def get_watchlist_store():
+    # {username: {'loaded_at': ts, 'menus': {list_name: menu_id}, 'items': {list_name: DataFrame}}}
+    return {'lock': threading.RLock(), 'users': {}}
+
+def _load_user_watchlists(username):
+    query = """
+    SELECT m.id AS menu_id, m.name, i.symbol, i.added_date
+    FROM watchlist_menus m
+    LEFT JOIN watchlist_items i ON i.menu_id = m.id
+    WHERE m.username = :u
+    ORDER BY m.name, i.symbol
+    """
+    with engine.connect() as conn:
+        df = pd.read_sql(text(query), conn, params={"u": username})
+    menus = {name: int(mid) for name, mid in zip(df['name'], df['menu_id'])}
+    items = {name: pd.DataFrame(columns=WATCHLIST_COLUMNS) for name in menus}
+    for name, grp in df.dropna(subset=['symbol']).groupby('name', sort=False):
+        items[name] = grp[WATCHLIST_COLUMNS].reset_index(drop=True)
+    return {'loaded_at': time.time(), 'menus': menus, 'items': items}
+
+def _user_watchlists(username):
+    store = get_watchlist_store()
+    with store['lock']:
+        entry = store['users'].get(username)
+        if entry is None or time.time() - entry['loaded_at'] > WATCHLIST_TTL:
+            entry = store['users'][username] = _load_user_watchlists(username)
+        return entry
+
+def invalidate_watchlists(username):
+    store = get_watchlist_store()
+    with store['lock']:
+        store['users'].pop(username, None)
+
+def _set_list_items(entry, list_name, df_items):
+    entry['items'][list_name] = df_items.sort_values('symbol').reset_index(drop=True)
 
 @st.cache_data(ttl=3600, show_spinner=False)
 def get_all_users_db(current_username):
@@ -85,23 +122,12 @@ def get_all_users_db(current_username):
             return [row[0] for row in result]
     except Exception: return []
 
-@st.cache_data(ttl=3600, show_spinner=False)
 def get_all_lists_db(username):
-    with engine.connect() as conn:
-        result = conn.execute(text("SELECT name FROM watchlist_menus WHERE username = :u ORDER BY name"), {"u": username})
-        return [row[0] for row in result]
+    return list(_user_watchlists(username)['menus'])
 
-@st.cache_data(ttl=3600, show_spinner=False)
 def get_list_data_db(list_name, username):
-    query = """
-    SELECT i.symbol, i.added_date
-    FROM watchlist_items i
-    JOIN watchlist_menus m ON i.menu_id = m.id
-    WHERE m.name = :list_name AND m.username = :u
-    ORDER BY i.symbol
-    """
-    with engine.connect() as conn:
-        return pd.read_sql(text(query), conn, params={"list_name": list_name, "u": username})
+    items = _user_watchlists(username)['items'].get(list_name)
+    return items.copy() if items is not None else pd.DataFrame(columns=WATCHLIST_COLUMNS)
 
 def create_list_db(new_name, username):
     current_lists = get_all_lists_db(username)
@@ -109,8 +135,11 @@ def create_list_db(new_name, username):
     if new_name in current_lists: return False, "名稱已存在"
     try:
         with engine.begin() as conn:
-            conn.execute(text("INSERT INTO watchlist_menus (name, username) VALUES (:name, :u)"), {"name": new_name, "u": username})
-        clear_db_cache()
+            menu_id = conn.execute(text("INSERT INTO watchlist_menus (name, username) VALUES (:name, :u) RETURNING id"), {"name": new_name, "u": username}).scalar()
+        with get_watchlist_store()['lock']:
+            entry = _user_watchlists(username)
+            entry['menus'] = dict(sorted({**entry['menus'], new_name: menu_id}.items()))
+            entry['items'][new_name] = pd.DataFrame(columns=WATCHLIST_COLUMNS)
         return True, "建立成功"
     except Exception as e: return False, str(e)
 
@@ -120,7 +149,11 @@ def rename_list_db(old_name, new_name, username):
             exists = conn.execute(text("SELECT 1 FROM watchlist_menus WHERE name = :new AND username = :u"), {"new": new_name, "u": username}).scalar()
             if exists: return False, "名稱已存在"
             conn.execute(text("UPDATE watchlist_menus SET name = :new WHERE name = :old AND username = :u"), {"new": new_name, "old": old_name, "u": username})
-        clear_db_cache()
+        with get_watchlist_store()['lock']:
+            entry = _user_watchlists(username)
+            menus = {(new_name if k == old_name else k): v for k, v in entry['menus'].items()}
+            entry['menus'] = dict(sorted(menus.items()))
+            entry['items'][new_name] = entry['items'].pop(old_name, pd.DataFrame(columns=WATCHLIST_COLUMNS))
         return True, "改名成功"
     except Exception as e: return False, str(e)
 
@@ -128,34 +161,62 @@ def delete_list_db(list_name, username):
     try:
         with engine.begin() as conn:
             conn.execute(text("DELETE FROM watchlist_menus WHERE name = :name AND username = :u"), {"name": list_name, "u": username})
-        clear_db_cache()
+        with get_watchlist_store()['lock']:
+            entry = _user_watchlists(username)
+            entry['menus'].pop(list_name, None)
+            entry['items'].pop(list_name, None)
         return True, "刪除成功"
     except Exception as e: return False, str(e)
 
-def add_stock_db(list_name, symbol, username):
-    added_date = datetime.now().strftime('%Y-%m-%d')
+def add_stocks_bulk_db(list_name, symbols, username):
+    """
+    批次加入 (貼上整串代號)：單一交易、一次 executemany 寫入
+    回傳 (成功與否, 訊息, 實際新增的代號)
+    """
+    entry = _user_watchlists(username)
+    menu_id = entry['menus'].get(list_name)
+    if not menu_id: return False, "群組不存在", []
+
+    existing = set(entry['items'][list_name]['symbol'])
+    new_symbols = list(dict.fromkeys(s for s in symbols if s not in existing))
+    if not new_symbols: return True, "沒有需要新增的代號", []
+
+    added_date = datetime.now().date()
     try:
         with engine.begin() as conn:
-            menu_id = conn.execute(text("SELECT id FROM watchlist_menus WHERE name = :name AND username = :u"), {"name": list_name, "u": username}).scalar()
-            if not menu_id: return False, "群組不存在"
             conn.execute(text("""
                 INSERT INTO watchlist_items (menu_id, symbol, added_date) VALUES (:mid, :sym, :date)
                 ON CONFLICT (menu_id, symbol) DO NOTHING
-            """), {"mid": menu_id, "sym": symbol, "date": added_date})
-        clear_db_cache()
-        return True, "加入成功"
-    except Exception as e: return False, str(e)
+            """), [{"mid": menu_id, "sym": s, "date": added_date.strftime('%Y-%m-%d')} for s in new_symbols])
+    except Exception as e:
+        # 快取可能已過期 (例如群組在別處被刪除)，下次讀取時重新載入
+        invalidate_watchlists(username)
+        return False, str(e), []
+
+    with get_watchlist_store()['lock']:
+        new_rows = pd.DataFrame({'symbol': new_symbols, 'added_date': [added_date] * len(new_symbols)})
+        frames = [f for f in (entry['items'][list_name], new_rows) if not f.empty]
+        _set_list_items(entry, list_name, pd.concat(frames, ignore_index=True))
+    return True, "加入成功", new_symbols
+
+def add_stock_db(list_name, symbol, username):
+    success, msg, _ = add_stocks_bulk_db(list_name, [symbol], username)
+    return success, ("加入成功" if success else msg)
 
 def remove_stock_db(list_name, symbol, username):
+    entry = _user_watchlists(username)
+    menu_id = entry['menus'].get(list_name)
+    if not menu_id: return False, "群組不存在"
     try:
         with engine.begin() as conn:
-            conn.execute(text("""
-                DELETE FROM watchlist_items
-                WHERE symbol=:s AND menu_id=(SELECT id FROM watchlist_menus WHERE name=:n AND username=:u)
-            """), {"s": symbol, "n": list_name, "u": username})
-        clear_db_cache()
+            conn.execute(text("DELETE FROM watchlist_items WHERE menu_id = :mid AND symbol = :s"), {"mid": menu_id, "s": symbol})
+        with get_watchlist_store()['lock']:
+            items = entry['items'][list_name]
+            _set_list_items(entry, list_name, items[items['symbol'] != symbol])
         return True, "移除成功"
-    except Exception as e: return False, str(e)
+    except Exception as e:
+        invalidate_watchlists(username)
+        return False, str(e)
 
 def clone_list_db(list_name, source_username, target_username):
     if source_username == target_username: return False, "⚠️ 不能分享給自己喔！"
@@ -173,6 +234,8 @@ def clone_list_db(list_name, source_username, target_username):
                 added_date = datetime.now().strftime('%Y-%m-%d')
                 insert_data = [{"mid": new_menu_id, "sym": row[0], "date": added_date} for row in items]
                 conn.execute(text("INSERT INTO watchlist_items (menu_id, symbol, added_date) VALUES (:mid, :sym, :date) ON CONFLICT DO NOTHING"), insert_data)
+        # 只有對方的群組清單變動，讓對方下次讀取時重新載入
+        invalidate_watchlists(target_username)
         return True, f"✅ 已成功將「{list_name}」分享給 {target_username}！"
     except Exception as e: return False, f"系統錯誤: {str(e)}"
 
@@ -273,87 +336,18 @@ def load_precalculated_data():
 
     return df_dict_by_date, df_dict_by_symbol, latest_prices_map, max_date, avail_dates
 
+# 🚀 圖表特徵 LRU 快取：同一檔股票、同一截止日只算一次，翻頁回來直接取用
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+def get_chart_frame(symbol, last_date, _df_stock):
+    return compute_kline_features(_df_stock)
+
 # --- 繪圖輔助 (✨旗艦白底專業版：修復交叉與扣抵標記) ---
 def plot_stock_kline(df_stock, symbol, name, selected_mas, show_ma_cross, show_3d_hl, show_limit_ud, show_vol_ma5, show_vol_ma10, show_macd, show_kd, show_rsi, show_foreign, show_trust):
-    df_calc = df_stock.copy()
-
-    df_calc['MA3'] = df_calc['close'].rolling(window=3).mean()
-    df_calc['MA120'] = df_calc['close'].rolling(window=120).mean()
-    df_calc['std20'] = df_calc['close'].rolling(window=20).std()
-    df_calc['BB_up'] = df_calc['MA20'] + 3 * df_calc['std20']
-    df_calc['BB_low'] = df_calc['MA20'] - 3 * df_calc['std20']
-    df_calc['prev_MA20'] = df_calc['MA20'].shift(1)
-    df_calc['prev_MA60'] = df_calc['MA60'].shift(1)
-    
-    # 計算昨日收盤價 (供漲跌停判斷使用)
-    df_calc['prev_close_ud'] = df_calc['close'].shift(1).fillna(df_calc['open'])
-
-    df_calc['Vol_MA5'] = df_calc['volume'].rolling(window=5).mean()
-    df_calc['Vol_MA10'] = df_calc['volume'].rolling(window=10).mean()
-
-    df_calc['MACD_Signal'] = df_calc['DIF'] - df_calc['MACD_OSC']
-
-    delta = df_calc['close'].diff()
-    gain = delta.where(delta > 0, 0).ewm(alpha=1/14, adjust=False).mean()
-    loss = (-delta.where(delta < 0, 0)).ewm(alpha=1/14, adjust=False).mean()
-    rs = gain / loss.replace(0, float('nan'))
-    df_calc['RSI'] = 100 - (100 / (1 + rs))
-    df_calc['RSI'] = df_calc['RSI'].fillna(50)
-    
-    # 🔥 核心計算：三日高低點與撐壓給分機制
-    signal_3d = np.zeros(len(df_calc))
-    score_3d = np.array([""] * len(df_calc), dtype=object)
-    triangle_3d = np.zeros(len(df_calc))
-    key_high_3d = np.full(len(df_calc), np.nan)
-    key_low_3d = np.full(len(df_calc), np.nan)
-    key_date_3d = np.array([""] * len(df_calc), dtype=object)
-
-    highs, lows, closes, opens = df_calc['high'].values, df_calc['low'].values, df_calc['close'].values, df_calc['open'].values
-    dates_str = df_calc['date'].dt.strftime('%Y-%m-%d').values
-    consecutive_up, consecutive_down = 0, 0
-
-    for i in range(3, len(df_calc)):
-        past_highs, past_lows = highs[i-3:i], lows[i-3:i]
-        h3, l3 = np.max(past_highs), np.min(past_lows)
-        p_c, p_h, p_l = closes[i-1], highs[i-1], lows[i-1]
-        
-        is_limit_up = closes[i] >= p_c * 1.095
-        is_limit_down = closes[i] <= p_c * 0.905
-        is_gap_up, is_gap_down = lows[i] > p_h, highs[i] < p_l
-        
-        if closes[i] > h3:
-            signal_3d[i], consecutive_up, consecutive_down = 1, consecutive_up + 1, 0
-            k_idx = i - 3 + np.argmax(past_highs)
-            key_high_3d[i], key_low_3d[i], key_date_3d[i] = highs[k_idx], lows[k_idx], dates_str[k_idx]
-            if is_limit_up: score_3d[i] = "+2"
-            elif is_gap_up: score_3d[i] = "+1.5"
-            elif closes[i] > opens[i]: score_3d[i] = "+1"
-            else: score_3d[i] = "+0.5"
-            if consecutive_up >= 2: triangle_3d[i] = 1
-                
-        elif closes[i] < l3:
-            signal_3d[i], consecutive_down, consecutive_up = -1, consecutive_down + 1, 0
-            k_idx = i - 3 + np.argmin(past_lows)
-            key_high_3d[i], key_low_3d[i], key_date_3d[i] = highs[k_idx], lows[k_idx], dates_str[k_idx]
-            if is_limit_down: score_3d[i] = "-2"
-            elif is_gap_down: score_3d[i] = "-1.5"
-            elif closes[i] < opens[i]: score_3d[i] = "-1"
-            else: score_3d[i] = "-0.5"
-            if consecutive_down >= 2: triangle_3d[i] = -1
-        else:
-            consecutive_up, consecutive_down = 0, 0
-
-    df_calc['signal_3d'] = signal_3d
-    df_calc['score_3d'] = score_3d
-    df_calc['triangle_3d'] = triangle_3d
-    df_calc['key_high_3d'] = key_high_3d
-    df_calc['key_low_3d'] = key_low_3d
-    df_calc['key_date_3d'] = key_date_3d
+    df_calc = get_chart_frame(symbol, df_stock['date'].iloc[-1], df_stock)
 
     df_plot = df_calc.tail(130).copy()
     df_plot['date_str'] = df_plot['date'].dt.strftime('%Y-%m-%d')
-    df_plot['prev_volume'] = df_plot['volume'].shift(1)
-    df_plot['vol_ratio_ma'] = df_plot['volume'] / (df_plot['volume'].rolling(5).mean() + 1e-9)
+    x = df_plot['date_str'].to_numpy()
 
     panels = [{'name': 'volume', 'title': '成交量 (張)'}]
     if show_macd: panels.append({'name': 'macd', 'title': 'MACD'})
@@ -361,146 +355,137 @@ def plot_stock_kline(df_stock, symbol, name, selected_mas, show_ma_cross, show_3
     if show_rsi: panels.append({'name': 'rsi', 'title': 'RSI (14)'})
     if show_foreign: panels.append({'name': 'foreign', 'title': '外資買賣超 (張)'})
     if show_trust: panels.append({'name': 'trust', 'title': '投信買賣超 (張)'})
-    
-    num_subplots = 1 + len(panels)
+
     row_heights = [0.45] + [(0.55 / len(panels))] * len(panels)
     subplot_titles = [f"📈 {symbol} {name}"] + [f"📊 {p['title']}" for p in panels]
-
-    fig = make_subplots(rows=num_subplots, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=row_heights, subplot_titles=subplot_titles)
+    traces, shapes, notes = [], [], []
 
     # ================= 區塊 1: K線、布林通道、均線 =================
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['BB_up'], mode='lines', line=dict(color='rgba(80, 80, 80, 0.5)', dash='dot', width=1), name='3倍布林', legendgroup='bb'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['BB_low'], mode='lines', line=dict(color='rgba(80, 80, 80, 0.5)', dash='dot', width=1), name='BB-3', legendgroup='bb', showlegend=False, fill='tonexty', fillcolor='rgba(200, 200, 200, 0.2)'), row=1, col=1)
+    traces.append(kc.line(x, df_plot['BB_up'], line=dict(color='rgba(80, 80, 80, 0.5)', dash='dot', width=1), name='3倍布林', legendgroup='bb'))
+    traces.append(kc.line(x, df_plot['BB_low'], line=dict(color='rgba(80, 80, 80, 0.5)', dash='dot', width=1), name='BB-3', legendgroup='bb', showlegend=False, fill='tonexty', fillcolor='rgba(200, 200, 200, 0.2)'))
 
     ma_col_map = {'3MA': 'MA3', '5MA': 'MA5', '10MA': 'MA10', '20MA': 'MA20', '60MA': 'MA60', '120MA': 'MA120'}
     ma_colors = {'3MA': '#FF69B4', '5MA': 'orange', '10MA': '#00FFFF', '20MA': 'purple', '60MA': 'blue', '120MA': 'green'}
-    
+
     y_range = df_plot['high'].max() - df_plot['low'].min()
     y_offset = y_range * 0.08
 
+    deduct_specs = []
     for ma_name in selected_mas:
         col_name = ma_col_map.get(ma_name)
         if col_name and col_name in df_plot.columns:
             is_up = df_plot[col_name].iloc[-1] > df_plot[col_name].iloc[-2]
-            fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot[col_name], line=dict(color=ma_colors.get(ma_name, '#333333'), width=1.5), name=f"{ma_name} {'🔺' if is_up else '▼'}"), row=1, col=1)
-            
-            N = int(ma_name.replace('MA', ''))
-            if len(df_plot) >= N:
-                deduct_idx = -N 
-                x_val = df_plot['date_str'].iloc[deduct_idx]
-                c_low = df_plot['low'].iloc[deduct_idx]
-                y_marker = c_low - y_offset
-                
-                fig.add_trace(go.Scatter(x=[x_val, x_val], y=[y_marker, c_low], mode='lines', line=dict(color=ma_colors.get(ma_name, 'black'), width=1.5, dash='dot'), hoverinfo='skip', showlegend=False), row=1, col=1)
-                fig.add_trace(go.Scatter(x=[x_val], y=[y_marker], mode='markers+text', marker=dict(symbol='circle', size=22, color='white', line=dict(color=ma_colors.get(ma_name, 'black'), width=2.5)), text=[str(N)], textfont=dict(color=ma_colors.get(ma_name, 'black'), size=11, family="Arial Black"), hoverinfo='skip', showlegend=False), row=1, col=1)
+            traces.append(kc.line(x, df_plot[col_name], line=dict(color=ma_colors.get(ma_name, '#333333'), width=1.5), name=f"{ma_name} {'🔺' if is_up else '▼'}"))
+            deduct_specs.append((int(ma_name.replace('MA', '')), ma_colors.get(ma_name, 'black')))
+
+    # 扣抵標記：所有均線合併為一個 marker trace + 虛線 shapes
+    deduct_trace, deduct_shapes = kc.ma_deduction_markers(x, df_plot['low'].to_numpy(), deduct_specs, y_offset)
+    traces.append(deduct_trace); shapes.extend(deduct_shapes)
 
     if show_ma_cross:
         gc_df = df_plot[(df_plot['MA20'] > df_plot['MA60']) & (df_plot['prev_MA20'] <= df_plot['prev_MA60'])]
-        if not gc_df.empty: fig.add_trace(go.Scatter(x=gc_df['date_str'], y=gc_df['MA20'], mode='markers', marker=dict(symbol='triangle-up', size=14, color='gold', line=dict(width=1, color='darkgoldenrod')), name='20MA金叉60MA', showlegend=False), row=1, col=1)
+        if not gc_df.empty: traces.append(kc.markers(gc_df['date_str'], gc_df['MA20'], marker=dict(symbol='triangle-up', size=14, color='gold', line=dict(width=1, color='darkgoldenrod')), name='20MA金叉60MA', showlegend=False))
         dc_df = df_plot[(df_plot['MA20'] < df_plot['MA60']) & (df_plot['prev_MA20'] >= df_plot['prev_MA60'])]
-        if not dc_df.empty: fig.add_trace(go.Scatter(x=dc_df['date_str'], y=dc_df['MA20'], mode='markers', marker=dict(symbol='triangle-down', size=14, color='green', line=dict(width=1, color='darkgreen')), name='20MA死叉60MA', showlegend=False), row=1, col=1)
+        if not dc_df.empty: traces.append(kc.markers(dc_df['date_str'], dc_df['MA20'], marker=dict(symbol='triangle-down', size=14, color='green', line=dict(width=1, color='darkgreen')), name='20MA死叉60MA', showlegend=False))
 
     # 🔥 標記漲跌停 K 棒 (火焰與雷雨)
     if show_limit_ud:
         limit_up_df = df_plot[df_plot['close'] >= df_plot['prev_close_ud'] * 1.095]
         limit_dn_df = df_plot[df_plot['close'] <= df_plot['prev_close_ud'] * 0.905]
-        
+
         if not limit_up_df.empty:
-            fig.add_trace(go.Scatter(x=limit_up_df['date_str'], y=limit_up_df['high'] + y_offset * 0.6, mode='text', text=['🔥'] * len(limit_up_df), textfont=dict(size=18), name='漲停', hoverinfo='skip', showlegend=False), row=1, col=1)
+            traces.append(kc.markers(limit_up_df['date_str'], limit_up_df['high'] + y_offset * 0.6, mode='text', text=['🔥'] * len(limit_up_df), textfont=dict(size=18), name='漲停', hoverinfo='skip', showlegend=False))
         if not limit_dn_df.empty:
-            fig.add_trace(go.Scatter(x=limit_dn_df['date_str'], y=limit_dn_df['low'] - y_offset * 0.6, mode='text', text=['⛈️'] * len(limit_dn_df), textfont=dict(size=18), name='跌停', hoverinfo='skip', showlegend=False), row=1, col=1)
+            traces.append(kc.markers(limit_dn_df['date_str'], limit_dn_df['low'] - y_offset * 0.6, mode='text', text=['⛈️'] * len(limit_dn_df), textfont=dict(size=18), name='跌停', hoverinfo='skip', showlegend=False))
 
     # 🔥 修正版：三日高低點 (撐壓與給分)
     if show_3d_hl and 'signal_3d' in df_plot.columns:
-        for idx, row in df_plot.iterrows():
-            if row['signal_3d'] == 1:
-                lbl = f"<b>▲<br>{row['score_3d']}</b>" if row.get('triangle_3d', 0) == 1 else f"<b>{row['score_3d']}</b>"
-                fig.add_annotation(x=row['date_str'], y=row['high'], text=lbl, showarrow=True, arrowhead=1, arrowcolor="#FF3333", arrowsize=1, ax=0, ay=-35, font=dict(color="white", size=10), bgcolor="#FF3333", bordercolor="#FF3333", borderpad=2, row=1, col=1)
-            elif row['signal_3d'] == -1:
-                lbl = f"<b>▼<br>{row['score_3d']}</b>" if row.get('triangle_3d', 0) == -1 else f"<b>{row['score_3d']}</b>"
-                fig.add_annotation(x=row['date_str'], y=row['low'], text=lbl, showarrow=True, arrowhead=1, arrowcolor="#00AA00", arrowsize=1, ax=0, ay=35, font=dict(color="white", size=10), bgcolor="#00AA00", bordercolor="#00AA00", borderpad=2, row=1, col=1)
+        sig = df_plot['signal_3d'].to_numpy()
+        tri = df_plot['triangle_3d'].to_numpy()
+        score = df_plot['score_3d'].to_numpy()
+        highs, lows = df_plot['high'].to_numpy(), df_plot['low'].to_numpy()
+        for i in np.flatnonzero(sig == 1):
+            lbl = f"<b>▲<br>{score[i]}</b>" if tri[i] == 1 else f"<b>{score[i]}</b>"
+            notes.append(kc.annotation(x[i], highs[i], lbl, showarrow=True, arrowhead=1, arrowcolor="#FF3333", arrowsize=1, ax=0, ay=-35, font=dict(color="white", size=10), bgcolor="#FF3333", bordercolor="#FF3333", borderpad=2))
+        for i in np.flatnonzero(sig == -1):
+            lbl = f"<b>▼<br>{score[i]}</b>" if tri[i] == -1 else f"<b>{score[i]}</b>"
+            notes.append(kc.annotation(x[i], lows[i], lbl, showarrow=True, arrowhead=1, arrowcolor="#00AA00", arrowsize=1, ax=0, ay=35, font=dict(color="white", size=10), bgcolor="#00AA00", bordercolor="#00AA00", borderpad=2))
 
         ups = df_plot[df_plot['signal_3d'] == 1].drop_duplicates(subset=['key_date_3d'])
         downs = df_plot[df_plot['signal_3d'] == -1].drop_duplicates(subset=['key_date_3d'])
         last_sig_idx = df_plot[df_plot['signal_3d'] != 0].last_valid_index()
-        
+
         if last_sig_idx is not None:
             last_sig = df_plot.loc[last_sig_idx, 'signal_3d']
-            valid_dates = df_plot['date_str'].values
-            x_end = valid_dates[-1]
-            
+            x_end = x[-1]
+
             # 確保 X 軸字串有效，若起點超出視窗，則強制鎖定在畫面最左側 (避免線條斷裂)
             def get_valid_x0(d_str):
-                return d_str if d_str in valid_dates else valid_dates[0]
-            
+                return d_str if d_str in x else x[0]
+
+            up_style = dict(color="#FF3333", width=1.5, dash="dash")
+            down_style = dict(color="#00AA00", width=1.5, dash="dash")
             if last_sig == 1:
                 if not ups.empty:
                     up_row = ups.iloc[-1]
                     x0 = get_valid_x0(up_row['key_date_3d'])
-                    fig.add_shape(type="line", x0=x0, x1=x_end, y0=up_row['key_high_3d'], y1=up_row['key_high_3d'], line=dict(color="#FF3333", width=1.5, dash="dash"), row=1, col=1)
-                    fig.add_shape(type="line", x0=x0, x1=x_end, y0=up_row['key_low_3d'], y1=up_row['key_low_3d'], line=dict(color="#FF3333", width=1.5, dash="dash"), row=1, col=1)
-                
+                    shapes.append(kc.hline(up_row['key_high_3d'], x0=x0, x1=x_end, **up_style))
+                    shapes.append(kc.hline(up_row['key_low_3d'], x0=x0, x1=x_end, **up_style))
+
                 down_row = downs.iloc[-2] if len(downs) >= 2 else (downs.iloc[-1] if len(downs) == 1 else None)
                 if down_row is not None:
-                    x0 = get_valid_x0(down_row['key_date_3d'])
-                    fig.add_shape(type="line", x0=x0, x1=x_end, y0=down_row['key_high_3d'], y1=down_row['key_high_3d'], line=dict(color="#00AA00", width=1.5, dash="dash"), row=1, col=1)
-            
+                    shapes.append(kc.hline(down_row['key_high_3d'], x0=get_valid_x0(down_row['key_date_3d']), x1=x_end, **down_style))
+
             elif last_sig == -1:
                 if not downs.empty:
                     down_row = downs.iloc[-1]
-                    x0 = get_valid_x0(down_row['key_date_3d'])
-                    fig.add_shape(type="line", x0=x0, x1=x_end, y0=down_row['key_high_3d'], y1=down_row['key_high_3d'], line=dict(color="#00AA00", width=1.5, dash="dash"), row=1, col=1)
-                
+                    shapes.append(kc.hline(down_row['key_high_3d'], x0=get_valid_x0(down_row['key_date_3d']), x1=x_end, **down_style))
+
                 up_row = ups.iloc[-2] if len(ups) >= 2 else (ups.iloc[-1] if len(ups) == 1 else None)
                 if up_row is not None:
-                    x0 = get_valid_x0(up_row['key_date_3d'])
-                    fig.add_shape(type="line", x0=x0, x1=x_end, y0=up_row['key_high_3d'], y1=up_row['key_high_3d'], line=dict(color="#FF3333", width=1.5, dash="dash"), row=1, col=1)
+                    shapes.append(kc.hline(up_row['key_high_3d'], x0=get_valid_x0(up_row['key_date_3d']), x1=x_end, **up_style))
 
-    fig.add_trace(go.Candlestick(x=df_plot['date_str'], open=df_plot['open'], high=df_plot['high'], low=df_plot['low'], close=df_plot['close'], name='K線', increasing_line_color='#E13C3C', decreasing_line_color='#2CA045', showlegend=False), row=1, col=1)
+    traces.append(kc.candlestick(x, df_plot, name='K線', increasing_line_color='#E13C3C', decreasing_line_color='#2CA045', showlegend=False))
 
     # ================= 區塊 2: 動態副圖 =================
-    current_row = 2
-    for p in panels:
+    up_dn = lambda cond: np.where(cond, '#E13C3C', '#2CA045')
+    for row, p in enumerate(panels, start=2):
         if p['name'] == 'volume':
-            colors_vol = ['#E13C3C' if c >= o else '#2CA045' for c, o in zip(df_plot['close'], df_plot['open'])]
-            fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['volume'], marker_color=colors_vol, name='成交量', showlegend=False), row=current_row, col=1)
-            if show_vol_ma5: fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['Vol_MA5'], line=dict(color='orange', width=1.5), name='5日均量', showlegend=False), row=current_row, col=1)
-            if show_vol_ma10: fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['Vol_MA10'], line=dict(color='#00FFFF', width=1.5), name='10日均量', showlegend=False), row=current_row, col=1)
+            traces.append(kc.bar(x, df_plot['volume'], row=row, marker_color=up_dn(df_plot['close'] >= df_plot['open']), name='成交量', showlegend=False))
+            if show_vol_ma5: traces.append(kc.line(x, df_plot['Vol_MA5'], row=row, line=dict(color='orange', width=1.5), name='5日均量', showlegend=False))
+            if show_vol_ma10: traces.append(kc.line(x, df_plot['Vol_MA10'], row=row, line=dict(color='#00FFFF', width=1.5), name='10日均量', showlegend=False))
         elif p['name'] == 'macd':
-            macd_colors = ['#E13C3C' if v >= 0 else '#2CA045' for v in df_plot['MACD_OSC']]
-            fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['DIF'], line=dict(color='#0000FF', width=1.5), name='DIF', showlegend=False), row=current_row, col=1)
-            fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['MACD_Signal'], line=dict(color='#FF8C00', width=1.5), name='Signal', showlegend=False), row=current_row, col=1)
-            fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['MACD_OSC'], marker_color=macd_colors, name='OSC', showlegend=False), row=current_row, col=1)
+            traces.append(kc.line(x, df_plot['DIF'], row=row, line=dict(color='#0000FF', width=1.5), name='DIF', showlegend=False))
+            traces.append(kc.line(x, df_plot['MACD_Signal'], row=row, line=dict(color='#FF8C00', width=1.5), name='Signal', showlegend=False))
+            traces.append(kc.bar(x, df_plot['MACD_OSC'], row=row, marker_color=up_dn(df_plot['MACD_OSC'] >= 0), name='OSC', showlegend=False))
         elif p['name'] == 'kd':
-            fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['K'], line=dict(color='#FF8C00', width=1.5), name='K(9)', showlegend=False), row=current_row, col=1)
-            fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['D'], line=dict(color='#0000FF', width=1.5), name='D(3)', showlegend=False), row=current_row, col=1)
-            fig.add_hline(y=80, line_dash="dash", line_color="#999999", row=current_row, col=1)
-            fig.add_hline(y=20, line_dash="dash", line_color="#999999", row=current_row, col=1)
+            traces.append(kc.line(x, df_plot['K'], row=row, line=dict(color='#FF8C00', width=1.5), name='K(9)', showlegend=False))
+            traces.append(kc.line(x, df_plot['D'], row=row, line=dict(color='#0000FF', width=1.5), name='D(3)', showlegend=False))
+            shapes.append(kc.hline(80, row=row, dash="dash", color="#999999"))
+            shapes.append(kc.hline(20, row=row, dash="dash", color="#999999"))
         elif p['name'] == 'rsi':
-            fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['RSI'], line=dict(color='#8A2BE2', width=1.5), name='RSI(14)', showlegend=False), row=current_row, col=1)
+            traces.append(kc.line(x, df_plot['RSI'], row=row, line=dict(color='#8A2BE2', width=1.5), name='RSI(14)', showlegend=False))
         elif p['name'] == 'foreign':
-            colors_for = ['#E13C3C' if v > 0 else '#2CA045' for v in df_plot['foreign_net']]
-            fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['foreign_net'], marker_color=colors_for, name='外資進出', showlegend=False), row=current_row, col=1)
+            traces.append(kc.bar(x, df_plot['foreign_net'], row=row, marker_color=up_dn(df_plot['foreign_net'] > 0), name='外資進出', showlegend=False))
         elif p['name'] == 'trust':
-            colors_tru = ['#E13C3C' if v > 0 else '#2CA045' for v in df_plot['trust_net']]
-            fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['trust_net'], marker_color=colors_tru, name='投信進出', showlegend=False), row=current_row, col=1)
-        current_row += 1
-
-    for annotation in fig['layout']['annotations']:
-        # 🔥 關鍵修復：確保「靠左對齊」的動作，只針對副圖標題 (帶有圖案的)，避開我們畫在 K 棒上的分數！
-        if 'text' in annotation and ('📈' in annotation['text'] or '📊' in annotation['text']):
-            annotation['font'] = dict(size=14, color="#333333") 
-            annotation['x'] = 0.01  
-            annotation['xanchor'] = 'left'
-
-    fig.update_layout(
-        template="plotly_white", height=850 + (100 * (len(panels)-2)), margin=dict(l=40, r=20, t=50, b=20), xaxis_rangeslider_visible=False,
+            traces.append(kc.bar(x, df_plot['trust_net'], row=row, marker_color=up_dn(df_plot['trust_net'] > 0), name='投信進出', showlegend=False))
+
+    # 副圖標題靠左對齊，K 棒上的分數標註不受影響
+    layout = kc.subplot_layout(
+        row_heights, subplot_titles, vertical_spacing=0.03, title_font=dict(size=14, color="#333333"), title_align='left',
+        annotations=notes, shapes=shapes,
+        template="plotly_white", height=850 + (100 * (len(panels)-2)), margin=dict(l=40, r=20, t=50, b=20),
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(color="black")),
         paper_bgcolor='rgba(255,255,255,1)', plot_bgcolor='rgba(255,255,255,1)', font=dict(color='black')
     )
-    fig.update_xaxes(type='category', categoryorder='category ascending', nticks=20, tickangle=45, showgrid=True, gridcolor='#E0E0E0')
-    fig.update_yaxes(showgrid=True, gridcolor='#E0E0E0')
-    return fig
+    kc.update_axes(layout, 'x', type='category', categoryorder='category ascending', nticks=20, tickangle=45, showgrid=True, gridcolor='#E0E0E0', rangeslider=dict(visible=False))
+    kc.update_axes(layout, 'y', showgrid=True, gridcolor='#E0E0E0')
+    return kc.build_figure(traces, layout)
+
+# 🚀 圖表 Figure 快取：以 (股票, 截止日, 顯示選項) 為 key，切換選項回來不必重建
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+def get_kline_figure(symbol, last_date, name, options, _df_stock):
+    return plot_stock_kline(_df_stock, symbol, name, *options)
 
 # ===========================
 # 4. 側邊欄 Callbacks
@@ -546,6 +531,22 @@ def action_del():
     else: st.session_state.action_msg = ("warning", f"❌ 群組中無 {code}")
     st.session_state.query_mode_symbol = None
 
+def action_bulk_add():
+    sel_list, usr = st.session_state.get('selected_list_widget'), st.session_state.get('username')
+    raw = st.session_state.get('bulk_symbols_widget', '')
+    mapping = get_stock_mapping()
+    tokens = [t for t in re.split(r'[\s,，、;；]+', raw) if t]
+    codes = [resolve_stock_symbol(t, mapping) for t in tokens]
+    unknown = [t for t, c in zip(tokens, codes) if not c]
+    success, msg, added = add_stocks_bulk_db(sel_list, [c for c in codes if c], usr)
+    if not success:
+        st.session_state.action_msg = ("warning", f"❌ 批次加入失敗：{msg}")
+        return
+    txt = f"✅ 批次加入 {len(added)} 檔"
+    if unknown: txt += f"，找不到：{'、'.join(unknown)}"
+    st.session_state.action_msg = ("success" if added else "warning", txt)
+    st.session_state.bulk_symbols_widget = ""
+
 # ===========================
 # 5. 登入與註冊介面
 # ===========================
@@ -646,6 +647,10 @@ def main_app():
             st.cache_resource.clear()
             st.rerun()
 
+    with st.sidebar.expander("📥 批次加入"):
+        st.text_area("貼上多檔代號/名稱 (以空白、逗號或換行分隔)", key="bulk_symbols_widget", height=100)
+        st.button("全部加入", on_click=action_bulk_add)
+
     if st.session_state.action_msg:
         m_type, m_txt = st.session_state.action_msg
         if m_type == "success": st.sidebar.success(m_txt)
@@ -956,16 +961,16 @@ def main_app():
     )
 
     # 繪製 K 線圖 (帶入最新的 show_3d_hl 與 show_limit_ud 參數)
-    chart_src = df_dict_by_symbol.get(cur_sym, pd.DataFrame()).copy()
-    chart_src = chart_src[chart_src['date'] <= pd.Timestamp(sel_date)]
+    chart_src = df_dict_by_symbol.get(cur_sym, pd.DataFrame())
+    if not chart_src.empty: chart_src = chart_src[chart_src['date'] <= pd.Timestamp(sel_date)]
 
     if len(chart_src) < 30: st.error("資料不足以繪圖")
     else:
-        fig = plot_stock_kline(
-            chart_src, cur_sym, cur_info['name'],
-            selected_mas, show_ma_cross, show_3d_hl, show_limit_ud, show_vol_ma5, show_vol_ma10,
+        chart_opts = (
+            tuple(selected_mas), show_ma_cross, show_3d_hl, show_limit_ud, show_vol_ma5, show_vol_ma10,
             show_macd, show_kd, show_rsi, show_foreign, show_trust
         )
+        fig = get_kline_figure(cur_sym, chart_src['date'].iloc[-1], cur_info['name'], chart_opts, chart_src)
         st.plotly_chart(fig, use_container_width=True, key=f"chart_{cur_sym}_{uuid.uuid4()}")
 
 # ===========================
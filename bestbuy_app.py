@@ -1,12 +1,13 @@
 import streamlit as st
 import pandas as pd
-import sqlalchemy
 import os
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 
+import kline_chart as kc
+from chart_features import compute_kd_macd_cdp, compute_volume_profile
+from db_engine import get_engine
+
 # ===========================
 # 1. 資料庫連線與設定
 # ===========================
@@ -17,11 +18,7 @@ if not SUPABASE_DB_URL:
     st.error("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
     st.stop()
 
-@st.cache_resource
-def get_engine():
-    return sqlalchemy.create_engine(SUPABASE_DB_URL)
-
-engine = get_engine()
+engine = get_engine(SUPABASE_DB_URL)
 
 # ===========================
 # 2. 資料讀取與預處理
@@ -42,14 +39,12 @@ def load_and_process_data():
         df = pd.read_sql(query, conn)
     
     df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values(['symbol', 'date'])
-    grouped = df.groupby('symbol')
+    df = df.sort_values(['symbol', 'date']).reset_index(drop=True)
+    grouped = df.groupby('symbol', sort=False)
     
-    # 基礎均線
-    df['MA5'] = grouped['close'].transform(lambda x: x.rolling(5).mean())
-    df['MA10'] = grouped['close'].transform(lambda x: x.rolling(10).mean())
-    df['MA20'] = grouped['close'].transform(lambda x: x.rolling(20).mean())
-    df['MA60'] = grouped['close'].transform(lambda x: x.rolling(60).mean())
+    # 基礎均線 (全部股票一次分段 rolling，不逐檔呼叫 lambda)
+    for n in (5, 10, 20, 60):
+        df[f'MA{n}'] = grouped['close'].rolling(n).mean().reset_index(level=0, drop=True)
     
     # 比較用數據
     df['prev_close'] = grouped['close'].shift(1)
@@ -57,86 +52,78 @@ def load_and_process_data():
     df['pct_change'] = (df['close'] - df['prev_close']) / df['prev_close'] * 100
     
     # 量比
-    df['Vol_MA5'] = grouped['volume'].transform(lambda x: x.rolling(5).mean())
+    df['Vol_MA5'] = grouped['volume'].rolling(5).mean().reset_index(level=0, drop=True)
     df['vol_ratio'] = df['volume'] / df['Vol_MA5']
     
     return df
 
-# ===========================
-# 3. 進階指標計算函式
-# ===========================
-def calculate_advanced_indicators(df_single):
-    """針對單檔股票計算 KD, MACD, CDP"""
-    df = df_single.copy()
-    
-    # --- KD (9, 3, 3) ---
-    low_min = df['low'].rolling(9).min()
-    high_max = df['high'].rolling(9).max()
-    df['RSV'] = (df['close'] - low_min) / (high_max - low_min) * 100
-    df['RSV'] = df['RSV'].fillna(50)
-    
-    df['K'] = df['RSV'].ewm(com=2, adjust=False).mean()
-    df['D'] = df['K'].ewm(com=2, adjust=False).mean()
-    
-    # --- MACD (12, 26, 9) ---
-    exp12 = df['close'].ewm(span=12, adjust=False).mean()
-    exp26 = df['close'].ewm(span=26, adjust=False).mean()
-    df['DIF'] = exp12 - exp26
-    df['MACD'] = df['DIF'].ewm(span=9, adjust=False).mean()
-    df['MACD_OSC'] = df['DIF'] - df['MACD']
-    
-    # --- CDP ---
-    prev_high = df['high'].shift(1)
-    prev_low = df['low'].shift(1)
-    prev_close = df['close'].shift(1)
-    
-    df['CDP'] = (prev_high + prev_low + 2 * prev_close) / 4
-    rng = prev_high - prev_low 
-    
-    df['AH'] = df['CDP'] + rng
-    df['NH'] = 2 * df['CDP'] - prev_low
-    df['NL'] = 2 * df['CDP'] - prev_high
-    df['AL'] = df['CDP'] - rng
-    
-    return df
 
-def plot_stock_kline(df_stock, symbol, name, show_vol_profile=False):
-    """繪製 K 線圖 (6個月範圍)"""
-    
-    # 🔥 修改點 1: 取更多資料以確保指標穩定 (200天)
-    df_plot = df_stock.tail(200).copy()
-    df_plot = calculate_advanced_indicators(df_plot)
-    
-    # 🔥 修改點 2: 顯示範圍改為 130 天 (約 6 個月)
-    df_plot = df_plot.tail(130)
-    df_plot['date_str'] = df_plot['date'].dt.strftime('%Y-%m-%d')
-    
-    fig = make_subplots(
-        rows=4, cols=1, 
-        shared_xaxes=True, 
-        vertical_spacing=0.01,
-        row_heights=[0.5, 0.15, 0.15, 0.2],
-        subplot_titles=(f"{symbol} {name} - K線圖 (6個月)", "成交量", "KD", "MACD"),
-        specs=[[{"secondary_y": False}], [{}], [{}], [{}]] 
+def get_selection_mask(df, p_change_min, p_change_max, vol_ratio_min):
+    cond_a = (df['MA5'] > df['MA10']) & (df['MA10'] > df['MA20'])
+    cond_b = (df['close'] > df['MA10']) & (df['MA10'] > df['MA20'])
+    return (
+        (df['pct_change'].between(p_change_min, p_change_max)) & 
+        (df['vol_ratio'] >= vol_ratio_min) & 
+        (df['volume'] > df['prev_volume']) & 
+        (cond_a | cond_b) & 
+        (df['close'] >= df['MA10'])
     )
 
-    # 籌碼分布浮水印
+
+@st.cache_data(ttl=3600, max_entries=8, show_spinner=False)
+def cumulative_hits(p_change_min, p_change_max, vol_ratio_min, data_version):
+    """
+    全部日期一次套用選股條件，回傳 日期 × 股票 的「累計入選次數」表 (依參數組合快取)
+    任一區間的入選次數 = 區間末日累計 - 區間前一日累計，不必再對歷史切片重跑條件
+    data_version 傳 df_full 的最新日期：資料更新後換新的快取鍵，不會沿用舊表；max_entries 限制同時保留的參數組合數
+    """
+    df = load_and_process_data()
+    hit = get_selection_mask(df, p_change_min, p_change_max, vol_ratio_min)
+    table = hit.astype(np.int32).groupby([df['date'], df['symbol']]).sum().unstack(fill_value=0)
+    return table.sort_index().cumsum().astype(np.int32)
+
+
+def past_hit_counts(cum, start, end, symbols):
+    """[start, end] (日曆日，含兩端) 內各股入選次數；cum 為 cumulative_hits 的結果"""
+    dates = cum.index
+    hi = dates.searchsorted(pd.Timestamp(end), side='right') - 1
+    lo = dates.searchsorted(pd.Timestamp(start), side='left') - 1
+    counts = cum.iloc[hi] if hi >= 0 else pd.Series(0, index=cum.columns)
+    if lo >= 0 and hi >= 0: counts = counts - cum.iloc[lo]
+    return counts.reindex(symbols, fill_value=0).astype(int)
+
+# ===========================
+# 3. 圖表資料 (KD / MACD / CDP 以共用核心計算，依 股票 + 截止日 快取)
+# ===========================
+CHART_CALC_ROWS = 200   # 取更多資料以確保指標穩定
+CHART_SHOW_ROWS = 130   # 顯示範圍 (約 6 個月)
+VOL_PROFILE_BINS = 80
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def get_chart_data(symbol, as_of):
+    """單檔截至 as_of 的圖表資料 (含 KD、MACD、CDP)；切換分價量表等顯示選項不會重算"""
+    df = load_and_process_data()
+    syms = df['symbol'].to_numpy()
+    df_stock = df.iloc[syms.searchsorted(symbol, 'left'):syms.searchsorted(symbol, 'right')]
+    df_stock = df_stock[df_stock['date'] <= pd.Timestamp(as_of)].tail(CHART_CALC_ROWS)
+    return compute_kd_macd_cdp(df_stock).tail(CHART_SHOW_ROWS)
+
+def plot_stock_kline(df_plot, symbol, name, show_vol_profile=False, vol_profile_bins=VOL_PROFILE_BINS):
+    """繪製 K 線圖 (6個月範圍)；df_plot 為 get_chart_data 的結果"""
+    x = df_plot['date'].dt.strftime('%Y-%m-%d').to_numpy()
+    traces, shapes = [], []
+
+    # 籌碼分布浮水印 (獨立的 xaxis5 疊在 K 線圖上，共用價格 y 軸)
     hist_values = []
     if show_vol_profile:
-        price_bins = 80 # 增加 bin 數量讓長條圖更細緻
-        hist_values, bin_edges = np.histogram(df_plot['close'], bins=price_bins, weights=df_plot['volume'])
-        bin_mids = (bin_edges[:-1] + bin_edges[1:]) / 2
-        fig.add_trace(go.Bar(
-            x=hist_values, y=bin_mids, orientation='h', name='籌碼分布',
-            marker_color='rgba(100, 100, 100, 0.15)', hoverinfo='none', xaxis='x5'
-        ), row=1, col=1)
+        hist_values, bin_mids = compute_volume_profile(df_plot, bins=vol_profile_bins)
+        traces.append(dict(
+            type='bar', x=hist_values, y=bin_mids, orientation='h', name='籌碼分布',
+            marker_color='rgba(100, 100, 100, 0.15)', hoverinfo='none', xaxis='x5', yaxis='y'
+        ))
 
     # K線
-    fig.add_trace(go.Candlestick(
-        x=df_plot['date_str'], open=df_plot['open'], high=df_plot['high'],
-        low=df_plot['low'], close=df_plot['close'], name='K線',
-        increasing_line_color='red', decreasing_line_color='green'
-    ), row=1, col=1)
+    traces.append(kc.candlestick(x, df_plot, name='K線', increasing_line_color='red', decreasing_line_color='green'))
     
     colors_ma = {
         'MA5': '#FFA500',   # 橘
@@ -146,46 +133,43 @@ def plot_stock_kline(df_stock, symbol, name, show_vol_profile=False):
     }
     for ma in ['MA5', 'MA10', 'MA20', 'MA60']:
         if ma in df_plot.columns:
-            fig.add_trace(go.Scatter(
-                x=df_plot['date_str'], y=df_plot[ma], mode='lines', 
-                name=ma, line=dict(color=colors_ma[ma], width=1.5)
-            ), row=1, col=1)
+            traces.append(kc.line(x, df_plot[ma], name=ma, line=dict(color=colors_ma[ma], width=1.5)))
 
     # CDP
     cdp_config = {'AH': ('gray', 'dot'), 'NH': ('gray', 'dash'), 'CDP': ('yellow', 'dashdot'), 'NL': ('gray', 'dash'), 'AL': ('gray', 'dot')}
     for col, (color, dash) in cdp_config.items():
-        fig.add_trace(go.Scatter(
-            x=df_plot['date_str'], y=df_plot[col], mode='lines', name=f"CDP-{col}",
-            line=dict(color=color, width=1, dash=dash), opacity=0.6, hoverinfo='y+name'
-        ), row=1, col=1)
+        traces.append(kc.line(x, df_plot[col], name=f"CDP-{col}", line=dict(color=color, width=1, dash=dash), opacity=0.6, hoverinfo='y+name'))
 
     # 成交量
-    colors_vol = ['red' if c >= o else 'green' for c, o in zip(df_plot['close'], df_plot['open'])]
-    fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['volume'], name='成交量', marker_color=colors_vol), row=2, col=1)
+    traces.append(kc.bar(x, df_plot['volume'], row=2, name='成交量', marker_color=np.where(df_plot['close'] >= df_plot['open'], 'red', 'green')))
 
     # KD & MACD
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['K'], name='K', line=dict(color='orange', width=1)), row=3, col=1)
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['D'], name='D', line=dict(color='cyan', width=1)), row=3, col=1)
-    for y_line in [20, 80]: fig.add_shape(type="line", x0=0, x1=len(df_plot)-1, y0=y_line, y1=y_line, xref='x3', line=dict(color="gray", dash="dot", width=1), row=3, col=1)
+    traces.append(kc.line(x, df_plot['K'], row=3, name='K', line=dict(color='orange', width=1)))
+    traces.append(kc.line(x, df_plot['D'], row=3, name='D', line=dict(color='cyan', width=1)))
+    for y_line in [20, 80]: shapes.append(kc.hline(y_line, row=3, x0=x[0], x1=x[-1], color="gray", dash="dot", width=1))
 
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['DIF'], name='DIF', line=dict(color='orange', width=1)), row=4, col=1)
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['MACD'], name='MACD', line=dict(color='cyan', width=1)), row=4, col=1)
-    osc_colors = ['red' if v >= 0 else 'green' for v in df_plot['MACD_OSC']]
-    fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['MACD_OSC'], name='OSC', marker_color=osc_colors), row=4, col=1)
+    traces.append(kc.line(x, df_plot['DIF'], row=4, name='DIF', line=dict(color='orange', width=1)))
+    traces.append(kc.line(x, df_plot['MACD'], row=4, name='MACD', line=dict(color='cyan', width=1)))
+    traces.append(kc.bar(x, df_plot['MACD_OSC'], row=4, name='OSC', marker_color=np.where(df_plot['MACD_OSC'] >= 0, 'red', 'green')))
 
-    layout_update = dict(height=850, xaxis_rangeslider_visible=False, showlegend=False, margin=dict(l=20, r=20, t=30, b=20), bargap=0.05, plot_bgcolor='white', paper_bgcolor='white')
-    if show_vol_profile and len(hist_values) > 0:
-        layout_update['xaxis5'] = dict(overlaying='x', side='top', showgrid=False, visible=False, range=[0, max(hist_values) * 1.2])
-    
-    fig.update_layout(**layout_update)
-    common_axis_config = dict(type='category', showgrid=False, zeroline=False, showline=True, linecolor='black', mirror=True)
+    layout = kc.subplot_layout(
+        [0.5, 0.15, 0.15, 0.2], [f"{symbol} {name} - K線圖 (6個月)", "成交量", "KD", "MACD"], vertical_spacing=0.01, shapes=shapes,
+        height=850, showlegend=False, margin=dict(l=20, r=20, t=30, b=20), bargap=0.05, plot_bgcolor='white', paper_bgcolor='white'
+    )
+    common_axis_config = dict(type='category', showgrid=False, zeroline=False, showline=True, linecolor='black', mirror=True, rangeslider=dict(visible=False))
     common_yaxis_config = dict(showgrid=False, zeroline=False, showline=True, linecolor='black', mirror=True, autorange=True)
-    
-    for r in [1, 2, 3]: fig.update_xaxes(**common_axis_config, row=r, col=1)
-    fig.update_xaxes(dtick=10, **common_axis_config, row=4, col=1) # 🔥 dtick 改為 10，因為日期變多了
-    fig.update_yaxes(**common_yaxis_config)
+    kc.update_axes(layout, 'x', **common_axis_config)
+    kc.update_axes(layout, 'y', **common_yaxis_config)
+    layout['xaxis4']['dtick'] = 10 # 🔥 dtick 改為 10，因為日期變多了
+    if show_vol_profile and len(hist_values) > 0:
+        layout['xaxis5'] = dict(overlaying='x', side='top', showgrid=False, visible=False, range=[0, max(hist_values) * 1.2])
 
-    return fig
+    return kc.build_figure(traces, layout)
+
+# 🚀 圖表快取：以 (股票, 截止日, 分價量表設定) 為 key
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+def get_kline_figure(symbol, last_date, name, show_vol_profile, vol_profile_bins, _df_plot):
+    return plot_stock_kline(_df_plot, symbol, name, show_vol_profile, vol_profile_bins)
 
 # ===========================
 # 4. Streamlit 主程式
@@ -214,6 +198,7 @@ st.sidebar.header("📅 日期與參數")
 selected_date = st.sidebar.selectbox("回測日期", available_dates, 0)
 st.sidebar.markdown("---")
 show_vol_profile = st.sidebar.checkbox("顯示分價量表 (Volume Profile)", value=False)
+vol_profile_bins = st.sidebar.slider("分價量表價位數", 20, 200, VOL_PROFILE_BINS, 10) if show_vol_profile else VOL_PROFILE_BINS
 st.sidebar.markdown("---")
 st.sidebar.header("🔢 排序方式")
 sort_option = st.sidebar.selectbox("請選擇清單排序", ["漲跌幅 (高→低)", "近月熱度 (高→低)", "量比 (高→低)", "股票代號 (小→大)"])
@@ -235,18 +220,7 @@ df_day = df_full[df_full['date'] == target_date_ts].copy()
 if selected_industries:
     df_day = df_day[df_day['industry'].isin(selected_industries)]
 
-def get_selection_mask(df):
-    cond_a = (df['MA5'] > df['MA10']) & (df['MA10'] > df['MA20'])
-    cond_b = (df['close'] > df['MA10']) & (df['MA10'] > df['MA20'])
-    return (
-        (df['pct_change'].between(p_change_min, p_change_max)) & 
-        (df['vol_ratio'] >= vol_ratio_min) & 
-        (df['volume'] > df['prev_volume']) & 
-        (cond_a | cond_b) & 
-        (df['close'] >= df['MA10'])
-    )
-
-mask_today = get_selection_mask(df_day)
+mask_today = get_selection_mask(df_day, p_change_min, p_change_max, vol_ratio_min)
 results = df_day[mask_today].copy()
 
 if results.empty:
@@ -255,10 +229,8 @@ else:
     with st.spinner("計算排序與熱度..."):
         start_date_hist = target_date_ts - timedelta(days=45)
         end_date_hist = target_date_ts - timedelta(days=1)
-        df_hist = df_full[(df_full['date'] >= start_date_hist) & (df_full['date'] <= end_date_hist)].copy()
-        mask_hist = get_selection_mask(df_hist)
-        df_hist_hits = df_hist[mask_hist]
-        hit_counts = df_hist_hits[df_hist_hits['symbol'].isin(results['symbol'])].groupby('symbol').size()
+        cum = cumulative_hits(p_change_min, p_change_max, vol_ratio_min, df_full['date'].max())
+        hit_counts = past_hit_counts(cum, start_date_hist, end_date_hist, results['symbol'].unique())
         results['past_hits'] = results['symbol'].map(hit_counts).fillna(0).astype(int)
 
         if sort_option == "漲跌幅 (高→低)":
@@ -332,11 +304,10 @@ else:
             unsafe_allow_html=True
         )
 
-    df_chart_source = df_full[df_full['symbol'] == current_symbol].sort_values('date')
-    df_chart_source = df_chart_source[df_chart_source['date'] <= target_date_ts]
+    df_chart = get_chart_data(current_symbol, target_date_ts)
     
-    if len(df_chart_source) < 30:
+    if len(df_chart) < 30:
         st.error("歷史資料不足，無法繪製完整圖表。")
     else:
-        fig = plot_stock_kline(df_chart_source, current_symbol, current_info['name'], show_vol_profile)
+        fig = get_kline_figure(current_symbol, df_chart['date'].iloc[-1], current_info['name'], show_vol_profile, vol_profile_bins, df_chart)
         st.plotly_chart(fig, use_container_width=True)
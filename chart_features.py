@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from ta_kernels import cdp_levels, consecutive_true_count, ema, kd_from_rsv, prior_window_extreme, rsv_from_hlc, volume_profile
+
+# ===========================
+# K 線圖表特徵 (全向量化，供各 App 的 plot_stock_kline 共用)
+# ===========================
+
+def compute_three_day_signals(df):
+    """
+    三日高低點突破/跌破訊號、給分、連續三角形與關鍵 K 棒 (撐壓線) 位置
+    邏輯與原本逐筆迴圈相同：收盤 > 前三日最高 → +1；收盤 < 前三日最低 → -1
+    """
+    highs = df['high'].to_numpy(dtype=float)
+    lows = df['low'].to_numpy(dtype=float)
+    closes = df['close'].to_numpy(dtype=float)
+    opens = df['open'].to_numpy(dtype=float)
+    dates_str = df['date'].dt.strftime('%Y-%m-%d').to_numpy()
+
+    h3, h3_idx, _, _ = prior_window_extreme(highs, 3)
+    _, _, l3, l3_idx = prior_window_extreme(lows, 3)
+
+    p_c, p_h, p_l = np.r_[np.nan, closes[:-1]], np.r_[np.nan, highs[:-1]], np.r_[np.nan, lows[:-1]]
+
+    with np.errstate(invalid='ignore'):
+        is_up = closes > h3
+        is_down = ~is_up & (closes < l3)
+        is_limit_up = closes >= p_c * 1.095
+        is_limit_down = closes <= p_c * 0.905
+        is_gap_up, is_gap_down = lows > p_h, highs < p_l
+
+    signal_3d = np.where(is_up, 1.0, np.where(is_down, -1.0, 0.0))
+    score_up = np.select([is_limit_up, is_gap_up, closes > opens], ["+2", "+1.5", "+1"], "+0.5")
+    score_dn = np.select([is_limit_down, is_gap_down, closes < opens], ["-2", "-1.5", "-1"], "-0.5")
+    score_3d = np.where(is_up, score_up, np.where(is_down, score_dn, "")).astype(object)
+
+    # 連續突破/跌破第二天起標三角形
+    triangle_3d = np.where(consecutive_true_count(is_up) >= 2, 1.0, 0.0)
+    triangle_3d = np.where(consecutive_true_count(is_down) >= 2, -1.0, triangle_3d)
+
+    k_idx = np.where(is_up, h3_idx, np.where(is_down, l3_idx, -1))
+    has_key = k_idx >= 0
+    safe_idx = np.where(has_key, k_idx, 0)
+    key_high_3d = np.where(has_key, highs[safe_idx], np.nan)
+    key_low_3d = np.where(has_key, lows[safe_idx], np.nan)
+    key_date_3d = np.where(has_key, dates_str[safe_idx], "").astype(object)
+
+    df['signal_3d'] = signal_3d
+    df['score_3d'] = score_3d
+    df['triangle_3d'] = triangle_3d
+    df['key_high_3d'] = key_high_3d
+    df['key_low_3d'] = key_low_3d
+    df['key_date_3d'] = key_date_3d
+    return df
+
+
+def compute_kline_features(df_stock):
+    """
+    計算 K 線圖所需的全部欄位 (MA3/MA120、3 倍布林、均量、RSI(14)、MACD Signal、三日高低點)
+    df_stock 須為單一股票並依日期排序
+    """
+    df_calc = df_stock.reset_index(drop=True).copy()
+    close = df_calc['close']
+
+    df_calc['MA3'] = close.rolling(window=3).mean()
+    df_calc['MA120'] = close.rolling(window=120).mean()
+    df_calc['std20'] = close.rolling(window=20).std()
+    df_calc['BB_up'] = df_calc['MA20'] + 3 * df_calc['std20']
+    df_calc['BB_low'] = df_calc['MA20'] - 3 * df_calc['std20']
+    df_calc['prev_MA20'] = df_calc['MA20'].shift(1)
+    df_calc['prev_MA60'] = df_calc['MA60'].shift(1)
+
+    # 計算昨日收盤價 (供漲跌停判斷使用)
+    df_calc['prev_close_ud'] = close.shift(1).fillna(df_calc['open'])
+
+    df_calc['Vol_MA5'] = df_calc['volume'].rolling(window=5).mean()
+    df_calc['Vol_MA10'] = df_calc['volume'].rolling(window=10).mean()
+
+    df_calc['MACD_Signal'] = df_calc['DIF'] - df_calc['MACD_OSC']
+
+    delta = close.diff()
+    gain = delta.where(delta > 0, 0).ewm(alpha=1/14, adjust=False).mean()
+    loss = (-delta.where(delta < 0, 0)).ewm(alpha=1/14, adjust=False).mean()
+    rs = gain / loss.replace(0, np.nan)
+    df_calc['RSI'] = (100 - (100 / (1 + rs))).fillna(50)
+
+    return compute_three_day_signals(df_calc)
+
+
+def compute_kd_macd_cdp(df_stock):
+    """
+    KD(9,3,3)、MACD(12,26,9) 與 CDP 五線 (bestbuy_app 圖表用)
+    df_stock 須為單一股票並依日期排序；EMA / KD 起點為第一列，所以呼叫端要固定取同樣長度的區間
+    """
+    df = df_stock.reset_index(drop=True).copy()
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    close = df['close'].to_numpy(dtype=float)
+
+    df['RSV'] = rsv_from_hlc(high, low, close, 9)
+    df['K'], df['D'] = kd_from_rsv(df['RSV'])
+
+    df['DIF'] = ema(close, 12) - ema(close, 26)
+    df['MACD'] = ema(df['DIF'], 9)
+    df['MACD_OSC'] = df['DIF'] - df['MACD']
+
+    df['AH'], df['NH'], df['CDP'], df['NL'], df['AL'] = cdp_levels(high, low, close)
+    return df
+
+
+def compute_volume_profile(df, bins=80, start=None, end=None):
+    """df (date / close / volume) 在 [start, end] 區間的分價量表，回傳 (各價位量, 價位中點)"""
+    if start is not None: df = df[df['date'] >= pd.Timestamp(start)]
+    if end is not None: df = df[df['date'] <= pd.Timestamp(end)]
+    return volume_profile(df['close'], df['volume'], bins)
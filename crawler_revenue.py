@@ -2,11 +2,13 @@ import os
 import requests
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime
 import time
 
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
 # ===========================
 # 1. 全域配置與連線
 # ===========================
@@ -14,7 +16,7 @@ SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
 if not SUPABASE_DB_URL:
     raise RuntimeError("❌ 請設定環境變數 SUPABASE_DB_URL")
 
-engine = create_engine(SUPABASE_DB_URL, pool_pre_ping=True)
+engine = get_engine(SUPABASE_DB_URL, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -5,9 +5,11 @@ import sqlalchemy
 import time
 import random
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import insert
 
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
 # ===========================
 # 1. 配置與連線
 # ===========================
@@ -16,7 +18,7 @@ SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
 if not SUPABASE_DB_URL:
     raise RuntimeError("❌ 請設定環境變數 SUPABASE_DB_URL")
 
-engine = create_engine(SUPABASE_DB_URL)
+engine = get_engine(SUPABASE_DB_URL, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
 # ===========================
 # 2. 通用工具函式
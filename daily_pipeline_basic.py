@@ -9,9 +9,11 @@ import random
 import concurrent.futures
 from io import StringIO
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import insert
 
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
 # ===========================
 # 1. 全域配置與連線
 # ===========================
@@ -20,8 +22,8 @@ SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
 if not SUPABASE_DB_URL:
     raise RuntimeError("❌ 請設定環境變數 SUPABASE_DB_URL")
 
-# 加上 pool_pre_ping 防止連線中斷
-engine = create_engine(SUPABASE_DB_URL, pool_pre_ping=True)
+# 共用連線池 (已內建 pool_pre_ping 防止連線中斷)
+engine = get_engine(SUPABASE_DB_URL, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
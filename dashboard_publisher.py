@@ -0,0 +1,140 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+try:
+    import brotli  # 選用：有安裝才輸出 .br
+except ImportError:
+    brotli = None
+
+# ===========================
+# 靜態報表發佈 (tw_stock_dashboard / us_stock_dashboard 共用)
+# - 共用 CSS / JS 抽成內容雜湊檔名的 assets/，每天的頁面只留 <link> / <script src>
+# - 內容與現有檔案相同時不重寫 (current 頁、重跑同一天都不會產生 git 變更)
+# - 預先壓縮的 .gz / .br 只在 DASHBOARD_PRECOMPRESS=1 時輸出 (給支援 precompressed 的伺服器 / CDN 的部署產物用)；
+#   GitHub Pages 不會使用這些檔案，commit 進 repo 只會讓 repo 變大，所以預設關閉 (.gitignore 也已排除)
+# ===========================
+ASSET_DIR = "assets"
+HASH_LEN = 12
+MIN_COMPRESS_BYTES = 1024  # 太小的檔案壓縮沒有意義
+PRECOMPRESS = os.environ.get("DASHBOARD_PRECOMPRESS", "0") == "1"
+
+_STYLE_RE = re.compile(r"<style>(.*?)</style>", re.S)
+_SHARED_SCRIPT_RE = re.compile(r"<script data-shared>(.*?)</script>", re.S)
+
+_stats = {'written': 0, 'skipped': 0, 'bytes': 0}
+
+
+def content_hash(data):
+    return hashlib.sha256(_encode(data)).hexdigest()[:HASH_LEN]
+
+
+def _encode(content):
+    return content.encode("utf-8") if isinstance(content, str) else content
+
+
+def _file_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return content_hash(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def _write_variants(path, data):
+    if len(data) < MIN_COMPRESS_BYTES: return
+    # mtime=0：相同內容永遠產生相同的 .gz，不會因為重跑而出現 diff
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+
+def write_if_changed(path, content, precompress=None):
+    """內容雜湊與現有檔案相同就略過；否則以暫存檔 + os.replace 寫入 (precompress 時一併產生壓縮版本)。回傳是否有寫入"""
+    precompress = PRECOMPRESS if precompress is None else precompress
+    data = _encode(content)
+    if _file_hash(path) == content_hash(data):
+        if precompress and len(data) >= MIN_COMPRESS_BYTES and not os.path.exists(path + ".gz"):
+            _write_variants(path, data)
+        _stats['skipped'] += 1
+        return False
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    if precompress:
+        _write_variants(path, data)
+    _stats['written'] += 1
+    _stats['bytes'] += len(data)
+    return True
+
+
+def publish_asset(base_dir, name, content, ext):
+    """寫入 assets/{name}.{hash}.{ext} (檔名含雜湊，內容不可變，存在就不再寫)；回傳相對 base_dir 的路徑"""
+    rel_path = posixpath.join(ASSET_DIR, f"{name}.{content_hash(content)}.{ext}")
+    path = os.path.join(base_dir, rel_path)
+    if os.path.exists(path):
+        _stats['skipped'] += 1
+    else:
+        write_if_changed(path, content)
+    return rel_path
+
+
+def relative_href(target_rel, page_rel):
+    # 由頁面所在目錄指向 target (皆為相對 base_dir 的路徑)
+    return posixpath.relpath(target_rel, posixpath.dirname(page_rel) or ".")
+
+
+def externalize_assets(html, base_dir, page_rel, name):
+    """
+    把頁面內的 <style> (無屬性) 與 <script data-shared> 抽成雜湊 asset，換成外部引用
+    pandas Styler 產生的 <style type="text/css"> 為各表格專屬，保留在頁面內
+    """
+    def _css(m):
+        href = relative_href(publish_asset(base_dir, name, _compact_block(m.group(1)), "css"), page_rel)
+        return f'<link rel="stylesheet" href="{href}">'
+
+    def _js(m):
+        src = relative_href(publish_asset(base_dir, name, _compact_block(m.group(1)), "js"), page_rel)
+        return f'<script src="{src}"></script>'
+
+    return _SHARED_SCRIPT_RE.sub(_js, _STYLE_RE.sub(_css, html))
+
+
+def _compact_block(text):
+    # 去掉縮排與空行：同一份樣式不會因為 f-string 內的縮排不同而產生不同雜湊
+    return "\n".join(line.strip() for line in text.strip().splitlines() if line.strip()) + "\n"
+
+
+def publish_html(base_dir, page_rel, html, asset_name):
+    html = externalize_assets(html, base_dir, page_rel, asset_name)
+    return write_if_changed(os.path.join(base_dir, page_rel), html)
+
+
+def publish_json(base_dir, rel_path, obj):
+    # 精簡 JSON：不跳脫中文、不留空白；NaN 不是合法 JSON，必須先轉成 None
+    data = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+    return write_if_changed(os.path.join(base_dir, rel_path), data)
+
+
+def publish_redirect(base_dir, page_rel, target_rel, message="正在載入今日最新報表..."):
+    href = relative_href(target_rel, page_rel)
+    html = (
+        '<!DOCTYPE html><html><head><meta charset="UTF-8">'
+        f'<meta http-equiv="refresh" content="0; url={href}" /><title>Redirecting.</title></head>'
+        f'<body><p>{message} <a href="{href}">點擊這裡</a></p></body></html>'
+    )
+    return write_if_changed(os.path.join(base_dir, page_rel), html, precompress=False)
+
+
+def print_publish_stats():
+    s = _stats
+    print(f"📦 [發佈] 寫入 {s['written']} 檔 ({s['bytes'] / 1024:,.0f} KB)，內容未變略過 {s['skipped']} 檔"
+          + ("" if not PRECOMPRESS or brotli is not None else " (未安裝 brotli，只輸出 .gz)"))
@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import event, text
+
+# ===========================
+# 共用資料庫引擎 (所有 App 與排程共用同一個工廠)
+# - 有上限的連線池 + pool_pre_ping，避免每次查詢重新 TLS 握手、也避免連線數爆滿
+# - statement_timeout / connect_timeout 統一設定 (直連用 startup options，交易模式 pooler 改成每個交易 SET LOCAL)；預設 60 秒給 Streamlit App，排程批次改傳 BATCH_STATEMENT_TIMEOUT_MS (預設 0 = 不限)
+# - 連到 pgbouncer / Supavisor 交易模式 (port 6543) 時自動停用 server-side prepared statement
+# - 每筆 SQL 的耗時與筆數可透過 hook 取得
+# ===========================
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 60000))
+BATCH_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_BATCH_STATEMENT_TIMEOUT_MS", 0))  # ETL 長語句不設上限
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 30))
+DB_SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", 0))  # >0 時印出慢查詢
+DB_POOL_RECYCLE = 1800           # 秒；低於 Supabase pooler 的閒置斷線時間
+PGBOUNCER_TRANSACTION_PORT = 6543
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+_query_hooks = []
+_query_stats = defaultdict(lambda: {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0})
+_stats_lock = threading.Lock()
+
+
+def get_db_url():
+    return os.environ.get("SUPABASE_DB_URL")
+
+
+def is_transaction_pooler(url):
+    """交易模式的連線池 (pgbouncer / Supavisor 6543) 不保留 session 狀態，不能用 PREPARE"""
+    url = sqlalchemy.engine.make_url(url)
+    return url.port == PGBOUNCER_TRANSACTION_PORT or url.query.get('pgbouncer') == 'true'
+
+
+def get_engine(db_url=None, pool_size=None, max_overflow=None, statement_timeout_ms=None, connect_timeout=None):
+    """
+    取得共用引擎 (同一組連線參數在同一個 process 只建立一次)
+    db_url 省略時讀取環境變數 SUPABASE_DB_URL
+    """
+    db_url = db_url or get_db_url()
+    if not db_url:
+        raise RuntimeError("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
+
+    pool_size = DB_POOL_SIZE if pool_size is None else pool_size
+    max_overflow = DB_MAX_OVERFLOW if max_overflow is None else max_overflow
+    statement_timeout_ms = DB_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+    connect_timeout = DB_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+
+    key = (db_url, pool_size, max_overflow, statement_timeout_ms, connect_timeout)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            kwargs = dict(pool_pre_ping=True)
+            postgres = db_url.startswith("postgres")
+            # 交易模式 pooler 不接受 startup 參數 options，也不會把 session 設定留在共用的 server 連線上 → 改在每個交易開頭 SET LOCAL
+            per_transaction = postgres and is_transaction_pooler(db_url) and statement_timeout_ms > 0
+            if postgres:
+                connect_args = {'connect_timeout': connect_timeout}
+                if not is_transaction_pooler(db_url):
+                    connect_args['options'] = f'-c statement_timeout={statement_timeout_ms}'
+                kwargs.update(
+                    pool_size=pool_size, max_overflow=max_overflow, pool_recycle=DB_POOL_RECYCLE, pool_timeout=30,
+                    connect_args=connect_args,
+                )
+            engine = sqlalchemy.create_engine(db_url, **kwargs)
+            if per_transaction:
+                _set_local_timeout(engine, statement_timeout_ms)
+            _instrument(engine)
+            _engines[key] = engine
+    return engine
+
+
+def _set_local_timeout(engine, statement_timeout_ms):
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}")
+
+
+def dispose_engines():
+    # 排程結束或 fork 子行程前呼叫，釋放所有連線
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+# ===========================
+# 查詢耗時 / 筆數監控
+# ===========================
+def add_query_hook(fn):
+    """註冊 hook：fn(statement, elapsed_ms, rowcount)，每筆 SQL 執行完呼叫一次"""
+    _query_hooks.append(fn)
+    return fn
+
+
+def remove_query_hook(fn):
+    if fn in _query_hooks:
+        _query_hooks.remove(fn)
+
+
+def _print_slow_query(statement, elapsed_ms, rowcount):
+    if elapsed_ms >= DB_SLOW_QUERY_MS:
+        print(f"🐢 慢查詢 {elapsed_ms:.0f} ms / {rowcount} 筆: {_statement_key(statement)}")
+
+
+if DB_SLOW_QUERY_MS > 0:
+    add_query_hook(_print_slow_query)
+
+
+def query_stats(top=20):
+    """依累計耗時排序的 SQL 統計 (calls / total_ms / avg_ms / max_ms / rows)"""
+    with _stats_lock:
+        rows = [{'statement': stmt, **s, 'avg_ms': s['total_ms'] / s['calls']} for stmt, s in _query_stats.items()]
+    return pd.DataFrame(rows).sort_values('total_ms', ascending=False).head(top) if rows else pd.DataFrame()
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _query_stats.clear()
+
+
+def _statement_key(statement):
+    return re.sub(r"\s+", " ", statement).strip()[:160]
+
+
+def _instrument(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+        rowcount = cursor.rowcount if cursor.rowcount is not None else -1
+        key = _statement_key(statement)
+        with _stats_lock:
+            s = _query_stats[key]
+            s['calls'] += 1
+            s['total_ms'] += elapsed_ms
+            s['max_ms'] = max(s['max_ms'], elapsed_ms)
+            s['rows'] += max(rowcount, 0)
+        for hook in list(_query_hooks):
+            hook(statement, elapsed_ms, rowcount)
+
+
+# ===========================
+# Server-side prepared statements (熱門查詢用)
+# SQL 以 $1, $2 ... 作為參數位置；不支援時 (交易模式 pooler / 非 PostgreSQL) 自動改用一般查詢
+# ===========================
+def execute_prepared(conn, name, sql, params=()):
+    params = tuple(params)
+    if conn.dialect.name != "postgresql" or is_transaction_pooler(conn.engine.url):
+        bind_sql = re.sub(r"\$(\d+)", r":p\1", sql)
+        return conn.execute(text(bind_sql), {f"p{i}": v for i, v in enumerate(params, 1)})
+
+    # 每條實體連線各自記錄已 PREPARE 過的語句 (跟著 DBAPI 連線回到 pool，重連後自動重建)
+    prepared = conn.connection.info.setdefault('prepared_statements', set())
+    if name not in prepared:
+        conn.exec_driver_sql(f"PREPARE {name} AS {sql}")
+        prepared.add(name)
+    if not params:
+        return conn.exec_driver_sql(f"EXECUTE {name}")
+    return conn.exec_driver_sql(f"EXECUTE {name}({', '.join(['%s'] * len(params))})", params)
+
+
+def read_prepared(conn, name, sql, params=()):
+    result = execute_prepared(conn, name, sql, params)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
-import sqlalchemy
 from sqlalchemy import text
 import os
 import bcrypt
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import uuid
 import numpy as np
 
+import kline_chart as kc
+from db_engine import get_engine
+
 # ===========================
 # 1. 資料庫連線與全域設定
 # ===========================
@@ -19,11 +19,7 @@ if not SUPABASE_DB_URL:
     st.error("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
     st.stop()
 
-@st.cache_resource
-def get_engine():
-    return sqlalchemy.create_engine(SUPABASE_DB_URL)
-
-engine = get_engine()
+engine = get_engine(SUPABASE_DB_URL)
 
 # ===========================
 # 2. 身份驗證與註冊模組
@@ -117,41 +113,55 @@ def load_data():
             df['volume_sheets'] = df['volume'] / 1000
         else:
             df['volume_sheets'] = df['volume']
+
+        df = add_scan_features(df)
             
     return df
 
-# ===========================
-# 4. 核心策略：動態條件驗證
-# ===========================
-def run_strategy_scan(df_full, target_date, min_volume, vol_multiplier, use_cond1, use_cond2_vol, use_cond3_ma, use_cond4, use_cond5, use_cond6_bb):
-    df = df_full[df_full['date'] <= pd.to_datetime(target_date)].copy()
-    if df.empty: return pd.DataFrame()
-    
-    # === 基礎前置運算 ===
-    df['prev_high'] = df.groupby('symbol')['high'].shift(1)
+
+def _grouped_rolling(df, col, window, how, min_periods):
+    r = df.groupby('symbol', sort=False)[col].rolling(window=window, min_periods=min_periods)
+    return getattr(r, how)().reset_index(level=0, drop=True)
+
+
+def add_scan_features(df):
+    """
+    與掃描參數無關的特徵，每次資料更新只算一次 (隨 load_data 一起快取)
+    全部只往回看 (shift / rolling)，所以在任一掃描日取橫切面，結果和「先截到該日再計算」相同
+    """
+    g = df.groupby('symbol', sort=False)
+    df['prev_high'] = g['high'].shift(1)
     
     # 計算昨日量與量增比 (確保計算過程有正確的 NaN 處理)
-    df['prev_volume_sheets'] = df.groupby('symbol')['volume_sheets'].shift(1)
+    df['prev_volume_sheets'] = g['volume_sheets'].shift(1)
     df['量增比'] = df['volume_sheets'] / df['prev_volume_sheets'].replace(0, np.nan)
     
     for ma in [5, 10, 20, 60]:
-        df[f'prev_MA{ma}'] = df.groupby('symbol')[f'MA{ma}'].shift(1)
+        df[f'prev_MA{ma}'] = g[f'MA{ma}'].shift(1)
     
-    df['Low_120'] = df.groupby('symbol')['low'].transform(lambda x: x.rolling(window=120, min_periods=60).min())
+    df['Low_120'] = _grouped_rolling(df, 'low', 120, 'min', 60)
     
-    df['Vol_20MA'] = df.groupby('symbol')['volume_sheets'].transform(lambda x: x.rolling(window=20, min_periods=10).mean())
-    df['is_vol_break'] = df['volume_sheets'] >= (df['Vol_20MA'] * vol_multiplier)
-    df['vol_break_20d'] = df.groupby('symbol')['is_vol_break'].transform(lambda x: x.rolling(window=20, min_periods=1).max())
+    # 底部放量：「近 20 日曾有 量 >= 20MA均量 × 倍數」等同「近 20 日 量/20MA均量 的最大值 >= 倍數」
+    # 倍數是側欄參數，這裡只存比值的 20 日最大值，掃描時再和倍數比較 (均量為 0 時任何量都算放量)
+    df['Vol_20MA'] = _grouped_rolling(df, 'volume_sheets', 20, 'mean', 10)
+    df['vol_ratio_20ma'] = np.where(df['Vol_20MA'] == 0, np.inf, df['volume_sheets'] / df['Vol_20MA'])
+    df['vol_ratio_max_20d'] = _grouped_rolling(df, 'vol_ratio_20ma', 20, 'max', 1)
     
-    df['is_below_20ma'] = df['low'] <= df['MA20']
-    df['below_20ma_3d'] = df.groupby('symbol')['is_below_20ma'].transform(lambda x: x.rolling(window=3, min_periods=1).max())
+    df['is_below_20ma'] = (df['low'] <= df['MA20']).astype(float)
+    df['below_20ma_3d'] = _grouped_rolling(df, 'is_below_20ma', 3, 'max', 1)
     
-    df['bb_std'] = df.groupby('symbol')['close'].transform(lambda x: x.rolling(window=20, min_periods=2).std())
+    df['bb_std'] = _grouped_rolling(df, 'close', 20, 'std', 2)
     df['BB_Upper_3x'] = df['MA20'] + 3 * df['bb_std']
-    df['is_bb_hit'] = df['high'] >= df['BB_Upper_3x']
-    df['bb_hit_20d'] = df.groupby('symbol')['is_bb_hit'].transform(lambda x: x.rolling(window=20, min_periods=1).max())
+    df['is_bb_hit'] = (df['high'] >= df['BB_Upper_3x']).astype(float)
+    df['bb_hit_20d'] = _grouped_rolling(df, 'is_bb_hit', 20, 'max', 1)
+    return df
 
-    today_df = df[df['date'] == pd.to_datetime(target_date)].copy()
+# ===========================
+# 4. 核心策略：動態條件驗證
+# ===========================
+def run_strategy_scan(df_full, target_date, min_volume, vol_multiplier, use_cond1, use_cond2_vol, use_cond3_ma, use_cond4, use_cond5, use_cond6_bb):
+    # 特徵已在 load_data 算好，這裡只取掃描日的橫切面套用參數
+    today_df = df_full[df_full['date'] == pd.to_datetime(target_date)].copy()
     if today_df.empty: return pd.DataFrame()
 
     # === 動態套用條件 ===
@@ -162,7 +172,7 @@ def run_strategy_scan(df_full, target_date, min_volume, vol_multiplier, use_cond
         mask &= (today_df['close'] <= (today_df['Low_120'] * 1.3))
     
     if use_cond2_vol:
-        mask &= (today_df['vol_break_20d'] == 1)
+        mask &= (today_df['vol_ratio_max_20d'] >= vol_multiplier)
 
     if use_cond3_ma:
         mask &= (
@@ -196,58 +206,43 @@ def run_strategy_scan(df_full, target_date, min_volume, vol_multiplier, use_cond
 # 5. K 線繪圖輔助
 # ===========================
 def plot_stock_kline(df_stock, symbol, name):
-    df_calc = df_stock.copy()
+    df_calc = df_stock.tail(150)
     bb_std = df_calc['close'].rolling(window=20).std()
-    df_calc['BB_Upper'] = df_calc['MA20'] + 3 * bb_std
-    df_calc['BB_Lower'] = df_calc['MA20'] - 3 * bb_std
-
-    df_plot = df_calc.tail(130).copy()
-    df_plot['date_str'] = df_plot['date'].dt.strftime('%Y-%m-%d')
-
-    df_plot['prev_volume'] = df_plot['volume_sheets'].shift(1)
-    df_plot['vol_ratio'] = df_plot['volume_sheets'] / (df_plot['volume_sheets'].rolling(5).mean() + 1e-9)
-
-    fig = make_subplots(rows=5, cols=1, shared_xaxes=True, vertical_spacing=0.01,
-                        row_heights=[0.45, 0.1, 0.1, 0.1, 0.15],
-                        subplot_titles=(f"{symbol} {name}", "量(張)", "KD", "MACD", "訊號"))
-
-    fig.add_trace(go.Scatter(
-        x=df_plot['date_str'], y=df_plot['BB_Upper'], 
-        mode='lines', name='BB Upper (3)', 
-        line=dict(color='rgba(169, 169, 169, 0.5)', width=1, dash='dot'),
-        hoverinfo='skip'
-    ), row=1, col=1)
-
-    fig.add_trace(go.Scatter(
-        x=df_plot['date_str'], y=df_plot['BB_Lower'], 
-        mode='lines', name='BB Lower (3)', 
-        line=dict(color='rgba(169, 169, 169, 0.5)', width=1, dash='dot'),
-        fill='tonexty', fillcolor='rgba(169, 169, 169, 0.08)',
-        hoverinfo='skip'
-    ), row=1, col=1)
-
-    fig.add_trace(go.Candlestick(
-        x=df_plot['date_str'], open=df_plot['open'], high=df_plot['high'], low=df_plot['low'], close=df_plot['close'],
-        name='K線', increasing_line_color='red', decreasing_line_color='green'
-    ), row=1, col=1)
+
+    df_plot = df_calc.tail(130)
+    x = df_plot['date'].dt.strftime('%Y-%m-%d').to_numpy()
+    bb_std = bb_std.tail(130)
+
+    traces = [
+        kc.line(x, df_plot['MA20'] + 3 * bb_std, name='BB Upper (3)', line=dict(color='rgba(169, 169, 169, 0.5)', width=1, dash='dot'), hoverinfo='skip'),
+        kc.line(x, df_plot['MA20'] - 3 * bb_std, name='BB Lower (3)', line=dict(color='rgba(169, 169, 169, 0.5)', width=1, dash='dot'),
+                fill='tonexty', fillcolor='rgba(169, 169, 169, 0.08)', hoverinfo='skip'),
+        kc.candlestick(x, df_plot, name='K線', increasing_line_color='red', decreasing_line_color='green'),
+    ]
 
     for ma, color in zip(['MA5','MA10','MA20','MA60'], ['#FFA500','#00FFFF','#BA55D3','#4169E1']):
-        if ma in df_plot: 
-            fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot[ma], mode='lines', name=ma, line=dict(color=color, width=1)), row=1, col=1)
+        if ma in df_plot:
+            traces.append(kc.line(x, df_plot[ma], name=ma, line=dict(color=color, width=1)))
+
+    traces.append(kc.bar(x, df_plot['volume_sheets'], row=2, marker_color=np.where(df_plot['close'] >= df_plot['open'], 'red', 'green'), name='量(張)'))
 
-    colors_vol = ['red' if c>=o else 'green' for c,o in zip(df_plot['close'], df_plot['open'])]
-    fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['volume_sheets'], marker_color=colors_vol, name='量(張)'), row=2, col=1)
+    traces.append(kc.line(x, df_plot['K'], row=3, name='K', line=dict(color='orange')))
+    traces.append(kc.line(x, df_plot['D'], row=3, name='D', line=dict(color='cyan')))
 
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['K'], name='K', line=dict(color='orange')), row=3, col=1)
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['D'], name='D', line=dict(color='cyan')), row=3, col=1)
+    traces.append(kc.bar(x, df_plot['MACD_OSC'], row=4, marker_color=np.where(df_plot['MACD_OSC'] >= 0, 'red', 'green'), name='OSC'))
+    traces.append(kc.line(x, df_plot['DIF'], row=4, name='DIF', line=dict(color='orange')))
 
-    osc_colors = ['red' if v>=0 else 'green' for v in df_plot['MACD_OSC']]
-    fig.add_trace(go.Bar(x=df_plot['date_str'], y=df_plot['MACD_OSC'], marker_color=osc_colors, name='OSC'), row=4, col=1)
-    fig.add_trace(go.Scatter(x=df_plot['date_str'], y=df_plot['DIF'], name='DIF', line=dict(color='orange')), row=4, col=1)
+    layout = kc.subplot_layout(
+        [0.45, 0.1, 0.1, 0.1, 0.15], [f"{symbol} {name}", "量(張)", "KD", "MACD", "訊號"], vertical_spacing=0.01,
+        height=800, showlegend=False, margin=dict(t=30,l=10,r=10,b=10)
+    )
+    kc.update_axes(layout, 'x', type='category', categoryorder='category ascending', tickmode='auto', nticks=15, rangeslider=dict(visible=False))
+    return kc.build_figure(traces, layout)
 
-    fig.update_xaxes(type='category', categoryorder='category ascending', tickmode='auto', nticks=15)
-    fig.update_layout(height=800, xaxis_rangeslider_visible=False, showlegend=False, margin=dict(t=30,l=10,r=10,b=10))
-    return fig
+# 🚀 圖表快取：同一檔股票、同一截止日只組一次 figure
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+def get_kline_figure(symbol, last_date, name, _df_stock):
+    return plot_stock_kline(_df_stock, symbol, name)
 
 # --- 資料表顏色與格式渲染器 ---
 def color_ma_trend(val):
@@ -475,7 +470,7 @@ def main_app():
             if len(chart_src) < 30: 
                 st.warning("資料不足無法繪製完整圖表")
             else:
-                fig = plot_stock_kline(chart_src, cur_sym, cur_info['name'])
+                fig = get_kline_figure(cur_sym, chart_src['date'].iloc[-1], cur_info['name'], chart_src)
                 st.plotly_chart(fig, use_container_width=True, key=f"chart_{cur_sym}_{uuid.uuid4()}")
 
     else:
@@ -1,12 +1,13 @@
 import pandas as pd
-import sqlalchemy
 from sqlalchemy import text
 import os
 import numpy as np
 
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
 # 1. 資料庫連線
 SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
-engine = sqlalchemy.create_engine(SUPABASE_DB_URL)
+engine = get_engine(SUPABASE_DB_URL, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
 # ===========================
 # 2. 擷取資料 (Extract) - 優化版
@@ -0,0 +1,118 @@
+import os
+from datetime import timedelta
+
+from sqlalchemy import text
+
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
+# ===========================
+# 週 K / 月 K 增量建置 (stock_prices → stock_weekly_k / stock_monthly_k)
+# 已結束的週期不再重算；每天只從「最後一個已存週期」的起始日重新彙總並 upsert，
+# 聚合全部在資料庫端完成 (INSERT ... SELECT ... ON CONFLICT)，不需把日 K 下載到本機
+# period 格式與報表一致：週 = 'YYYY-MM-DD/YYYY-MM-DD' (週一/週五)，月 = 'YYYY-MM'
+# 第一次 (或舊表還沒有 end_date) 全部重建時按年份分批、每批各自 commit，避免單一超大語句
+# ===========================
+SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
+if not SUPABASE_DB_URL:
+    raise ValueError("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
+
+engine = get_engine(SUPABASE_DB_URL, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
+
+PERIOD_K_TABLES = {
+    'W': ('stock_weekly_k',
+          "to_char(date_trunc('week', date), 'YYYY-MM-DD') || '/' || "
+          "to_char(date_trunc('week', date) + INTERVAL '4 days', 'YYYY-MM-DD')"),
+    'M': ('stock_monthly_k', "to_char(date, 'YYYY-MM')"),
+}
+
+
+def period_start(d, period_type):
+    # d 所屬週期的第一天 (週一 / 每月 1 日)
+    return d - timedelta(days=d.weekday()) if period_type == 'W' else d.replace(day=1)
+
+
+def ensure_period_k_table(conn, table):
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            period TEXT NOT NULL, symbol TEXT NOT NULL,
+            open DOUBLE PRECISION, high DOUBLE PRECISION, low DOUBLE PRECISION, close DOUBLE PRECISION,
+            volume BIGINT, start_date DATE, end_date DATE, trading_days INTEGER
+        )
+    """))
+    # 既有的舊表可能沒有這些欄位
+    for col, col_type in [('start_date', 'DATE'), ('end_date', 'DATE'), ('trading_days', 'INTEGER')]:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} {col_type}"))
+    index_name = f"idx_{table}_period_symbol"
+    if conn.execute(text("SELECT to_regclass(:name)"), {'name': index_name}).scalar() is None:
+        # 舊表可能有重複的 (period, symbol)，建唯一索引前先只留一筆 (之後重建會覆寫成正確值)
+        res = conn.execute(text(f"""
+            DELETE FROM {table} a USING {table} b
+            WHERE a.period = b.period AND a.symbol = b.symbol AND a.ctid < b.ctid
+        """))
+        if res.rowcount: print(f"   🧹 {table}: 刪除 {res.rowcount} 筆重複週期")
+        conn.execute(text(f"CREATE UNIQUE INDEX {index_name} ON {table} (period, symbol)"))
+
+
+def upsert_periods(conn, table, period_expr, since, until=None):
+    """彙總 [since, until) 的日 K 並 upsert；since / until 須落在週期起始日，週期才不會被切開"""
+    res = conn.execute(text(f"""
+        WITH src AS (
+            SELECT symbol, date, open, high, low, close, volume, {period_expr} AS period
+            FROM stock_prices
+            WHERE date >= :since AND (CAST(:until AS DATE) IS NULL OR date < :until) AND close IS NOT NULL
+        )
+        INSERT INTO {table} (period, symbol, open, high, low, close, volume, start_date, end_date, trading_days)
+        SELECT period, symbol,
+               (ARRAY_AGG(open ORDER BY date))[1], MAX(high), MIN(low),
+               (ARRAY_AGG(close ORDER BY date DESC))[1], SUM(COALESCE(volume, 0)),
+               MIN(date), MAX(date), COUNT(*)
+        FROM src
+        GROUP BY period, symbol
+        ON CONFLICT (period, symbol) DO UPDATE SET
+            open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low, close = EXCLUDED.close,
+            volume = EXCLUDED.volume, start_date = EXCLUDED.start_date, end_date = EXCLUDED.end_date,
+            trading_days = EXCLUDED.trading_days
+    """), {'since': since, 'until': until})
+    return res.rowcount
+
+
+def update_period_k(period_type):
+    table, period_expr = PERIOD_K_TABLES[period_type]
+    with engine.begin() as conn:
+        ensure_period_k_table(conn, table)
+        last_end = conn.execute(text(f"SELECT MAX(end_date) FROM {table}")).scalar()
+        if last_end is None:
+            first, last = conn.execute(text("SELECT MIN(date), MAX(date) FROM stock_prices")).one()
+
+    if last_end is not None:
+        since = period_start(last_end, period_type)
+        print(f"   🔄 {table}: 重算 {since} 起的週期 (之前的週期已凍結)")
+        with engine.begin() as conn:
+            total = upsert_periods(conn, table, period_expr, since)
+        print(f"   💾 {table}: upsert {total} 筆")
+        return total
+
+    if first is None:
+        print("⚠️ 股價資料庫無資料，跳過。")
+        return 0
+
+    print(f"   🆕 {table} 無歷史資料 (或缺 end_date)，從 stock_prices 按年份分批重建...")
+    total = 0
+    since = period_start(first, period_type)
+    for year in range(first.year, last.year + 1):
+        until = period_start(first.replace(year=year + 1, month=1, day=1), period_type)
+        if until <= since: continue
+        with engine.begin() as conn:
+            n = upsert_periods(conn, table, period_expr, since, until if year < last.year else None)
+        print(f"      {year}: {n} 筆")
+        total += n
+        since = until
+    print(f"   💾 {table}: upsert {total} 筆")
+    return total
+
+
+if __name__ == "__main__":
+    print("🚀 更新週 K / 月 K...")
+    for period_type in PERIOD_K_TABLES:
+        update_period_k(period_type)
+    print("✅ 更新完成！")
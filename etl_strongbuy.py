@@ -1,12 +1,12 @@
 import pandas as pd
-import sqlalchemy
 from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import insert
 import os
 import numpy as np
 import gc
 from datetime import datetime, timedelta
-from sqlalchemy.pool import NullPool
+
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
 
 # 關閉 Pandas 未來版本的警告提示
 # pd.set_option('future.no_silent_downcasting', True)
@@ -18,8 +18,8 @@ SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
 if not SUPABASE_DB_URL:
     raise ValueError("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
 
-# ✅ 替換為這行 (加入 NullPool，並將等待時間延長到 30 秒以策安全)：
-engine = sqlalchemy.create_engine(SUPABASE_DB_URL, poolclass=NullPool, connect_args={'connect_timeout': 30})
+# 共用連線池 (connect_timeout 30 秒、pool_pre_ping)，不再每次查詢重新握手
+engine = get_engine(SUPABASE_DB_URL, connect_timeout=30, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
 # ===========================
 # 2. 擷取資料 (Extract)
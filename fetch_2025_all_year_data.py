@@ -5,7 +5,7 @@ import os
 import io
 import re
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
 from tqdm import tqdm
 
 # ================= 設定區 =================
@@ -17,36 +17,10 @@ OUT_DIR = "stock_train/data_2025_yfinance"
 
 SUFFIX_TWSE = ".TW"
 SUFFIX_TPEX = ".TWO"
-MAX_WORKERS = 4 # 稍微降低線程數以求穩定
-
-def debug_yfinance_structure():
-    """
-    診斷函式：先抓一檔股票看看到底發生什麼事
-    """
-    print("🔍 正在進行單檔資料結構診斷 (2330.TW)...")
-    try:
-        # 故意不加 multi_level_index 參數，看看原始回傳長怎樣
-        df = yf.download("2330.TW", start="2025-01-01", progress=False, auto_adjust=False)
-        
-        print(f"📥 下載狀況: {'空資料' if df.empty else '有資料'}")
-        print(f"📋 原始欄位: {df.columns}")
-        
-        if not df.empty:
-            # 測試是否為 MultiIndex
-            if isinstance(df.columns, pd.MultiIndex):
-                print("⚠️ 偵測到 MultiIndex (多層欄位)，將自動攤平。")
-                df.columns = df.columns.get_level_values(0)
-                print(f"📋 攤平後欄位: {df.columns}")
-            
-            print("✅ 診斷完成，準備開始批量下載...\n")
-            return True
-        else:
-            print("❌ 診斷失敗：Yahoo 回傳空資料，可能是 IP 暫時被擋或參數錯誤。")
-            return False
-            
-    except Exception as e:
-        print(f"❌ 診斷發生錯誤: {e}")
-        return False
+START_DATE = "2025-01-01"
+CHUNK_SIZE = 200        # 每次 yf.download 的檔數 (yfinance 內部多執行緒下載整批)
+CALENDAR_TICKER = "2330.TW"
+PRICE_COLS = ["open", "high", "low", "close"]
 
 def get_stock_list_from_official():
     print("正在從證交所/櫃買中心網頁爬取股票清單...")
@@ -82,83 +56,81 @@ def get_stock_list_from_official():
         print(f"❌ 爬取清單失敗: {e}")
         return []
 
-def get_market_calendar_yf():
-    try:
-        # 這裡加入 explicit 參數確保格式
-        df = yf.download("2330.TW", start="2025-01-01", progress=False, auto_adjust=False)
-        if df.empty: return None
-        return pd.DatetimeIndex(df.index).sort_values()
-    except Exception:
-        return None
-
-def fetch_and_process_one(ticker, market_calendar):
-    try:
-        # 核心修改：移除 multi_level_index=False (有些舊版 yfinance 不支援)
-        # 改用手動判斷處理，相容性最高
-        df = yf.download(ticker, start="2025-01-01", progress=False, auto_adjust=False)
-        
-        if df.empty: return None
-
-        # 1. 處理 MultiIndex (關鍵修復)
-        # 如果欄位是 ('Open', '2330.TW') 這種格式，強制只取第一層 'Open'
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-
-        # 2. 欄位重新命名 (容錯處理：先轉小寫再比對)
-        # 將所有欄位轉為小寫 (Open -> open, HIGH -> high)
-        df.columns = [c.lower() for c in df.columns]
-        
-        # 檢查必要欄位
-        cols = ["open", "high", "low", "close", "volume"]
-        if not all(col in df.columns for col in cols):
-            # 如果欄位不對，回傳 None (這就是之前失敗的原因)
-            return None
-            
-        df = df[cols]
-
-        # 3. 對齊與補值
-        df = df.reindex(market_calendar)
-        df[["open", "high", "low", "close"]] = df[["open", "high", "low", "close"]].ffill().bfill()
-        df["volume"] = df["volume"].fillna(0)
-
-        stock_id_only = ticker.replace(".TW", "").replace(".TWO", "")
-        
-        # 最終防呆檢查
-        if not re.match(r'^\d{4}$', stock_id_only): return None
-
-        out_path = f"{OUT_DIR}/{stock_id_only}.csv"
-        df.reset_index().rename(columns={"index": "date"}).to_csv(
-            out_path, index=False, date_format='%Y-%m-%d', encoding="utf-8-sig"
-        )
-        return stock_id_only
-
-    except Exception:
-        return None
+def download_chunk(chunk):
+    """一次下載多檔，回傳 (欄位, 代號) 兩層欄位的 DataFrame；失敗重試兩次"""
+    for attempt in range(3):
+        try:
+            df = yf.download(chunk, start=START_DATE, progress=False, auto_adjust=False, threads=True, group_by="column")
+            if not df.empty:
+                if not isinstance(df.columns, pd.MultiIndex):
+                    # 舊版 yfinance 單檔時只有一層欄位
+                    df.columns = pd.MultiIndex.from_product([df.columns, chunk])
+                return df
+        except Exception as e:
+            print(f"⚠️ 批次下載失敗 (第 {attempt + 1} 次): {e}")
+        time.sleep(2)
+    return None
+
+def download_panel(tickers):
+    """分批多檔下載後合併成一張面板：欄位 = (open/high/low/close/volume, 代號)"""
+    frames = []
+    chunks = [tickers[i:i + CHUNK_SIZE] for i in range(0, len(tickers), CHUNK_SIZE)]
+    for chunk in tqdm(chunks, desc="下載批次", unit="批"):
+        df = download_chunk(chunk)
+        if df is not None: frames.append(df)
+    if not frames: return None
+
+    panel = pd.concat(frames, axis=1)
+    panel.columns = pd.MultiIndex.from_arrays([panel.columns.get_level_values(0).str.lower(), panel.columns.get_level_values(1)])
+    return panel
+
+def get_market_calendar(panel):
+    """交易日曆 = 台積電有收盤價的日子 (直接取自面板，不必再下載一次)"""
+    if CALENDAR_TICKER not in panel["close"].columns: return None
+    close = panel["close"][CALENDAR_TICKER].dropna()
+    return None if close.empty else pd.DatetimeIndex(close.index).sort_values()
+
+def align_panel(panel, calendar):
+    """整張面板一次對齊交易日曆並補值：價格 ffill→bfill，量補 0；回傳 {欄位: 日期×代號 DataFrame}"""
+    fields = {}
+    for col in PRICE_COLS:
+        fields[col] = panel[col].reindex(calendar).ffill().bfill()
+    fields["volume"] = panel["volume"].reindex(calendar).fillna(0)
+    return fields
+
+def write_outputs(fields, tickers):
+    dates = fields["close"].index.strftime("%Y-%m-%d")
+    valid = fields["close"].columns[fields["close"].notna().any()]
+    written = 0
+    for ticker in tickers:
+        stock_id_only = ticker.replace(".TWO", "").replace(".TW", "")
+        # 最終防呆檢查：沒有資料或代號格式不對就跳過
+        if ticker not in valid or not re.match(r'^\d{4}$', stock_id_only): continue
+        df = pd.DataFrame({"date": dates, **{col: fields[col][ticker].values for col in PRICE_COLS + ["volume"]}})
+        df.to_csv(f"{OUT_DIR}/{stock_id_only}.csv", index=False, encoding="utf-8-sig")
+        written += 1
+    return written
 
 def main():
-    # 0. 先執行自我診斷
-    if not debug_yfinance_structure():
-        print("程式終止：無法取得基礎資料。")
+    all_tickers = get_stock_list_from_official()
+    if not all_tickers: return
+    if CALENDAR_TICKER not in all_tickers: all_tickers.append(CALENDAR_TICKER)
+
+    total_stocks = len(all_tickers)
+    print(f"🚀 開始下載 {total_stocks} 檔股票 (每批 {CHUNK_SIZE} 檔)...")
+    panel = download_panel(all_tickers)
+    if panel is None:
+        print("❌ Yahoo 回傳空資料，可能是 IP 暫時被擋或參數錯誤。程式終止。")
         return
 
-    all_tickers = get_stock_list_from_official()
-    market_calendar = get_market_calendar_yf()
-    
-    if not all_tickers or market_calendar is None:
+    market_calendar = get_market_calendar(panel)
+    if market_calendar is None:
+        print(f"❌ 無法取得交易日曆 ({CALENDAR_TICKER})，程式終止。")
         return
+    print(f"📅 交易日曆 {market_calendar[0]:%Y-%m-%d} ~ {market_calendar[-1]:%Y-%m-%d}，共 {len(market_calendar)} 天")
 
-    total_stocks = len(all_tickers)
-    print(f"🚀 開始下載 {total_stocks} 檔股票...")
-
-    success_count = 0
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(fetch_and_process_one, ticker, market_calendar): ticker for ticker in all_tickers}
-        
-        with tqdm(total=total_stocks, desc="下載進度", unit="檔") as pbar:
-            for future in as_completed(futures):
-                if future.result():
-                    success_count += 1
-                pbar.update(1)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    success_count = write_outputs(align_panel(panel, market_calendar), all_tickers)
 
     print(f"\n✅ 全部完成！成功下載: {success_count} / {total_stocks}")
     print(f"檔案已儲存至: {OUT_DIR}")
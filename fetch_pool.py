@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# ===========================
+# 並行抓取工具 (各資料引擎共用)
+# - 共用 keep-alive Session：同一主機的請求重複使用連線，不必每次重新 TLS 握手
+# - 每個主機各自的速率限制 (最小間隔 + 隨機抖動 + 同時連線數上限)，取代散落各處的 time.sleep
+# - run_concurrently：多個獨立來源同時抓，整體共用一個截止時間，結果一到就交給 on_result 合併
+# ===========================
+POOL_SIZE = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+    return _session
+
+
+class HostLimiter:
+    """單一主機的速率限制：相鄰兩次請求至少間隔 min_interval (+0~jitter 秒)，同時最多 max_concurrent 個請求"""
+
+    def __init__(self, min_interval=0.0, max_concurrent=4, jitter=0.0):
+        self.min_interval = min_interval
+        self.jitter = jitter
+        self._sem = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def __enter__(self):
+        self._sem.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at)
+            self._next_at = start + self.min_interval + random.uniform(0, self.jitter)
+        if start > now:
+            time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc):
+        self._sem.release()
+        return False
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def set_host_limit(host, min_interval=0.0, max_concurrent=4, jitter=0.0):
+    with _limiters_lock:
+        _limiters[host] = HostLimiter(min_interval, max_concurrent, jitter)
+
+
+def _limiter_for(url):
+    host = urlparse(url).hostname or ""
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = HostLimiter()
+    return limiter
+
+
+def http_get(url, **kwargs):
+    """經過主機速率限制、使用共用 Session 的 GET (參數同 requests.get)"""
+    kwargs.setdefault("timeout", 10)
+    with _limiter_for(url):
+        return get_session().get(url, **kwargs)
+
+
+def run_concurrently(tasks, deadline_s, max_workers=POOL_SIZE, on_result=None):
+    """
+    tasks: {key: 無參數 callable}；全部同時執行，最多等 deadline_s 秒
+    每完成一個就呼叫 on_result(key, result) (失敗時 result 為 None)；回傳 {key: result} (只含已完成者)
+    超過截止時間仍未完成的來源直接放棄，不拖住整個流程
+    """
+    results = {}
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {pool.submit(fn): key for key, fn in tasks.items()}
+    try:
+        for fut in as_completed(futures, timeout=max(deadline_s, 0)):
+            key = futures[fut]
+            try:
+                res = fut.result()
+            except Exception as e:
+                print(f"   ⚠️ {key} 抓取失敗: {e}")
+                res = None
+            results[key] = res
+            if on_result is not None:
+                on_result(key, res)
+    except FuturesTimeout:
+        pending = [key for fut, key in futures.items() if not fut.done()]
+        print(f"   ⏱️ 超過總時限 {deadline_s:.0f}s，放棄 {len(pending)} 個來源: {', '.join(map(str, pending[:5]))}{' ...' if len(pending) > 5 else ''}")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
@@ -0,0 +1,179 @@
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from fetch_pool import http_get, run_concurrently, set_host_limit
+
+# ===========================
+# stock_train 訓練資料增量更新 (取代 fetch_big / small / 981A / 20xx_highest / highprice 各自的下載腳本)
+# - 名單與區間寫在 stock_train/universes.json：years = 滾動最近 N 年；start / end = 固定區間
+# - 每個 CSV 只補「最後日期之後」缺的 K 棒；同一檔出現在多個名單只下載一次，再分送到各名單的資料夾
+# - 只缺最近幾天時改用「按日期查全市場」，每天只要 1 個請求，不必逐檔查詢
+# - 寫檔一律 暫存檔 + os.replace，中途失敗不會留下半個 CSV
+# 用法：python fetch_universe_data.py [名單名稱 ...]  (不指定 = universes.json 中 daily 為 true 的名單)
+# ===========================
+MANIFEST_PATH = os.path.join("stock_train", "universes.json")
+FINMIND_API = "https://api.finmindtrade.com/api/v4/data"
+FINMIND_TOKEN = os.environ.get("FINMIND_TOKEN")  # 選用；有 token 額度較高
+FETCH_DEADLINE = 600
+BY_DATE_MAX_DAYS = 7      # 缺口在這麼多天內就改用按日期查全市場
+COLUMNS = ["date", "open", "high", "low", "close", "volume"]
+
+set_host_limit("api.finmindtrade.com", min_interval=0.2, max_concurrent=4)
+
+
+def load_universes(path=MANIFEST_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def universe_window(u, today):
+    """回傳名單的 (起日, 迄日)"""
+    if "start" in u:
+        return date.fromisoformat(u["start"]), min(date.fromisoformat(u.get("end", today.isoformat())), today)
+    return today - timedelta(days=365 * u.get("years", 1)), today
+
+
+def read_last_date(path):
+    if not os.path.exists(path): return None
+    try:
+        dates = pd.read_csv(path, encoding="utf-8-sig", usecols=["date"])["date"]
+    except Exception:
+        return None
+    return date.fromisoformat(dates.max()) if len(dates) else None
+
+
+def _has_weekday(start, end):
+    d = start
+    while d <= end:
+        if d.weekday() < 5: return True
+        d += timedelta(days=1)
+    return False
+
+
+def plan_jobs(universes, today):
+    """
+    回傳 {stock_id: [(csv 路徑, 名單起日, 名單迄日, 需要的起日), ...]}，只列出有缺口的檔案
+    缺口 = 最後日期隔天 ~ 名單迄日 (沒有檔案就從名單起日開始)；缺口內沒有平日 (週末 / 固定區間已完整) 就略過
+    """
+    jobs = {}
+    for u in universes:
+        w_start, w_end = universe_window(u, today)
+        for sid in u["symbols"]:
+            path = os.path.join(u["out_dir"], f"{sid}.csv")
+            last = read_last_date(path)
+            need_from = w_start if last is None or last < w_start else last + timedelta(days=1)
+            if need_from > w_end or not _has_weekday(need_from, w_end): continue
+            jobs.setdefault(sid, []).append((path, w_start, w_end, need_from))
+    return jobs
+
+
+def _finmind_frame(params):
+    if FINMIND_TOKEN: params["token"] = FINMIND_TOKEN
+    r = http_get(FINMIND_API, params=params, timeout=30)
+    data = r.json()
+    if data.get("status", 200) != 200:
+        raise RuntimeError(data.get("msg", f"status {data.get('status')}"))
+    df = pd.DataFrame(data.get("data", []))
+    if df.empty: return df
+    df = df.rename(columns={"max": "high", "min": "low", "Trading_Volume": "volume"})
+    return df[["stock_id"] + COLUMNS]
+
+
+def fetch_stock(stock_id, start, end):
+    return _finmind_frame({"dataset": "TaiwanStockPrice", "data_id": stock_id,
+                           "start_date": start.isoformat(), "end_date": end.isoformat()})
+
+
+def fetch_market_day(d):
+    # 不帶 data_id = 當天全市場 (FinMind 部分方案不開放，失敗時由呼叫端改回逐檔)
+    return _finmind_frame({"dataset": "TaiwanStockPrice", "start_date": d.isoformat(), "end_date": d.isoformat()})
+
+
+def _span(targets):
+    return min(j[3] for j in targets), max(j[2] for j in targets)
+
+
+def download_by_date(jobs):
+    """缺口都在最近幾天的股票：每個交易日查一次全市場再挑出需要的；失敗回傳 None"""
+    start = min(_span(t)[0] for t in jobs.values())
+    end = max(_span(t)[1] for t in jobs.values())
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    days = [d for d in days if d.weekday() < 5]
+    if len(days) >= len(jobs): return None
+
+    print(f"📅 {len(jobs)} 檔只缺 {start} ~ {end}，改用按日期查全市場 ({len(days)} 個請求)")
+    results = run_concurrently({d: (lambda d=d: fetch_market_day(d)) for d in days}, FETCH_DEADLINE)
+    if len(results) < len(days) or any(r is None for r in results.values()):
+        print("⚠️ 按日期查詢失敗，改回逐檔下載")
+        return None
+    frames = [r for r in results.values() if not r.empty]
+    if not frames: return {}
+    market = pd.concat(frames)
+    market = market[market["stock_id"].isin(list(jobs))]
+    return {sid: g[COLUMNS] for sid, g in market.groupby("stock_id")}
+
+
+def download(jobs, today):
+    """回傳 {stock_id: DataFrame}；只缺最近幾天的走按日期查詢，其餘逐檔只抓缺口 (多個名單的缺口合併成一次)"""
+    bars = {}
+    cutoff = today - timedelta(days=BY_DATE_MAX_DAYS)
+    recent = {sid: t for sid, t in jobs.items() if _span(t)[0] >= cutoff}
+    rest = {sid: t for sid, t in jobs.items() if sid not in recent}
+    if recent:
+        got = download_by_date(recent)
+        if got is None: rest.update(recent)
+        else: bars.update(got)
+
+    if rest:
+        print(f"🚀 逐檔下載 {len(rest)} 檔 (各檔只抓缺口)...")
+        tasks = {sid: (lambda sid=sid, span=_span(t): fetch_stock(sid, *span)) for sid, t in rest.items()}
+        results = run_concurrently(tasks, FETCH_DEADLINE)
+        bars.update({sid: df[COLUMNS] for sid, df in results.items() if df is not None and not df.empty})
+    return bars
+
+
+def append_bars(path, bars, w_start, w_end):
+    """併入新 K 棒 (同日期以新資料為準)、裁到名單區間，以暫存檔 + os.replace 寫回"""
+    bars = bars[(bars["date"] >= w_start.isoformat()) & (bars["date"] <= w_end.isoformat())]
+    if bars.empty: return 0
+    old = pd.read_csv(path, encoding="utf-8-sig") if os.path.exists(path) else pd.DataFrame(columns=COLUMNS)
+    merged = pd.concat([old[COLUMNS], bars[COLUMNS]]).drop_duplicates("date", keep="last").sort_values("date")
+    merged = merged[merged["date"] >= w_start.isoformat()]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    merged.to_csv(tmp_path, index=False, encoding="utf-8-sig")
+    os.replace(tmp_path, path)
+    return len(bars)
+
+
+def main(names=None):
+    manifest = load_universes()
+    names = names or [n for n, u in manifest.items() if u.get("daily", True)]
+    unknown = [n for n in names if n not in manifest]
+    if unknown: raise ValueError(f"❌ universes.json 中沒有這些名單: {', '.join(unknown)}")
+
+    today = datetime.today().date()
+    jobs = plan_jobs([manifest[n] for n in names], today)
+    n_files = sum(len(t) for t in jobs.values())
+    print(f"📋 名單: {', '.join(names)}；需更新 {n_files} 個檔案 / {len(jobs)} 檔股票")
+    if not jobs:
+        print("✨ 全部已是最新，不需下載")
+        return
+
+    bars = download(jobs, today)
+    written = 0
+    for sid, targets in jobs.items():
+        if sid not in bars: continue
+        for path, w_start, w_end, _ in targets:
+            if append_bars(path, bars[sid], w_start, w_end): written += 1
+    print(f"✔ 已更新 {written} 個檔案 ({len(jobs) - len(bars)} 檔無新資料)")
+    print("全部完成！")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
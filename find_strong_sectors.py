@@ -1,13 +1,15 @@
 import os
+import numpy as np
 import pandas as pd
 import streamlit as st
-import sqlalchemy
 from sqlalchemy import text
 import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import bcrypt
 
+import kline_chart as kc
+from db_engine import get_engine
+import price_extremes
+
 # ===========================
 # 1. 頁面與連線配置
 # ===========================
@@ -39,18 +41,11 @@ if not SUPABASE_DB_URL:
     st.error("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
     st.stop()
 
-@st.cache_resource
-def get_db_engine():
-    try:
-        return sqlalchemy.create_engine(
-            SUPABASE_DB_URL, 
-            connect_args={'options': '-c statement_timeout=60000'}
-        )
-    except Exception as e:
-        st.error(f"❌ 資料庫連線失敗: {e}")
-        st.stop()
-
-engine = get_db_engine()
+try:
+    engine = get_engine(SUPABASE_DB_URL)
+except Exception as e:
+    st.error(f"❌ 資料庫連線失敗: {e}")
+    st.stop()
 
 # ===========================
 # 2. 身份驗證與註冊模組
@@ -132,6 +127,60 @@ if 'role' not in st.session_state:
 # ===========================
 # 3. 戰情室核心資料邏輯
 # ===========================
+def _by_symbol(df, col):
+    return df.groupby('symbol', sort=False)[col]
+
+
+def _rolling(df, col, window, how):
+    # 全部股票一次計算 (分段 rolling)，結果對回原本的列順序
+    r = _by_symbol(df, col).rolling(window, min_periods=1)
+    return getattr(r, how)().reset_index(level=0, drop=True)
+
+
+def _ewm(df, col, **kw):
+    return _by_symbol(df, col).ewm(adjust=False, **kw).mean().reset_index(level=0, drop=True)
+
+
+def compute_indicators(df):
+    """
+    所有入選股票的均線 / 布林標準差 / MACD / KD / RSI，整張長表一次分段計算 (不逐檔迴圈)
+    df 需依 symbol, date 排序；布林上下軌與成交量、MACD 柱顏色只在畫圖時才由 create_kline_chart 推得
+    """
+    df = df.sort_values(['symbol', 'date'], kind='stable').reset_index(drop=True)
+    value_cols = [c for c in df.columns if c != 'symbol']
+    df[value_cols] = df.groupby('symbol', sort=False)[value_cols].ffill()
+
+    for n in (3, 5, 10, 20, 60):
+        df[f'sma{n}'] = _rolling(df, 'close', n, 'mean')
+    df['std20'] = _rolling(df, 'close', 20, 'std').fillna(0)
+
+    df['ema12'] = _ewm(df, 'close', span=12)
+    df['ema26'] = _ewm(df, 'close', span=26)
+    df['macd'] = df['ema12'] - df['ema26']
+    df['signal'] = _ewm(df, 'macd', span=9)
+    df['hist'] = df['macd'] - df['signal']
+
+    low_min = _rolling(df, 'low', 9, 'min')
+    high_max = _rolling(df, 'high', 9, 'max')
+    df['rsv'] = (((df['close'] - low_min) / (high_max - low_min).replace(0, 1)) * 100).fillna(50)
+    df['kd_k'] = _ewm(df, 'rsv', com=2)
+    df['kd_d'] = _ewm(df, 'kd_k', com=2)
+
+    delta = _by_symbol(df, 'close').diff()
+    df['gain'] = delta.where(delta > 0, 0)
+    df['loss'] = -delta.where(delta < 0, 0)
+    rs = _ewm(df, 'gain', alpha=1/14) / _ewm(df, 'loss', alpha=1/14).replace(0, float('nan'))
+    df['rsi'] = (100 - (100 / (1 + rs))).fillna(50)
+    return df.drop(columns=['ema12', 'ema26', 'rsv', 'gain', 'loss'])
+
+
+def symbol_history(df_history, symbol):
+    """單檔歷史 (長表已依 symbol 排序，searchsorted 直接切片)"""
+    syms = df_history['symbol'].to_numpy()
+    lo, hi = syms.searchsorted(symbol, 'left'), syms.searchsorted(symbol, 'right')
+    return df_history.iloc[lo:hi]
+
+
 @st.cache_data(ttl=3600)
 def load_and_process_data():
     with engine.connect() as conn:
@@ -145,8 +194,12 @@ def load_and_process_data():
         date_3m_ago = available_dates[-60] if len(available_dates) >= 60 else available_dates[0]
         date_150_ago = available_dates[-150] if len(available_dates) >= 150 else available_dates[0]
 
-        query_prices = text(f"SELECT symbol, date, close FROM stock_prices WHERE date >= '{min_date}'")
-        df_prices = pd.concat([chunk for chunk in pd.read_sql(query_prices, conn, chunksize=50000)], ignore_index=True)
+        # 日報排程已維護 200 日新高/低狀態 (price_extreme_state) 且是最新交易日 → 直接取用，不必撈 200 天全市場價格
+        state_as_of, df_state = price_extremes.load_latest_extremes(conn)
+        df_prices = None
+        if state_as_of != pd.to_datetime(latest_date).strftime('%Y-%m-%d'):
+            query_prices = text(f"SELECT symbol, date, close FROM stock_prices WHERE date >= '{min_date}'")
+            df_prices = pd.concat([chunk for chunk in pd.read_sql(query_prices, conn, chunksize=50000)], ignore_index=True)
 
         query_inst = text(f"""
             SELECT symbol, SUM(foreign_net) as foreign_net, SUM(trust_net) as trust_net
@@ -160,13 +213,18 @@ def load_and_process_data():
         
         df_info = pd.read_sql("SELECT symbol, name, industry FROM stock_info", conn)
 
-    df_prices['date'] = pd.to_datetime(df_prices['date'])
-    pivot_df = df_prices.pivot(index='date', columns='symbol', values='close').sort_index()
-    
-    max_200 = pivot_df.max()
-    latest_closes = pivot_df.iloc[-1]
-    is_new_high = latest_closes >= max_200
-    new_high_symbols = is_new_high[is_new_high].index.tolist()
+    if df_prices is None:
+        df_highs = df_state[df_state['is_new_high'].astype(bool)]
+        latest_closes = df_highs.set_index('symbol')['close']
+        new_high_symbols = df_highs['symbol'].tolist()
+    else:
+        df_prices['date'] = pd.to_datetime(df_prices['date'])
+        pivot_df = df_prices.pivot(index='date', columns='symbol', values='close').sort_index()
+
+        max_200 = pivot_df.max()
+        latest_closes = pivot_df.iloc[-1]
+        is_new_high = latest_closes >= max_200
+        new_high_symbols = is_new_high[is_new_high].index.tolist()
     
     df_result = pd.DataFrame({'symbol': new_high_symbols})
     df_result = df_result.merge(latest_closes.reset_index(name='close'), on='symbol')
@@ -177,7 +235,7 @@ def load_and_process_data():
     df_result = df_result[(df_result['foreign_net'] > 0) | (df_result['trust_net'] > 0)]
     
     if df_result.empty:
-        return pd.DataFrame(), pd.DataFrame(), {}, str(latest_date)
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), str(latest_date)
         
     df_result = df_result.merge(df_info, on='symbol', how='left')
     df_result['name'] = df_result['name'].fillna(df_result['symbol'])
@@ -211,51 +269,18 @@ def load_and_process_data():
     df_history['daily_foreign'] = (df_history['daily_foreign'] / 1000).fillna(0).astype(int)
     df_history['daily_trust'] = (df_history['daily_trust'] / 1000).fillna(0).astype(int)
     
-    history_dict = {}
-
-    for sym, group in df_history.groupby('symbol'):
-        group = group.sort_values('date').ffill()
-        close_s = group['close']
-        
-        group['sma3'] = close_s.rolling(3, min_periods=1).mean()
-        group['sma5'] = close_s.rolling(5, min_periods=1).mean()
-        group['sma10'] = close_s.rolling(10, min_periods=1).mean()
-        group['sma20'] = close_s.rolling(20, min_periods=1).mean()
-        group['sma60'] = close_s.rolling(60, min_periods=1).mean()
-        std20 = close_s.rolling(20, min_periods=1).std().fillna(0)
-        group['upper'] = group['sma20'] + 3 * std20
-        group['lower'] = group['sma20'] - 3 * std20
-
-        ema12 = close_s.ewm(span=12, adjust=False).mean()
-        ema26 = close_s.ewm(span=26, adjust=False).mean()
-        group['macd'] = ema12 - ema26
-        group['signal'] = group['macd'].ewm(span=9, adjust=False).mean()
-        group['hist'] = group['macd'] - group['signal']
-
-        low_min = group['low'].rolling(9, min_periods=1).min()
-        high_max = group['high'].rolling(9, min_periods=1).max()
-        rsv = ((close_s - low_min) / (high_max - low_min).replace(0, 1)) * 100
-        rsv = rsv.fillna(50)
-        group['kd_k'] = rsv.ewm(com=2, adjust=False).mean()
-        group['kd_d'] = group['kd_k'].ewm(com=2, adjust=False).mean()
-
-        delta = close_s.diff()
-        gain = delta.where(delta > 0, 0).ewm(alpha=1/14, adjust=False).mean()
-        loss = (-delta.where(delta < 0, 0)).ewm(alpha=1/14, adjust=False).mean()
-        rs = gain / loss.replace(0, float('nan'))
-        group['rsi'] = 100 - (100 / (1 + rs))
-        group['rsi'] = group['rsi'].fillna(50)
-        
-        group['vol_color'] = ['#ff5252' if c >= o else '#4caf50' for c, o in zip(close_s, group['open'])]
-        group['macd_color'] = ['#ff5252' if h >= 0 else '#4caf50' for h in group['hist']]
-
-        history_dict[sym] = group
+    df_history = compute_indicators(df_history)
 
     date_str = latest_date.strftime("%Y-%m-%d") if hasattr(latest_date, 'strftime') else str(latest_date)
-    return df_result, sector_stats, history_dict, date_str
+    return df_result, sector_stats, df_history, date_str
 
 def create_kline_chart(df_data, symbol_name, show_macd, show_kd, show_rsi):
-    dates = df_data['date'].dt.strftime('%Y-%m-%d')
+    dates = df_data['date'].dt.strftime('%Y-%m-%d').to_numpy()
+    # 畫圖專用欄位：只在真的要顯示這檔時才算
+    upper = df_data['sma20'] + 3 * df_data['std20']
+    lower = df_data['sma20'] - 3 * df_data['std20']
+    vol_color = np.where(df_data['close'] >= df_data['open'], '#ff5252', '#4caf50')
+    macd_color = np.where(df_data['hist'] >= 0, '#ff5252', '#4caf50')
     
     panels = [{'name': 'volume', 'title': '成交量 (張)'}]
     if show_macd: panels.append({'name': 'macd', 'title': 'MACD'})
@@ -264,68 +289,61 @@ def create_kline_chart(df_data, symbol_name, show_macd, show_kd, show_rsi):
     panels.append({'name': 'foreign', 'title': '外資買賣超 (張)'})
     panels.append({'name': 'trust', 'title': '投信買賣超 (張)'})
 
-    num_subplots = 1 + len(panels)
     row_heights = [0.45] + [(0.55 / len(panels))] * len(panels)
     subplot_titles = [f"📈 {symbol_name} (股價與均線)"] + [f"📊 {p['title']}" for p in panels]
-    
-    fig = make_subplots(
-        rows=num_subplots, cols=1, shared_xaxes=True, 
-        vertical_spacing=0.04, row_heights=row_heights,
-        subplot_titles=subplot_titles 
-    )
-
-    fig.add_trace(go.Scatter(x=dates, y=df_data['upper'], mode='lines', line=dict(color='rgba(255,255,255,0.2)', dash='dot'), name='3倍布林', legendgroup='bb'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=dates, y=df_data['lower'], mode='lines', line=dict(color='rgba(255,255,255,0.2)', dash='dot'), name='BB-3', legendgroup='bb', showlegend=False, fill='tonexty', fillcolor='rgba(255,255,255,0.05)'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=dates, y=df_data['sma3'], line=dict(color='#ffeb3b', width=1.5), name='3MA'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=dates, y=df_data['sma5'], line=dict(color='#ffffff', width=1.5), name='5MA'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=dates, y=df_data['sma10'], line=dict(color='#9c27b0', width=1.5), name='10MA'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=dates, y=df_data['sma20'], line=dict(color='#ff9800', width=1.5), name='20MA'), row=1, col=1)
-    fig.add_trace(go.Scatter(x=dates, y=df_data['sma60'], line=dict(color='#2196f3', width=1.5), name='60MA'), row=1, col=1)
-    fig.add_trace(go.Candlestick(
-        x=dates, open=df_data['open'], high=df_data['high'], low=df_data['low'], close=df_data['close'],
-        name='K線', increasing_line_color='#ff5252', decreasing_line_color='#4caf50', showlegend=False
-    ), row=1, col=1)
+    shapes = []
+
+    traces = [
+        kc.line(dates, upper, line=dict(color='rgba(255,255,255,0.2)', dash='dot'), name='3倍布林', legendgroup='bb'),
+        kc.line(dates, lower, line=dict(color='rgba(255,255,255,0.2)', dash='dot'), name='BB-3', legendgroup='bb', showlegend=False, fill='tonexty', fillcolor='rgba(255,255,255,0.05)'),
+        kc.line(dates, df_data['sma3'], line=dict(color='#ffeb3b', width=1.5), name='3MA'),
+        kc.line(dates, df_data['sma5'], line=dict(color='#ffffff', width=1.5), name='5MA'),
+        kc.line(dates, df_data['sma10'], line=dict(color='#9c27b0', width=1.5), name='10MA'),
+        kc.line(dates, df_data['sma20'], line=dict(color='#ff9800', width=1.5), name='20MA'),
+        kc.line(dates, df_data['sma60'], line=dict(color='#2196f3', width=1.5), name='60MA'),
+        kc.candlestick(dates, df_data, name='K線', increasing_line_color='#ff5252', decreasing_line_color='#4caf50', showlegend=False),
+    ]
 
     current_row = 2
-    fig.add_trace(go.Bar(x=dates, y=df_data['volume'], marker_color=df_data['vol_color'], name='成交量', showlegend=False), row=current_row, col=1)
+    traces.append(kc.bar(dates, df_data['volume'], row=current_row, marker_color=vol_color, name='成交量', showlegend=False))
     current_row += 1
 
     if show_macd:
-        fig.add_trace(go.Scatter(x=dates, y=df_data['macd'], line=dict(color='#2196f3'), name='MACD', showlegend=False), row=current_row, col=1)
-        fig.add_trace(go.Scatter(x=dates, y=df_data['signal'], line=dict(color='#ff9800'), name='Signal', showlegend=False), row=current_row, col=1)
-        fig.add_trace(go.Bar(x=dates, y=df_data['hist'], marker_color=df_data['macd_color'], name='OSC', showlegend=False), row=current_row, col=1)
+        traces.append(kc.line(dates, df_data['macd'], row=current_row, line=dict(color='#2196f3'), name='MACD', showlegend=False))
+        traces.append(kc.line(dates, df_data['signal'], row=current_row, line=dict(color='#ff9800'), name='Signal', showlegend=False))
+        traces.append(kc.bar(dates, df_data['hist'], row=current_row, marker_color=macd_color, name='OSC', showlegend=False))
         current_row += 1
 
     if show_kd:
-        fig.add_trace(go.Scatter(x=dates, y=df_data['kd_k'], line=dict(color='#ff9800'), name='K(9)', showlegend=False), row=current_row, col=1)
-        fig.add_trace(go.Scatter(x=dates, y=df_data['kd_d'], line=dict(color='#2196f3'), name='D(3)', showlegend=False), row=current_row, col=1)
-        fig.add_hline(y=80, line_dash="dash", line_color="gray", row=current_row, col=1)
-        fig.add_hline(y=20, line_dash="dash", line_color="gray", row=current_row, col=1)
+        traces.append(kc.line(dates, df_data['kd_k'], row=current_row, line=dict(color='#ff9800'), name='K(9)', showlegend=False))
+        traces.append(kc.line(dates, df_data['kd_d'], row=current_row, line=dict(color='#2196f3'), name='D(3)', showlegend=False))
+        shapes.append(kc.hline(80, row=current_row, dash="dash", color="gray"))
+        shapes.append(kc.hline(20, row=current_row, dash="dash", color="gray"))
         current_row += 1
 
     if show_rsi:
-        fig.add_trace(go.Scatter(x=dates, y=df_data['rsi'], line=dict(color='#e91e63'), name='RSI(14)', showlegend=False), row=current_row, col=1)
+        traces.append(kc.line(dates, df_data['rsi'], row=current_row, line=dict(color='#e91e63'), name='RSI(14)', showlegend=False))
         current_row += 1
 
-    fig.add_trace(go.Bar(x=dates, y=df_data['daily_foreign'], marker_color='#e91e63', name='外資進出', showlegend=False), row=current_row, col=1)
+    traces.append(kc.bar(dates, df_data['daily_foreign'], row=current_row, marker_color='#e91e63', name='外資進出', showlegend=False))
     current_row += 1
-    fig.add_trace(go.Bar(x=dates, y=df_data['daily_trust'], marker_color='#00bcd4', name='投信進出', showlegend=False), row=current_row, col=1)
-
-    for annotation in fig['layout']['annotations']:
-        annotation['font'] = dict(size=15, color="#00bcd4") 
-        annotation['x'] = 0.01  
-        annotation['xanchor'] = 'left'
+    traces.append(kc.bar(dates, df_data['daily_trust'], row=current_row, marker_color='#00bcd4', name='投信進出', showlegend=False))
 
-    fig.update_layout(
+    layout = kc.subplot_layout(
+        row_heights, subplot_titles, vertical_spacing=0.04, title_font=dict(size=15, color="#00bcd4"), title_align='left', shapes=shapes,
         template="plotly_dark", height=850 + (100 * (len(panels)-3)), 
-        margin=dict(l=40, r=20, t=50, b=20), xaxis_rangeslider_visible=False,
+        margin=dict(l=40, r=20, t=50, b=20),
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
         paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)'
     )
-    
-    fig.update_xaxes(type='category', categoryorder='category ascending', nticks=20, tickangle=45, showgrid=True, gridcolor='#333')
-    fig.update_yaxes(showgrid=True, gridcolor='#333')
-    return fig
+    kc.update_axes(layout, 'x', type='category', categoryorder='category ascending', nticks=20, tickangle=45, showgrid=True, gridcolor='#333', rangeslider=dict(visible=False))
+    kc.update_axes(layout, 'y', showgrid=True, gridcolor='#333')
+    return kc.build_figure(traces, layout)
+
+# 🚀 圖表快取：以 (股票, 資料日期, 副圖選項) 為 key，切換股票/勾選項目回來不必重建
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+def get_kline_figure(symbol_name, last_date, show_macd, show_kd, show_rsi, _df_data):
+    return create_kline_chart(_df_data, symbol_name, show_macd, show_kd, show_rsi)
 
 
 # ===========================
@@ -530,13 +548,15 @@ else:
 
         selected_symbol = st.session_state.selected_stock.split(" ")[0]
 
-        if selected_symbol and selected_symbol in history_data:
+        df_hist = symbol_history(history_data, selected_symbol) if selected_symbol else None
+        if df_hist is not None and not df_hist.empty:
             # 從 st.session_state 讀取狀態
-            fig_kline = create_kline_chart(
-                history_data[selected_symbol], 
+            fig_kline = get_kline_figure(
                 st.session_state.selected_stock, 
+                df_hist['date'].iloc[-1], 
                 st.session_state['show_macd'], 
                 st.session_state['show_kd'], 
-                st.session_state['show_rsi']
+                st.session_state['show_rsi'],
+                df_hist
             )
             st.plotly_chart(fig_kline, use_container_width=True)
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import yfinance as yf
 import requests
 import os
@@ -8,7 +9,12 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 from io import StringIO
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from db_engine import get_engine
+import price_extremes
+from report_tables import RANKING_JS, ranking_arrays, ranking_table, render_tab, tab_payload, top_n_indices
+from dashboard_publisher import print_publish_stats, publish_html, publish_json, publish_redirect
 
 # 忽略期交所憑證警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -22,7 +28,6 @@ if not SUPABASE_DB_URL:
     raise RuntimeError("❌ SUPABASE_DB_URL 環境變數未設定")
 
 BASE_OUTPUT_DIR = "tw_stock_dashboard"
-TOP_N = 100
 LOOKBACK_DAYS = 365 
 
 # 指數清單
@@ -39,54 +44,20 @@ CORE_WEIGHTS = ["2330.TW", "2317.TW", "2454.TW"]
 # ===========================
 # 1. 資料庫連線輔助 (單例模式)
 # ===========================
-_db_engine = None
-
 def get_db_engine():
     """
-    取得資料庫引擎 (Singleton 模式)
-    避免重複 create_engine 導致連線數爆滿 (MaxClientsInSessionMode)
-    加入 statement_timeout=60000 避免大量歷史資料撈取超時
+    取得共用資料庫引擎 (db_engine 模組內為單例，避免連線數爆滿 MaxClientsInSessionMode)
+    statement_timeout=60000 避免大量歷史資料撈取超時
     """
-    global _db_engine
-    if _db_engine is None:
-        try:
-            _db_engine = create_engine(
-                SUPABASE_DB_URL, 
-                pool_size=5, 
-                max_overflow=0,
-                pool_pre_ping=True,
-                connect_args={'options': '-c statement_timeout=60000'}
-            )
-        except Exception as e:
-            print(f"❌ 資料庫連線設定錯誤: {e}")
-            return None
-    return _db_engine
+    try:
+        return get_engine(SUPABASE_DB_URL, pool_size=5, max_overflow=0, statement_timeout_ms=60000)
+    except Exception as e:
+        print(f"❌ 資料庫連線設定錯誤: {e}")
+        return None
 
 # ===========================
 # 2. 輔助函式
 # ===========================
-def get_yahoo_link(symbol, name):
-    if symbol.startswith("^") or symbol.endswith(".SS") or symbol == "VIXTWN":
-        return f'<a href="https://finance.yahoo.com/quote/{symbol}" target="_blank" class="stock-link">{name}<br><small>{symbol}</small></a>'
-    
-    display_name = name if name and str(name) != "nan" else symbol
-    if len(str(display_name)) > 6: display_name = str(display_name)[:6] + ".."
-        
-    return f'<a href="https://tw.stock.yahoo.com/quote/{symbol}" target="_blank" class="stock-link">{display_name}<br><small>{symbol}</small></a>'
-
-def format_number(val, is_price=False, is_idx=False):
-    if pd.isna(val): return "-"
-    if is_idx: return f"{val:,.2f}"
-    if is_price: return f"{val:.2f}"
-    return f"{int(val):,}"
-
-def get_color_style(val):
-    try:
-        if val > 0: return 'class="t-up"'
-        if val < 0: return 'class="t-down"'
-    except: pass
-    return ''
-
 def format_display_date(date_str, period_type):
     weekdays = ['(一)', '(二)', '(三)', '(四)', '(五)', '(六)', '(日)']
     try:
@@ -157,126 +128,214 @@ def fetch_indices_data():
     return pd.DataFrame(data_list)
 
 # ===========================
-# 4. 資料庫讀取 (基本資料)
+# 4. 每日快照 (daily / weekly / monthly snapshot)
+# 由排程每次執行時在資料庫端以單一 INSERT ... SELECT 物化最新一期的窄表
+# (收盤、昨收、漲跌幅、成交值、名稱、產業、三大法人)，報表各分頁只需讀一次
 # ===========================
-def load_db_data(period_type):
+SNAPSHOT_TABLES = {
+    'D': ('daily_snapshot', 'date', 'stock_prices'),
+    'W': ('weekly_snapshot', 'period', 'stock_weekly_k'),
+    'M': ('monthly_snapshot', 'period', 'stock_monthly_k'),
+}
+INST_COLUMNS = ['foreign_net', 'trust_net', 'dealer_net']
+
+DAILY_SNAPSHOT_SQL = """
+    SELECT p.symbol, p.date,
+           COALESCE(i.name, p.symbol) AS name, COALESCE(i.industry, '其他') AS industry,
+           p.close, prev.close AS prev_close, COALESCE(p.volume, 0) AS volume,
+           COALESCE((p.close - prev.close) * 100.0 / NULLIF(prev.close, 0), 0) AS change_pct,
+           p.close * COALESCE(p.volume, 0) / 100000000.0 AS turnover_billion,
+           inst.foreign_net, inst.trust_net, inst.dealer_net
+    FROM stock_prices p
+    LEFT JOIN stock_prices prev ON prev.symbol = p.symbol AND prev.date = :prev_key
+    LEFT JOIN stock_info i ON i.symbol = p.symbol
+    LEFT JOIN institutional_investors inst ON inst.symbol = p.symbol AND inst.date = :key
+    WHERE p.date = :key
+"""
+
+# 週/月 K 的漲跌幅沿用原本定義：(收盤 - 開盤) / 開盤
+PERIOD_SNAPSHOT_SQL = """
+    SELECT k.symbol, k.period,
+           COALESCE(i.name, k.symbol) AS name, COALESCE(i.industry, '其他') AS industry,
+           k.open, k.close, COALESCE(k.volume, 0) AS volume,
+           COALESCE((k.close - k.open) * 100.0 / NULLIF(k.open, 0), 0) AS change_pct,
+           k.close * COALESCE(k.volume, 0) / 100000000.0 AS turnover_billion
+    FROM {source} k
+    LEFT JOIN stock_info i ON i.symbol = k.symbol
+    WHERE k.period = :key
+"""
+
+def update_snapshot_db(period_type):
+    """重建最新一期的快照 (同一交易內先刪後寫，重跑不會重複)"""
+    table, key_col, source = SNAPSHOT_TABLES[period_type]
     engine = get_db_engine()
-    if not engine: return None, "資料庫連線失敗"
+    if not engine: return False
 
-    df = None
-    latest_date_str = "Unknown"
-    
     try:
-        with engine.connect() as conn:
+        with engine.begin() as conn:
+            latest = conn.execute(text(f"SELECT MAX({key_col}) FROM {source}")).scalar()
+            if latest is None:
+                print(f"⚠️ {source} 無資料，跳過 {table}。")
+                return False
+
+            params = {'key': latest}
             if period_type == 'D':
-                res = conn.execute(text("SELECT MAX(date) FROM stock_prices")).fetchone()
-                if res and res[0]:
-                    latest_date_str = str(res[0])
-                    
-                    df = pd.read_sql(text(f"SELECT * FROM stock_prices WHERE date = '{latest_date_str}'"), conn)
-                    
-                    res_prev = conn.execute(text(f"SELECT MAX(date) FROM stock_prices WHERE date < '{latest_date_str}'")).fetchone()
-                    if res_prev and res_prev[0]:
-                        prev_date = str(res_prev[0])
-                        df_prev = pd.read_sql(text(f"SELECT symbol, close as prev_close FROM stock_prices WHERE date = '{prev_date}'"), conn)
-                        df = df.merge(df_prev, on='symbol', how='left')
-                        df['change_pct'] = ((df['close'] - df['prev_close']) / df['prev_close']) * 100
-                    else:
-                        df['change_pct'] = 0.0
-            
+                params['prev_key'] = conn.execute(text("SELECT MAX(date) FROM stock_prices WHERE date < :key"), params).scalar()
+                select_sql = DAILY_SNAPSHOT_SQL
             else:
-                table = 'stock_weekly_k' if period_type == 'W' else 'stock_monthly_k'
-                try:
-                    res = conn.execute(text(f"SELECT MAX(period) FROM {table}")).fetchone()
-                    if res and res[0]:
-                        latest_date_str = str(res[0])
-                        df = pd.read_sql(text(f"SELECT * FROM {table} WHERE period = '{latest_date_str}'"), conn)
-                        df['change_pct'] = ((df['close'] - df['open']) / df['open']) * 100
-                except Exception as e:
-                    print(f"   [DEBUG] 週/月資料讀取異常: {e}")
-
-            if df is None or df.empty:
-                return None, "無資料"
-
-            try:
-                info_df = pd.read_sql(text("SELECT symbol, name, industry FROM stock_info"), conn)
-                df = df.merge(info_df, on='symbol', how='left')
-                df['name'] = df['name'].fillna(df['symbol'])
-                df['industry'] = df['industry'].fillna('其他')
-            except:
-                df['name'] = df['symbol']
-                df['industry'] = '其他'
+                select_sql = PERIOD_SNAPSHOT_SQL.format(source=source)
+
+            # 第一次執行時依 SELECT 的欄位型別建表
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} AS {select_sql} WITH NO DATA"), params)
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{table}_{key_col} ON {table} ({key_col})"))
+            conn.execute(text(f"DELETE FROM {table} WHERE {key_col} = :key"), {'key': latest})
+            res = conn.execute(text(f"INSERT INTO {table} {select_sql}"), params)
+            print(f"   💾 {table} ({latest}) 已物化 {res.rowcount} 檔。")
+        return True
+    except Exception as e:
+        print(f"❌ 更新 {table} 失敗: {e}")
+        return False
 
-            try:
-                if period_type == 'D':
-                    inst = pd.read_sql(text(f"SELECT symbol, foreign_net, trust_net, dealer_net FROM institutional_investors WHERE date = '{latest_date_str}'"), conn)
-                    if not inst.empty:
-                        df = df.merge(inst, on='symbol', how='left')
-            except: pass
+def load_db_data(period_type):
+    engine = get_db_engine()
+    if not engine: return None, "資料庫連線失敗"
 
+    table, key_col, _ = SNAPSHOT_TABLES[period_type]
+    try:
+        with engine.connect() as conn:
+            df = pd.read_sql(text(f"SELECT * FROM {table} WHERE {key_col} = (SELECT MAX({key_col}) FROM {table})"), conn)
     except Exception as e:
         print(f"❌ 資料庫讀取錯誤: {e}")
         return None, f"資料庫錯誤: {str(e)}"
-    
-    for c in ['change_pct', 'volume', 'foreign_net', 'trust_net', 'dealer_net']:
+
+    if df.empty:
+        return None, "無資料"
+    latest_date_str = str(df[key_col].iat[0])
+
+    # 當日尚無法人資料時不顯示法人排行 (與舊版相同)
+    inst_cols = [c for c in INST_COLUMNS if c in df.columns]
+    if inst_cols and df[inst_cols].isna().all().all():
+        df = df.drop(columns=inst_cols)
+    for c in INST_COLUMNS:
         if c in df.columns: df[c] = df[c].fillna(0)
-    
-    df['turnover_billion'] = (df['close'] * df['volume']) / 100000000
-    
+
     return df, latest_date_str
 
 # ===========================
 # 5. 市場寬度運算 (MA排列 + 200日新高低)
 # ===========================
+MA_BREADTH_WARMUP = 59  # 60MA 需要前 59 個交易日的收盤價當暖機
+MA_BREADTH_FFILL_LIMIT = 59  # 停牌時延用前收盤的上限 (交易日)；超過就不再計入分母
+MA_BREADTH_MA_DECIMALS = 6   # 均線先四捨五入再比大小：rolling 累加的浮點誤差取決於資料起點，不捨入時回補與增量的結果會有 1 檔差異
+
+def compute_ma_alignment_counts(close_matrix):
+    """由 date × symbol 收盤價矩陣 (已向前填充) 計算每日短/長線多空排列家數"""
+    # 加入 min_periods=1：剛上市資料筆數不夠時，也能及早給出均線數值
+    ma5 = close_matrix.rolling(window=5, min_periods=1).mean().round(MA_BREADTH_MA_DECIMALS)
+    ma10 = close_matrix.rolling(window=10, min_periods=1).mean().round(MA_BREADTH_MA_DECIMALS)
+    ma20 = close_matrix.rolling(window=20, min_periods=1).mean().round(MA_BREADTH_MA_DECIMALS)
+    ma60 = close_matrix.rolling(window=60, min_periods=1).mean().round(MA_BREADTH_MA_DECIMALS)
+
+    return pd.DataFrame({
+        'short_bull': ((ma5 > ma10) & (ma10 > ma20)).sum(axis=1),
+        'short_bear': ((ma5 < ma10) & (ma10 < ma20)).sum(axis=1),
+        'long_bull': ((ma10 > ma20) & (ma20 > ma60)).sum(axis=1),
+        'long_bear': ((ma10 < ma20) & (ma20 < ma60)).sum(axis=1),
+        # 有效股票總數：近 MA_BREADTH_FFILL_LIMIT + 1 個交易日內有收盤價的股票 (向前填充以此為上限，長期停牌 / 下市不再計入)
+        'total_stocks': close_matrix.notna().sum(axis=1),
+    })
+
+def update_market_breadth_ma_db():
+    """
+    增量更新 market_breadth_ma (每日多空排列家數與比例)
+    只抓「新交易日 + 前 59 + 59 個交易日暖機」(均線視窗 + 向前填充上限) 的收盤價，算完新日期後 append
+    """
+    print("🔍 [MA排列寬度] 正在增量更新 market_breadth_ma...")
+    engine = get_db_engine()
+    if not engine: return False
+
+    # 日曆天：118 個交易日暖機約需 170 天，再留春節等長假的餘裕
+    start_date = (datetime.now() - timedelta(days=LOOKBACK_DAYS + 200)).strftime("%Y-%m-%d")
+    try:
+        with engine.connect() as conn:
+            dates_df = pd.read_sql(text(f"SELECT DISTINCT date FROM stock_prices WHERE date >= '{start_date}' ORDER BY date"), conn)
+            if dates_df.empty:
+                print("⚠️ 股價資料庫無資料，跳過 MA 排列寬度計算。")
+                return False
+            available_dates = pd.to_datetime(dates_df['date']).dt.normalize().tolist()
+
+            check_table = text("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'market_breadth_ma')")
+            latest_calc_date = None
+            if conn.execute(check_table).scalar():
+                max_date = conn.execute(text("SELECT MAX(date) FROM market_breadth_ma")).scalar()
+                if max_date is not None: latest_calc_date = pd.to_datetime(max_date)
+
+            if latest_calc_date is None:
+                print(f"   🆕 找不到歷史計算紀錄，初始化 (計算近 {LOOKBACK_DAYS} 天)...")
+                target_start = pd.to_datetime((datetime.now() - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d"))
+                target_dates = [d for d in available_dates if d >= target_start]
+            else:
+                target_dates = [d for d in available_dates if d > latest_calc_date]
+
+            if not target_dates:
+                print("   ✨ MA 排列寬度已是最新，無需更新。")
+                return True
+            print(f"   ⚙️ 發現 {len(target_dates)} 天新數據需要計算。")
+
+            first_idx = available_dates.index(target_dates[0])
+            fetch_start_date = available_dates[max(0, first_idx - MA_BREADTH_WARMUP - MA_BREADTH_FFILL_LIMIT)].strftime('%Y-%m-%d')
+            fetch_end_date = target_dates[-1].strftime('%Y-%m-%d')
+            df = pd.read_sql(text(f"""
+                SELECT date, symbol, close FROM stock_prices
+                WHERE date >= '{fetch_start_date}' AND date <= '{fetch_end_date}'
+            """), conn)
+
+        if df.empty: return False
+
+        # 確保時間格式乾淨 (去除可能的時區干擾)
+        df['date'] = pd.to_datetime(df['date']).dt.normalize()
+        # 向前填充：某天沒有收盤價時延用前一天的價格，避免 rolling 產生斷層
+        # 最多延用 MA_BREADTH_FFILL_LIMIT 天，且暖機多抓同樣天數：60MA 視窗內的值只取決於前 119 天的資料，初始回補與每日增量結果一致
+        close_matrix = df.pivot(index='date', columns='symbol', values='close').sort_index().ffill(limit=MA_BREADTH_FFILL_LIMIT)
+
+        res = compute_ma_alignment_counts(close_matrix)
+        res = res[res.index.isin(target_dates)]
+        total_stocks = res['total_stocks'].replace(0, 1)
+        for col in ['short_bull', 'short_bear', 'long_bull', 'long_bear']:
+            res[f'{col}_pct'] = (res[col] / total_stocks) * 100
+
+        res = res.rename_axis('date').reset_index()
+        res['date'] = res['date'].dt.date
+        print(f"   💾 將 {len(res)} 筆 MA 排列寬度寫入資料庫...")
+        res.to_sql('market_breadth_ma', engine, if_exists='append', index=False)
+        return True
+    except Exception as e:
+        print(f"❌ 更新 MA 排列寬度資料庫失敗: {e}")
+        return False
+
 def calculate_market_breadth_html():
-    print("📊 正在計算全市場多空排列 (MA)...")
+    print("📊 正在繪製全市場多空排列 (MA)...")
     engine = get_db_engine()
     if not engine: return "<p>資料庫連線失敗</p>"
 
-    # 往前多抓 120 天作為均線的「暖機期」
-    start_date = (datetime.now() - timedelta(days=LOOKBACK_DAYS + 120)).strftime("%Y-%m-%d")
-    
+    # 只讀取預先彙總好的每日家數比例 (約 250 筆)，不再撈全市場價格矩陣
+    target_start = (datetime.now() - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d")
     try:
         with engine.connect() as conn:
-            df = pd.read_sql(text(f"SELECT date, symbol, close FROM stock_prices WHERE date >= '{start_date}'"), conn)
+            res = pd.read_sql(text(f"""
+                SELECT date, short_bull_pct, short_bear_pct, long_bull_pct, long_bear_pct
+                FROM market_breadth_ma WHERE date >= '{target_start}' ORDER BY date
+            """), conn)
     except:
         return "<div class='error-msg'>資料讀取失敗</div>"
 
-    if df.empty: return "<p>資料不足</p>"
-
-    # 確保時間格式乾淨 (去除可能的時區干擾)
-    df['date'] = pd.to_datetime(df['date']).dt.normalize()
-    close_matrix = df.pivot(index='date', columns='symbol', values='close')
-    
-    # 【關鍵修復 1】向前填充 (Forward Fill)
-    # 如果某天某檔股票沒有收盤價(NaN)，自動延用前一天的價格，避免 rolling 產生長達數十天的斷層
-    close_matrix = close_matrix.ffill()
-
-    # 【關鍵修復 2】加入 min_periods=1
-    # 就算剛開始資料筆數不夠，也能及早給出均線數值，不會全部都是 NaN
-    ma5 = close_matrix.rolling(window=5, min_periods=1).mean()
-    ma10 = close_matrix.rolling(window=10, min_periods=1).mean()
-    ma20 = close_matrix.rolling(window=20, min_periods=1).mean()
-    ma60 = close_matrix.rolling(window=60, min_periods=1).mean()
-
-    short_bull = ((ma5 > ma10) & (ma10 > ma20)).sum(axis=1)
-    short_bear = ((ma5 < ma10) & (ma10 < ma20)).sum(axis=1)
-    long_bull = ((ma10 > ma20) & (ma20 > ma60)).sum(axis=1)
-    long_bear = ((ma10 < ma20) & (ma20 < ma60)).sum(axis=1)
-    
-    # 計算有效股票總數 (排除完全沒資料的股票)
-    total_stocks = close_matrix.notna().sum(axis=1).replace(0, 1)
-    
-    res = pd.DataFrame({
-        'short_bull_pct': (short_bull / total_stocks) * 100,
-        'short_bear_pct': (short_bear / total_stocks) * 100,
-        'long_bull_pct': (long_bull / total_stocks) * 100,
-        'long_bear_pct': (long_bear / total_stocks) * 100
-    })
+    if res.empty: return "<p>資料不足</p>"
+    res['date'] = pd.to_datetime(res['date']).dt.normalize()
+    res = res.set_index('date')
     
     # 【關鍵修復 3】安全合併加權指數 (TWII)
     try:
-        twii = yf.download("^TWII", start=start_date, progress=False)
+        twii = yf.download("^TWII", start=target_start, progress=False)
         if not twii.empty:
             if isinstance(twii.columns, pd.MultiIndex):
                 try: twii_close = twii.xs('Close', axis=1, level=0)
@@ -294,10 +353,6 @@ def calculate_market_breadth_html():
         else: res['TWII'] = 0
     except: res['TWII'] = 0
     
-    # 移除暖機期的資料，只保留我們真正要畫圖的區間 (LOOKBACK_DAYS)
-    target_start = pd.to_datetime((datetime.now() - timedelta(days=LOOKBACK_DAYS)).strftime("%Y-%m-%d"))
-    res = res[res.index >= target_start]
-    
     # 確保最終沒有異常的 NaN
     res = res.dropna()
 
@@ -322,7 +377,9 @@ def calculate_market_breadth_html():
         paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)',
         legend=dict(orientation="h", y=1.05, x=0.5, xanchor="center", bgcolor="rgba(0,0,0,0)")
     )
-    return fig.to_html(full_html=False, include_plotlyjs='cdn', config={'displayModeBar': False})
+    note = (f'<p style="font-size: 0.8em; color: #888; margin: 4px 0 0;">※ 比例分母為近 {MA_BREADTH_FFILL_LIMIT + 1} 個交易日內有收盤價的股票數；'
+            '停牌超過此期間或已下市的股票不計入 (舊版會持續計入抓取區間內出現過的所有股票)</p>')
+    return fig.to_html(full_html=False, include_plotlyjs='cdn', config={'displayModeBar': False}, div_id="breadth-ma-chart") + note
 
 def update_market_breadth_db():
     print("🔍 [200日寬度] 正在智慧更新 200日新高/低資料庫...")
@@ -336,7 +393,7 @@ def update_market_breadth_db():
                 print("⚠️ 股價資料庫無資料，跳過寬度計算。")
                 return False
                 
-            available_dates = pd.to_datetime(dates_df['date']).sort_values().tolist()
+            available_dates = pd.to_datetime(dates_df['date']).sort_values().dt.strftime('%Y-%m-%d').tolist()
             
             check_table = text("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'market_breadth')")
             table_exists = conn.execute(check_table).scalar()
@@ -345,7 +402,7 @@ def update_market_breadth_db():
             if table_exists:
                 latest_df = pd.read_sql("SELECT MAX(date) as max_date FROM market_breadth", conn)
                 if not latest_df.empty and pd.notnull(latest_df.iloc[0]['max_date']):
-                    latest_calc_date = pd.to_datetime(latest_df.iloc[0]['max_date'])
+                    latest_calc_date = pd.to_datetime(latest_df.iloc[0]['max_date']).strftime('%Y-%m-%d')
             
             if latest_calc_date is None:
                 print("   🆕 找不到歷史計算紀錄，初始化 (計算近60天)...")
@@ -358,13 +415,17 @@ def update_market_breadth_db():
                 return True
                 
             print(f"   ⚙️ 發現 {len(target_dates)} 天新數據需要計算。")
-            
-            first_target = target_dates[0]
-            first_target_idx = available_dates.index(first_target)
-            start_idx = max(0, first_target_idx - 200)
-            
-            fetch_start_date = available_dates[start_idx].strftime('%Y-%m-%d')
-            fetch_end_date = target_dates[-1].strftime('%Y-%m-%d')
+
+            # 狀態與寬度表同步 → 只需新交易日的收盤價；否則從 200 日視窗起點重建狀態
+            state_as_of, state = price_extremes.load_extreme_state(conn)
+            first_target_idx = available_dates.index(target_dates[0])
+            if state_as_of is not None and state_as_of == latest_calc_date:
+                fetch_start_date = target_dates[0]
+            else:
+                print("   🧮 重建 200 日新高/低佇列狀態...")
+                state = {}
+                fetch_start_date = price_extremes.window_start_for(available_dates, first_target_idx)
+            fetch_end_date = target_dates[-1]
             
             query_prices = text(f"""
                 SELECT symbol, date, close
@@ -380,33 +441,27 @@ def update_market_breadth_db():
                 
             df_raw = pd.concat(chunks, ignore_index=True)
 
-        # 進行運算 (不需要放在 connection block 內)
-        df_raw['date'] = pd.to_datetime(df_raw['date'])
-        pivot_df = df_raw.pivot(index='date', columns='symbol', values='close').sort_index()
-
-        max_200 = pivot_df.rolling(window=200, min_periods=1).max()
-        min_200 = pivot_df.rolling(window=200, min_periods=1).min()
-
-        is_new_high = (pivot_df >= max_200) & pivot_df.notna()
-        is_new_low = (pivot_df <= min_200) & pivot_df.notna()
-
-        result_df = pd.DataFrame({
-            'date': pivot_df.index,
-            'new_highs': is_new_high.sum(axis=1),
-            'new_lows': is_new_low.sum(axis=1),
-            'total_stocks': pivot_df.notna().sum(axis=1)
-        })
-
-        result_df['total_signals'] = result_df['new_highs'] + result_df['new_lows']
-        result_df['net_ratio'] = ((result_df['new_highs'] - result_df['new_lows']) / result_df['total_signals'].replace(0, pd.NA)) * 100
-        result_df['net_ratio'] = result_df['net_ratio'].fillna(0).round(2)
-
-        final_insert_df = result_df[result_df['date'].isin(target_dates)].copy()
-        final_insert_df = final_insert_df.drop(columns=['total_signals'])
-        final_insert_df['date'] = final_insert_df['date'].dt.date
-
-        print(f"   💾 將 {len(final_insert_df)} 筆寬度結果寫入資料庫...")
-        final_insert_df.to_sql('market_breadth', engine, if_exists='append', index=False)
+        # 進行運算 (不需要放在 connection block 內)：逐日推進單調佇列，每天只看當天收盤價
+        target_set = set(target_dates)
+        rows, flags, closes = [], {}, {}
+        for date_str, closes in price_extremes.closes_by_date(df_raw).items():
+            window_start = price_extremes.window_start_for(available_dates, available_dates.index(date_str))
+            flags = price_extremes.advance_extremes(state, date_str, closes, window_start)
+            if date_str in target_set:
+                rows.append({
+                    'date': pd.to_datetime(date_str).date(),
+                    'new_highs': sum(h for h, _ in flags.values()),
+                    'new_lows': sum(l for _, l in flags.values()),
+                    'total_stocks': len(closes),
+                })
+
+        result_df = pd.DataFrame(rows)
+        total_signals = (result_df['new_highs'] + result_df['new_lows']).replace(0, pd.NA)
+        result_df['net_ratio'] = ((result_df['new_highs'] - result_df['new_lows']) / total_signals * 100).astype(float).fillna(0).round(2)
+
+        print(f"   💾 將 {len(result_df)} 筆寬度結果寫入資料庫...")
+        result_df.to_sql('market_breadth', engine, if_exists='append', index=False)
+        price_extremes.save_extreme_state(engine, state, fetch_end_date, flags, closes)
         return True
     except Exception as e:
         print(f"❌ 更新200日寬度資料庫失敗: {e}")
@@ -460,7 +515,7 @@ def generate_200d_breadth_html():
         fig.update_yaxes(title_text="多空比 (%)", showgrid=False, zeroline=True, zerolinecolor='rgba(52, 152, 219, 0.5)', zerolinewidth=2, secondary_y=True)
 
         # 此處 include_plotlyjs=False，因為上面的 MA 圖已經載入過了
-        return fig.to_html(full_html=False, include_plotlyjs=False, config={'displayModeBar': False})
+        return fig.to_html(full_html=False, include_plotlyjs=False, config={'displayModeBar': False}, div_id="breadth-200d-chart")
     except Exception as e:
         print(f"❌ 產生200日寬度圖表失敗: {e}")
         return ""
@@ -518,7 +573,7 @@ def generate_sector_turnover_html(df):
         paper_bgcolor='rgba(0,0,0,0)',
         showlegend=False
     )
-    pie_html = fig.to_html(full_html=False, include_plotlyjs=False, config={'displayModeBar': False})
+    pie_html = fig.to_html(full_html=False, include_plotlyjs=False, config={'displayModeBar': False}, div_id="sector-pie-chart")
 
     table_html = f'''
     <div class="card">
@@ -568,95 +623,54 @@ def generate_sector_turnover_html(df):
     </div>
     """
 
-def get_ranking_html(df, title, sort_col, ascend, value_fmt_func=None, limit=TOP_N, show_rank=True):
-    if df is None or df.empty or sort_col not in df.columns: return ""
-    df_sorted = df.sort_values(sort_col, ascending=ascend).head(limit).copy()
-    
-    html = f'''<div class="card"><h3>{title}</h3><div class="table-wrapper"><table><thead><tr>{'<th>排名</th>' if show_rank else ''}<th>名稱</th><th>產業</th><th>收盤</th><th>漲跌</th><th>成交量</th><th>數值</th></tr></thead><tbody>'''
-    
-    for i, row in enumerate(df_sorted.itertuples(), 1):
-        sym = row.symbol
-        name = getattr(row, 'name', sym)
-        ind = getattr(row, 'industry', '')
-        if not ind or pd.isna(ind): ind = ''
-        
-        close = row.close
-        pct = row.change_pct
-        vol = row.volume
-        target_val = getattr(row, sort_col)
-        
-        link = get_yahoo_link(sym, name)
-        is_idx = True if sym.startswith("^") or sym.endswith(".SS") or sym == "VIXTWN" else False
-        
-        close_str = format_number(close, is_price=True, is_idx=is_idx)
-        pct_str = f"{pct:+.2f}%"
-        vol_str = format_number(vol) if not is_idx else "-"
-        target_str = str(target_val)
-        if value_fmt_func:
-            try: target_str = value_fmt_func(target_val)
-            except: pass
-        
-        pct_style = get_color_style(pct)
-        target_style = get_color_style(target_val) if sort_col in ['change_pct', 'foreign_net', 'trust_net', 'dealer_net'] else ""
-
-        ind_html = f'<span class="ind-badge">{ind}</span>' if ind and not is_idx else ''
-
-        html += f'''<tr>{'<td>' + str(i) + '</td>' if show_rank else ''}<td>{link}</td><td>{ind_html}</td><td>{close_str}</td><td {pct_style}>{pct_str}</td><td>{vol_str}</td><td {target_style}><strong>{target_str}</strong></td></tr>'''
-    html += '</tbody></table></div></div>'
-    return html
-
 def generate_tab_content(period_type):
+    """回傳 (分頁 HTML 外框, 排行榜 payload)；讀取失敗時 payload 為 None"""
     df, raw_date_str = load_db_data(period_type)
     display_date = format_display_date(raw_date_str, period_type)
     
-    if df is None: return f"<div class='error-msg'>資料讀取錯誤: {raw_date_str}</div>"
-    
-    html_parts = []
+    if df is None: return f"<div class='error-msg'>資料讀取錯誤: {raw_date_str}</div>", None
     
     df_indices = fetch_indices_data()
+    index_table = None
     if not df_indices.empty:
-        html_parts.append(get_ranking_html(df_indices, "🌏 亞洲股市 & VIX", "symbol", True, lambda x: "", limit=10, show_rank=False))
+        index_table = ranking_table(ranking_arrays(df_indices), "🌏 亞洲股市 & VIX", "symbol", True, lambda x: "", limit=10, show_rank=False)
 
-    df_core = df[df['symbol'].isin(CORE_WEIGHTS)]
-    df_no_etf = df[~df['symbol'].str.startswith('00')]
-    df_top_val = df_no_etf.sort_values('turnover_billion', ascending=False).head(12)
-    df_watch = pd.concat([df_core, df_top_val]).drop_duplicates(subset=['symbol'])
-    html_parts.append(get_ranking_html(df_watch, "👀 權值觀察", "turnover_billion", False, lambda x: f"{x:.2f} 億", limit=15))
-
-    html_parts.append(get_ranking_html(df, "👑 高價股", "close", False, lambda x: f"${x:,.0f}", limit=50))
+    # 整個分頁只轉換一次欄位陣列；各排行榜以列索引子集合 + argpartition 取前 N 名
+    arrays = ranking_arrays(df)
+    symbols = arrays['symbol'].astype(str)
+    is_etf = np.char.startswith(symbols, '00')
+    top_val = top_n_indices(arrays['turnover_billion'], 12, False, subset=np.flatnonzero(~is_etf))
+    watch_idx = np.union1d(np.flatnonzero(np.isin(symbols, CORE_WEIGHTS)), top_val)
 
     min_vol = 500000 if period_type == 'D' else 100000
-    df_active = df[df['volume'] > min_vol]
-    if df_active.empty: df_active = df 
-
-    html_parts.append(get_ranking_html(df_active, "🚀 強勢股", "change_pct", False, lambda x: f"{x:+.2f}%"))
-    html_parts.append(get_ranking_html(df_active, "📉 弱勢股", "change_pct", True, lambda x: f"{x:+.2f}%"))
-    html_parts.append(get_ranking_html(df, "🔥 熱門量", "volume", False, lambda x: f"{int(x/1000):,} 張"))
-    html_parts.append(get_ranking_html(df, "💰 成交值", "turnover_billion", False, lambda x: f"{x:.2f} 億"))
+    active_idx = np.flatnonzero(arrays['volume'] > min_vol)
+    if len(active_idx) == 0: active_idx = None
+
+    lots = lambda x: f"{int(x/1000):,} 張"
+    tables = [
+        ranking_table(arrays, "👀 權值觀察", "turnover_billion", False, lambda x: f"{x:.2f} 億", limit=15, subset=watch_idx),
+        ranking_table(arrays, "👑 高價股", "close", False, lambda x: f"${x:,.0f}", limit=50),
+        ranking_table(arrays, "🚀 強勢股", "change_pct", False, lambda x: f"{x:+.2f}%", subset=active_idx),
+        ranking_table(arrays, "📉 弱勢股", "change_pct", True, lambda x: f"{x:+.2f}%", subset=active_idx),
+        ranking_table(arrays, "🔥 熱門量", "volume", False, lots),
+        ranking_table(arrays, "💰 成交值", "turnover_billion", False, lambda x: f"{x:.2f} 億"),
+    ]
     
     if 'foreign_net' in df.columns:
-        html_parts.append(get_ranking_html(df, "✈️ 外資買超", "foreign_net", False, lambda x: f"{int(x/1000):,} 張"))
-        html_parts.append(get_ranking_html(df, "💸 外資賣超", "foreign_net", True, lambda x: f"{int(x/1000):,} 張"))
-        html_parts.append(get_ranking_html(df, "🏦 投信買超", "trust_net", False, lambda x: f"{int(x/1000):,} 張"))
-        html_parts.append(get_ranking_html(df, "📉 投信賣超", "trust_net", True, lambda x: f"{int(x/1000):,} 張"))
-        html_parts.append(get_ranking_html(df, "📊 自營買超", "dealer_net", False, lambda x: f"{int(x/1000):,} 張"))
-        html_parts.append(get_ranking_html(df, "📉 自營賣超", "dealer_net", True, lambda x: f"{int(x/1000):,} 張"))
+        tables += [
+            ranking_table(arrays, "✈️ 外資買超", "foreign_net", False, lots),
+            ranking_table(arrays, "💸 外資賣超", "foreign_net", True, lots),
+            ranking_table(arrays, "🏦 投信買超", "trust_net", False, lots),
+            ranking_table(arrays, "📉 投信賣超", "trust_net", True, lots),
+            ranking_table(arrays, "📊 自營買超", "dealer_net", False, lots),
+            ranking_table(arrays, "📉 自營賣超", "dealer_net", True, lots),
+        ]
 
     sector_html = ""
     if period_type == 'D':
         sector_html = generate_sector_turnover_html(df)
 
-    final_html = f"<h2>統計日期: {display_date}</h2>"
-    
-    if not df_indices.empty:
-         final_html += f'<div class="grid-container" style="grid-template-columns: 1fr;">{html_parts[0]}</div>'
-         html_parts = html_parts[1:]
-    
-    if sector_html:
-        final_html += sector_html
-
-    final_html += '<div class="grid-container">' + "".join(html_parts) + '</div>'
-    return final_html
+    return render_tab(display_date, period_type, index_table=index_table, sector_html=sector_html), tab_payload(tables)
 
 # ===========================
 # 7. 主程式
@@ -664,17 +678,31 @@ def generate_tab_content(period_type):
 def main():
     print("🚀 正在生成台股戰情日報 (整合 200日新高/低 寬度)...")
     
-    # 步驟一：確保 200日寬度資料庫是最新的
+    # 步驟一：確保 200日寬度與 MA 排列寬度資料庫是最新的
     update_market_breadth_db()
+    update_market_breadth_ma_db()
+
+    # 步驟二：物化日 / 週 / 月快照，供下方各分頁直接讀取
+    for period_type in SNAPSHOT_TABLES:
+        update_snapshot_db(period_type)
     
     # 取得當日日期字串
     now = datetime.now()
     date_str = now.strftime("%Y-%m-%d")
     
+    yyyy = now.strftime("%Y")
+    mm = now.strftime("%m")
+    yyyymmdd = now.strftime("%Y%m%d")
+    archive_filename = f"tw_market_dashboard_{yyyymmdd}.html"
+    data_filename = f"tw_market_data_{yyyymmdd}.json"
+    
     # 生成各區塊圖表
     market_breadth_ma_chart = calculate_market_breadth_html()
     market_breadth_200d_chart = generate_200d_breadth_html()
     
+    # 各分頁外框 + 排行榜 payload (排行榜資料另存 JSON，由共用的 RANKING_JS 載入)
+    tabs = {period_type: generate_tab_content(period_type) for period_type in ('D', 'W', 'M')}
+    
     html_template = f"""
     <!DOCTYPE html>
     <html ="zh-TW">
@@ -753,13 +781,15 @@ def main():
                 {market_breadth_200d_chart}
             </div>
             
-            {generate_tab_content('D')}
+            {tabs['D'][0]}
         </div>
         
-        <div id="weekly" class="tab-content">{generate_tab_content('W')}</div>
-        <div id="monthly" class="tab-content">{generate_tab_content('M')}</div>
+        <div id="weekly" class="tab-content">{tabs['W'][0]}</div>
+        <div id="monthly" class="tab-content">{tabs['M'][0]}</div>
         
-        <script>
+        <script data-shared>{RANKING_JS}</script>
+        <script>loadRankTables("{data_filename}");</script>
+        <script data-shared>
             function openTab(id) {{
                 document.querySelectorAll('.tab-content').forEach(d => d.classList.remove('active'));
                 document.querySelectorAll('.tab-btn').forEach(b => b.classList.remove('active'));
@@ -771,46 +801,16 @@ def main():
     </html>
     """
     
-    # 輸出邏輯
-    yyyy = now.strftime("%Y")
-    mm = now.strftime("%m")
-    yyyymmdd = now.strftime("%Y%m%d")
-    
-    # 1. 建立目錄
-    archive_dir = os.path.join(BASE_OUTPUT_DIR, yyyy, mm)
-    os.makedirs(archive_dir, exist_ok=True)
-    
-    # 2. 定義檔名
-    archive_filename = f"tw_market_dashboard_{yyyymmdd}.html"
-    archive_path = os.path.join(archive_dir, archive_filename)
- # 3. 寫入報表
-    with open(archive_path, "w", encoding="utf-8") as f:
-        f.write(html_template)
-    
-    print(f"✅ [歸檔] 報表已生成：{archive_path}")
+    # 輸出邏輯：共用 CSS / JS 抽成雜湊 asset，內容沒變的檔案不重寫，並輸出 .gz / .br
+    archive_rel = f"{yyyy}/{mm}/{archive_filename}"
+    publish_json(BASE_OUTPUT_DIR, f"{yyyy}/{mm}/{data_filename}", {pt: payload for pt, (_, payload) in tabs.items() if payload is not None})
+    publish_html(BASE_OUTPUT_DIR, archive_rel, html_template, "tw_dashboard")
+    print(f"✅ [歸檔] 報表已生成：{os.path.join(BASE_OUTPUT_DIR, archive_rel)}")
 
-    # 4. 更新 Current 捷徑
-    current_path = os.path.join(BASE_OUTPUT_DIR, "tw_market_dashboard_current.html")
-    rel_path = f"./{yyyy}/{mm}/{archive_filename}"
-    
-    redirect_html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <meta http-equiv="refresh" content="0; url={rel_path}" />
-      <title>Redirecting.</title>
-    </head>
-    <body>
-        <p>正在載入今日最新報表... <a href="{rel_path}">點擊這裡</a></p>
-    </body>
-    </html>
-    """
-    
-    with open(current_path, "w", encoding="utf-8") as f:
-        f.write(redirect_html)
-        
-    print(f"✅ [捷徑] current 頁面已更新：{current_path} -> {rel_path}")
+    # 更新 Current 捷徑
+    publish_redirect(BASE_OUTPUT_DIR, "tw_market_dashboard_current.html", archive_rel)
+    print(f"✅ [捷徑] current 頁面已更新：-> ./{archive_rel}")
+    print_publish_stats()
 
 if __name__ == "__main__":
     main()
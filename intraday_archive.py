@@ -0,0 +1,157 @@
+import glob
+import os
+import time
+
+import pandas as pd
+import yfinance as yf
+
+# ===========================
+# 盤中 K 棒資料庫 (只追加，不覆蓋)；Yahoo 5 分 K 由這裡下載，intraday_collector.py 的 1 / 5 分 K 用同一套格式另存 data/intraday_twse_*
+# - 每個週期、每個代號一個資料夾，依月份切檔：data/intraday_5m/<代號>/YYYY-MM.parquet (Parquet 欄式儲存，需要 pyarrow)
+# - 寫入時以 datetime 去重 (同一根 K 棒以新下載的為準)，只重寫有新資料的月份
+# - 多個代號一次 yf.download；Yahoo 5 分 K 最多回溯 60 天，沒有歷史的代號第一次就抓滿 60 天
+# - read_bars：只讀涵蓋查詢區間的月份檔，可指定欄位，給練習器匯出與回測用
+# 時間一律存成 Asia/Taipei 時區
+# ===========================
+TZ = "Asia/Taipei"
+INTERVAL = "5m"
+INITIAL_PERIOD = "60d"    # Yahoo 5 分 K 可回溯的上限
+UPDATE_PERIOD = "5d"      # 一般每日更新：多抓幾天，漏跑的日子會自動補上
+BATCH_SIZE = 50
+COLUMNS = ["datetime", "open", "high", "low", "close", "volume"]
+
+# 預設代號；可用環境變數 INTRADAY_SYMBOLS="^TWII,2330.TW" 或命令列參數覆寫
+DEFAULT_SYMBOLS = ["^TWII", "0050.TW", "2330.TW"]
+
+
+def archive_dir(interval):
+    # 各週期 (與來源) 分開存：data/intraday_5m (Yahoo)、data/intraday_twse_1m ...
+    return os.path.join("data", f"intraday_{interval}")
+
+
+ARCHIVE_DIR = archive_dir(INTERVAL)
+
+
+def configured_symbols():
+    env = os.environ.get("INTRADAY_SYMBOLS")
+    return [s.strip() for s in env.split(",") if s.strip()] if env else list(DEFAULT_SYMBOLS)
+
+
+def symbol_dir(symbol, base_dir=ARCHIVE_DIR):
+    safe = symbol.replace("^", "_IDX_").replace("=", "_EQ_").replace("/", "_")
+    return os.path.join(base_dir, safe)
+
+
+def month_path(symbol, month, base_dir=ARCHIVE_DIR):
+    return os.path.join(symbol_dir(symbol, base_dir), f"{month}.parquet")
+
+
+def _to_local(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize(TZ) if ts.tzinfo is None else ts.tz_convert(TZ)
+
+
+def _split_download(data, symbols):
+    """yf.download 的結果拆成 {symbol: 標準欄位 DataFrame (datetime 為台北時間)}"""
+    out = {}
+    if data is None or data.empty: return out
+    multi = isinstance(data.columns, pd.MultiIndex)
+    for sym in symbols:
+        try:
+            sub = data.xs(sym, axis=1, level=1) if multi else data
+        except KeyError:
+            continue
+        sub = sub.rename(columns=str.lower)[COLUMNS[1:]].dropna(subset=["close"])
+        if sub.empty: continue
+        idx = sub.index if sub.index.tz is not None else sub.index.tz_localize("UTC")
+        sub = sub.set_axis(idx.tz_convert(TZ).rename("datetime")).reset_index()
+        out[sym] = sub[COLUMNS]
+    return out
+
+
+def download(symbols, period):
+    bars = {}
+    for i in range(0, len(symbols), BATCH_SIZE):
+        chunk = symbols[i:i + BATCH_SIZE]
+        data = pd.DataFrame()
+        for attempt in range(3):
+            try:
+                data = yf.download(chunk, period=period, interval=INTERVAL, progress=False,
+                                   auto_adjust=False, threads=True, group_by="column")
+                if not data.empty: break
+            except Exception as e:
+                print(f"   ⚠️ 下載失敗 (第 {attempt + 1} 次): {e}")
+            time.sleep(1)
+        bars.update(_split_download(data, chunk))
+    return bars
+
+
+def has_history(symbol, base_dir=ARCHIVE_DIR):
+    return bool(glob.glob(os.path.join(symbol_dir(symbol, base_dir), "*.parquet")))
+
+
+def append_bars(symbol, bars, base_dir=ARCHIVE_DIR):
+    """把新 K 棒併入各月份檔 (以 datetime 去重，新資料為準)；回傳實際新增的 K 棒數"""
+    if bars.empty: return 0
+    bars = bars[COLUMNS].copy()
+    bars["datetime"] = pd.to_datetime(bars["datetime"]).dt.tz_convert(TZ)
+    os.makedirs(symbol_dir(symbol, base_dir), exist_ok=True)
+
+    added = 0
+    for month, part in bars.groupby(bars["datetime"].dt.strftime("%Y-%m")):
+        path = month_path(symbol, month, base_dir)
+        old = pd.read_parquet(path) if os.path.exists(path) else None
+        merged = part if old is None else pd.concat([old, part])
+        merged = merged.drop_duplicates("datetime", keep="last").sort_values("datetime").reset_index(drop=True)
+        added += len(merged) - (0 if old is None else len(old))
+        if old is not None and merged.equals(old): continue
+
+        tmp_path = path + ".tmp"
+        merged.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return added
+
+
+def update_archive(symbols=None, base_dir=ARCHIVE_DIR):
+    """下載並追加；已有歷史的代號抓近 UPDATE_PERIOD，沒有的抓 INITIAL_PERIOD。回傳 {symbol: 新增根數}"""
+    symbols = symbols or configured_symbols()
+    groups = {}
+    for sym in symbols:
+        groups.setdefault(UPDATE_PERIOD if has_history(sym, base_dir) else INITIAL_PERIOD, []).append(sym)
+
+    added = {}
+    for period, group in groups.items():
+        print(f"🚀 下載 {len(group)} 檔 {INTERVAL} K 棒 (近 {period})...")
+        bars = download(group, period)
+        for sym in group:
+            added[sym] = append_bars(sym, bars[sym], base_dir) if sym in bars else 0
+    return added
+
+
+def read_bars(symbol, start=None, end=None, columns=None, base_dir=ARCHIVE_DIR):
+    """
+    讀取 [start, end] 區間的 K 棒 (含兩端；日期字串或 Timestamp，未帶時區視為台北時間)
+    只開啟區間涵蓋的月份檔；columns 可只讀部分欄位 (datetime 一定會讀)
+    """
+    start = _to_local(start) if start is not None else None
+    end = _to_local(end) if end is not None else None
+    if end is not None and end == end.normalize():
+        end = end + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)   # 只給日期時含當天整天
+
+    paths = sorted(glob.glob(os.path.join(symbol_dir(symbol, base_dir), "*.parquet")))
+    months = [os.path.splitext(os.path.basename(p))[0] for p in paths]
+    lo = start.strftime("%Y-%m") if start is not None else None
+    hi = end.strftime("%Y-%m") if end is not None else None
+    paths = [p for p, m in zip(paths, months) if (lo is None or m >= lo) and (hi is None or m <= hi)]
+
+    cols = None if columns is None else ["datetime"] + [c for c in columns if c != "datetime"]
+    if not paths: return pd.DataFrame(columns=cols or COLUMNS)
+    df = pd.concat([pd.read_parquet(p, columns=cols) for p in paths], ignore_index=True)
+    mask = pd.Series(True, index=df.index)
+    if start is not None: mask &= df["datetime"] >= start
+    if end is not None: mask &= df["datetime"] <= end
+    return df[mask].reset_index(drop=True)
+
+
+def read_day(symbol, day, base_dir=ARCHIVE_DIR):
+    return read_bars(symbol, day, day, base_dir=base_dir)
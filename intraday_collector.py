@@ -0,0 +1,277 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from fetch_pool import http_get, run_concurrently, set_host_limit
+from intraday_archive import TZ, append_bars, archive_dir
+
+# ===========================
+# 全市場盤中 K 棒收集器 (長時間執行)
+# - 每 POLL_SECONDS 秒向 mis.twse.com.tw 查一次全市場快照 (和 record_limit_up 相同的 API)
+# - 以每檔「累計成交量」的差額當作這段期間的量，成交價更新 1 分 / 5 分 K 的高低收
+# - 每檔的狀態存在 numpy 陣列 (每個週期 × 每檔一格)，2,000 檔只佔幾百 KB
+# - 已收盤的 K 棒先放記憶體，每 FLUSH_SECONDS 秒與收盤後批次寫入 intraday_archive 格式的獨立目錄 (data/intraday_twse_1m、data/intraday_twse_5m)；
+#   不與 Yahoo 5 分 K (data/intraday_5m) 共用檔案，兩個來源的成交量口徑不同，混在一起去重會變成誰後寫誰贏
+# - --record 會把精簡快照存成 jsonl.gz，之後可用 --replay 離線重建 K 棒 (測試 / 補資料用)
+# K 棒時間為該根起始時間 (與 Yahoo 相同)；時間來自快照的 tlong (成交時間)，重播結果與即時收集一致
+# 成交時間早於今日開盤 (SESSION_START) 的快照 = 還掛著前一盤的最後成交，整筆略過：不開 K 棒、也不當累計量的起點
+# ===========================
+MIS_API = "https://mis.twse.com.tw/stock/api/getStockInfo.jsp"
+INTERVALS = {"1m": 60, "5m": 300}
+POLL_SECONDS = 10
+FLUSH_SECONDS = 1800
+QUERY_BATCH = 100          # 每個請求查詢的代號數 (URL 長度限制)
+POLL_DEADLINE = 8
+SESSION_START = "09:00"
+SESSION_END = "13:35"      # 13:30 收盤集合競價後再多收幾分鐘
+SNAPSHOT_DIR = os.path.join("data", "intraday_snapshots")
+SNAPSHOT_FIELDS = ["c", "ex", "z", "v", "tlong"]
+SOURCE = "twse"            # 封存目錄前綴：data/intraday_twse_<週期>
+
+set_host_limit("mis.twse.com.tw", min_interval=0.1, max_concurrent=4)
+
+
+def market_symbols():
+    """twstock 全部 4 碼股票 → [(查詢頻道 tse_2330.tw, 資料庫代號 2330.TW), ...]"""
+    import twstock   # 只有即時收集需要，重播不必安裝
+    out = []
+    for code, info in twstock.codes.items():
+        if info.type != '股票' or len(code) != 4: continue
+        if info.market == '上市': out.append((f"tse_{code}.tw", f"{code}.TW"))
+        elif info.market == '上櫃': out.append((f"otc_{code}.tw", f"{code}.TWO"))
+    return out
+
+
+def _numeric(col):
+    return pd.to_numeric(col.astype(str).str.replace(",", "", regex=False), errors="coerce").to_numpy(dtype=float)
+
+
+def parse_snapshot(items):
+    """msgArray → (代號 list, 成交價, 累計量 (股), 成交時間 (epoch 秒))；沒有成交價的項目略過"""
+    if not items: return [], np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64)
+    df = pd.DataFrame.from_records(items, columns=SNAPSHOT_FIELDS)
+    price, cum_vol, tlong = _numeric(df["z"]), _numeric(df["v"]), _numeric(df["tlong"])
+    ok = ~(np.isnan(price) | np.isnan(tlong))
+    suffix = np.where(df["ex"].to_numpy() == "otc", ".TWO", ".TW")
+    symbols = (df["c"].astype(str).to_numpy(dtype=object) + suffix)[ok].tolist()
+    return symbols, price[ok], cum_vol[ok] * 1000, (tlong[ok] // 1000).astype(np.int64)   # 官方 API 量為「張」
+
+
+class BarBuilder:
+    """
+    單一週期的 K 棒累積器；每檔一格 (index 由 symbol_index 對應)
+    bucket = 目前這根的起始 epoch 秒 (-1 代表沒有未收盤的 K 棒)
+    """
+
+    def __init__(self, symbols, interval_s):
+        n = len(symbols)
+        self.symbols = list(symbols)
+        self.interval = interval_s
+        self.bucket = np.full(n, -1, dtype=np.int64)
+        self.last_closed = np.full(n, -1, dtype=np.int64)
+        self.ohlcv = np.zeros((n, 5))
+        self._closed = []   # [(index 陣列, bucket 陣列, ohlcv 陣列)]
+
+    def _close(self, mask):
+        idx = np.nonzero(mask)[0]
+        if not len(idx): return
+        self._closed.append((idx, self.bucket[idx].copy(), self.ohlcv[idx].copy()))
+        self.last_closed[idx] = self.bucket[idx]
+        self.bucket[idx] = -1
+
+    def update(self, idx, price, volume, ts):
+        """idx: 代號位置；volume: 這次新增的成交量；ts: 成交時間 (epoch 秒)"""
+        # 晚到的成交 (時間落在已收盤的 K 棒) 併入下一根，不重開舊 K 棒
+        b = ts // self.interval * self.interval
+        b = np.maximum(b, np.where(self.last_closed[idx] >= 0, self.last_closed[idx] + self.interval, b))
+
+        cur = self.bucket[idx]
+        roll = (cur >= 0) & (b > cur)
+        if roll.any():
+            mask = np.zeros(len(self.bucket), dtype=bool)
+            mask[idx[roll]] = True
+            self._close(mask)
+            cur = self.bucket[idx]
+
+        new = cur < 0
+        o, h, l, c, v = self.ohlcv[idx].T
+        self.ohlcv[idx] = np.column_stack([
+            np.where(new, price, o),
+            np.where(new, price, np.maximum(h, price)),
+            np.where(new, price, np.minimum(l, price)),
+            price,
+            np.where(new, 0.0, v) + volume,
+        ])
+        self.bucket[idx] = np.where(new, b, cur)
+
+    def close_due(self, now_s):
+        """市場時間已超過這根結束時間的 K 棒直接收盤 (沒有新成交的冷門股也會按時收)"""
+        self._close((self.bucket >= 0) & (self.bucket + self.interval <= now_s))
+
+    def close_all(self):
+        self._close(self.bucket >= 0)
+
+    def take_closed(self):
+        """取出並清空已收盤的 K 棒：DataFrame(symbol, datetime, open, high, low, close, volume)"""
+        if not self._closed:
+            return pd.DataFrame(columns=["symbol", "datetime", "open", "high", "low", "close", "volume"])
+        idx = np.concatenate([c[0] for c in self._closed])
+        buckets = np.concatenate([c[1] for c in self._closed])
+        ohlcv = np.concatenate([c[2] for c in self._closed])
+        self._closed = []
+        df = pd.DataFrame(ohlcv, columns=["open", "high", "low", "close", "volume"])
+        df.insert(0, "datetime", pd.to_datetime(buckets, unit="s", utc=True).tz_convert(TZ))
+        df.insert(0, "symbol", np.asarray(self.symbols, dtype=object)[idx])
+        return df
+
+
+class IntradayCollector:
+    """
+    count_initial_volume：第一次看到某檔時，是否把當時的累計量算進第一根 (開盤前就啟動 = True)
+    last_cum / last_ts：每檔上一次的累計量與成交時間，只有成交時間往前走或量增加才算新成交
+    session_start：本盤開盤的 epoch 秒；成交時間更早的項目 (前一盤的舊資料) 一律略過
+    """
+
+    def __init__(self, symbols, intervals=INTERVALS, count_initial_volume=True, archive_root=None, session_start=None):
+        self.symbol_index = {s: i for i, s in enumerate(symbols)}
+        self.builders = {name: BarBuilder(symbols, sec) for name, sec in intervals.items()}
+        self.count_initial_volume = count_initial_volume
+        self.archive_root = archive_root
+        self.session_start = session_start
+        self.last_cum = np.full(len(symbols), np.nan)
+        self.last_ts = np.full(len(symbols), -1, dtype=np.int64)
+        self.clock = 0
+
+    def ingest(self, items):
+        """吃一輪快照 (msgArray 合併後的 list)"""
+        symbols, price, cum_vol, ts = parse_snapshot(items)
+        keep = [i for i, s in enumerate(symbols)
+                if s in self.symbol_index and (self.session_start is None or ts[i] >= self.session_start)]
+        if keep:
+            idx = np.array([self.symbol_index[symbols[i]] for i in keep])
+            price, cum_vol, ts = price[keep], cum_vol[keep], ts[keep]
+            self.clock = max(self.clock, int(ts.max()))
+
+            # 冷門股每輪都回傳同一筆舊成交，不能當成新的 K 棒
+            prev = self.last_cum[idx]
+            first = np.isnan(prev)
+            fresh = first | (ts > self.last_ts[idx]) | (cum_vol > prev)
+            volume = np.where(first, cum_vol if self.count_initial_volume else 0.0, cum_vol - prev)
+            volume = np.nan_to_num(np.clip(volume, 0, None))
+            self.last_cum[idx] = np.where(np.isnan(cum_vol), prev, cum_vol)
+            self.last_ts[idx] = np.maximum(self.last_ts[idx], ts)
+
+            if fresh.any():
+                for b in self.builders.values():
+                    b.update(idx[fresh], price[fresh], volume[fresh], ts[fresh])
+        for b in self.builders.values():
+            b.close_due(self.clock)
+
+    def close_all(self):
+        for b in self.builders.values():
+            b.close_all()
+
+    def flush(self):
+        """已收盤的 K 棒批次寫入 intraday_archive；回傳 {週期: 寫入根數}"""
+        written = {}
+        for name, b in self.builders.items():
+            bars = b.take_closed()
+            base_dir = archive_dir(f"{SOURCE}_{name}") if self.archive_root is None else os.path.join(self.archive_root, f"intraday_{SOURCE}_{name}")
+            for sym, g in bars.groupby("symbol", sort=False):
+                append_bars(sym, g.drop(columns="symbol"), base_dir)
+            written[name] = len(bars)
+        return written
+
+
+def session_bounds(day):
+    """該交易日的開盤 / 收集結束時間 (台北時間 Timestamp)"""
+    return pd.Timestamp(f"{day} {SESSION_START}", tz=TZ), pd.Timestamp(f"{day} {SESSION_END}", tz=TZ)
+
+
+def poll_once(channels):
+    """查一輪全市場快照；回傳合併後的 msgArray"""
+    batches = [channels[i:i + QUERY_BATCH] for i in range(0, len(channels), QUERY_BATCH)]
+    tasks = {i: (lambda q=q: http_get(MIS_API, params={"ex_ch": "|".join(q)}, timeout=5).json().get("msgArray", []))
+             for i, q in enumerate(batches)}
+    items = []
+    for res in run_concurrently(tasks, POLL_DEADLINE).values():
+        if res: items.extend(res)
+    return items
+
+
+def run(record=False):
+    universe = market_symbols()
+    channels = [ch for ch, _ in universe]
+    today = pd.Timestamp.now(tz=TZ).strftime("%Y-%m-%d")
+    start_at, end_at = session_bounds(today)
+
+    # 開盤後才啟動時，第一筆累計量不是「這一根」的量，不計入
+    collector = IntradayCollector([s for _, s in universe], count_initial_volume=pd.Timestamp.now(tz=TZ) < start_at + pd.Timedelta(minutes=1),
+                                  session_start=int(start_at.timestamp()))
+    rec = None
+    if record:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        rec = gzip.open(os.path.join(SNAPSHOT_DIR, f"{today}.jsonl.gz"), "at", encoding="utf-8")
+
+    print(f"🚀 盤中收集器啟動：{len(channels)} 檔，每 {POLL_SECONDS} 秒一輪，收到 {SESSION_END}")
+    last_flush = time.monotonic()
+    try:
+        while pd.Timestamp.now(tz=TZ) < end_at:
+            t0 = time.monotonic()
+            if pd.Timestamp.now(tz=TZ) >= start_at - pd.Timedelta(minutes=1):
+                items = poll_once(channels)
+                if rec is not None:
+                    rec.write(json.dumps([[it.get(k) for k in SNAPSHOT_FIELDS] for it in items], separators=(",", ":")) + "\n")
+                collector.ingest(items)
+            if time.monotonic() - last_flush >= FLUSH_SECONDS:
+                print(f"   💾 {datetime.now():%H:%M:%S} 寫入 {collector.flush()}")
+                last_flush = time.monotonic()
+            time.sleep(max(0.0, POLL_SECONDS - (time.monotonic() - t0)))
+    finally:
+        collector.close_all()
+        print(f"✅ 收盤寫入 {collector.flush()}")
+        if rec is not None: rec.close()
+
+
+def load_recording(path):
+    """逐輪讀出 --record 存下的快照 (還原成 msgArray 格式)"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield [dict(zip(SNAPSHOT_FIELDS, row)) for row in json.loads(line)]
+
+
+def replay(path, symbols=None, archive_root=None):
+    """以錄下的快照重建 K 棒並寫入資料庫；回傳 collector (測試時可改傳 archive_root 寫到別處)"""
+    rounds = list(load_recording(path))
+    parsed = [parse_snapshot(items) for items in rounds]
+    if symbols is None:
+        symbols = sorted({s for p in parsed for s in p[0]})
+    # 錄檔的交易日 = 最新一筆成交時間的日期 (開盤前錄到的前一盤舊成交會被 session_start 濾掉)
+    last_ts = max((int(p[3].max()) for p in parsed if len(p[3])), default=None)
+    session_start = None
+    if last_ts is not None:
+        day = pd.Timestamp(last_ts, unit="s", tz="UTC").tz_convert(TZ).strftime("%Y-%m-%d")
+        session_start = int(session_bounds(day)[0].timestamp())
+    collector = IntradayCollector(symbols, archive_root=archive_root, session_start=session_start)
+    for items in rounds:
+        collector.ingest(items)
+    collector.close_all()
+    print(f"✅ 重播 {len(rounds)} 輪快照，寫入 {collector.flush()}")
+    return collector
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="全市場盤中 1 分 / 5 分 K 收集器")
+    parser.add_argument("--record", action="store_true", help=f"同時把快照存到 {SNAPSHOT_DIR}")
+    parser.add_argument("--replay", metavar="PATH", help="不連網，重播錄下的快照 (jsonl.gz)")
+    parser.add_argument("--archive-root", default=None, help="重播時寫入的資料夾 (預設 data)")
+    args = parser.parse_args()
+
+    if args.replay: replay(args.replay, archive_root=args.archive_root)
+    else: run(record=args.record)
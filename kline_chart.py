@@ -0,0 +1,185 @@
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+
+# ===========================
+# 輕量 K 線圖建構器
+# 直接組出 figure dict (data + layout)，最後只建立一次 go.Figure，
+# 避免 make_subplots + 大量 add_trace / add_annotation 逐筆驗證的開銷
+# ===========================
+WEBGL_MIN_POINTS = 500  # 超過此點數的折線改用 WebGL (scattergl)
+
+
+def _axis_suffix(row):
+    return "" if row == 1 else str(row)
+
+
+def _xy(row):
+    s = _axis_suffix(row)
+    return {'xaxis': f"x{s}", 'yaxis': f"y{s}"}
+
+
+def _values(v):
+    return v.to_numpy() if hasattr(v, 'to_numpy') else v
+
+
+def subplot_layout(row_heights, subplot_titles=None, vertical_spacing=0.03, title_font=None, title_align='center', **layout_kw):
+    """
+    等同 make_subplots(rows=N, cols=1, shared_xaxes=True) 的 layout，直接以 dict 產生
+    """
+    rows = len(row_heights)
+    usable = 1.0 - vertical_spacing * (rows - 1)
+    heights = np.asarray(row_heights, dtype=float)
+    heights = heights / heights.sum() * usable
+
+    layout = dict(layout_kw)
+    annotations = list(layout.pop('annotations', []))
+    top = 1.0
+    for r in range(1, rows + 1):
+        s = _axis_suffix(r)
+        bottom = max(0.0, top - heights[r - 1])
+        layout[f"yaxis{s}"] = {'domain': [bottom, top], 'anchor': f"x{s}"}
+        xaxis = {'anchor': f"y{s}", 'domain': [0.0, 1.0]}
+        if r < rows:
+            xaxis['showticklabels'] = False
+        if r > 1:
+            xaxis['matches'] = 'x'
+        layout[f"xaxis{s}"] = xaxis
+        if subplot_titles and r <= len(subplot_titles) and subplot_titles[r - 1]:
+            annotations.append({
+                'text': subplot_titles[r - 1], 'x': 0.01 if title_align == 'left' else 0.5, 'y': top,
+                'xref': 'paper', 'yref': 'paper', 'xanchor': title_align, 'yanchor': 'bottom', 'showarrow': False,
+                'font': title_font or {'size': 16},
+            })
+        top = bottom - vertical_spacing
+    layout['annotations'] = annotations
+    return layout
+
+
+def update_axes(layout, axis='x', **props):
+    # 對所有子圖的 x 軸 (或 y 軸) 套用相同設定，等同 fig.update_xaxes / update_yaxes
+    for key, val in layout.items():
+        if key.startswith(f"{axis}axis") and isinstance(val, dict):
+            val.update(props)
+    return layout
+
+
+def line(x, y, row=1, **kw):
+    y = _values(y)
+    trace_type = 'scattergl' if len(y) >= WEBGL_MIN_POINTS else 'scatter'
+    return {'type': trace_type, 'mode': 'lines', 'x': _values(x), 'y': y, **_xy(row), **kw}
+
+
+def bar(x, y, row=1, **kw):
+    return {'type': 'bar', 'x': _values(x), 'y': _values(y), **_xy(row), **kw}
+
+
+def candlestick(x, df, row=1, **kw):
+    return {
+        'type': 'candlestick', 'x': _values(x),
+        'open': df['open'].to_numpy(), 'high': df['high'].to_numpy(),
+        'low': df['low'].to_numpy(), 'close': df['close'].to_numpy(),
+        **_xy(row), **kw,
+    }
+
+
+def markers(x, y, row=1, **kw):
+    # 同類標記 (扣抵圓圈、交叉三角、漲跌停符號) 合併成單一 trace
+    return {'type': 'scatter', 'mode': kw.pop('mode', 'markers'), 'x': list(x), 'y': list(y), **_xy(row), **kw}
+
+
+def vline_segment(x, y0, y1, row=1, **line_kw):
+    s = _axis_suffix(row)
+    return {'type': 'line', 'xref': f"x{s}", 'yref': f"y{s}", 'x0': x, 'x1': x, 'y0': y0, 'y1': y1, 'line': line_kw}
+
+
+def hline(y, row=1, x0=None, x1=None, **line_kw):
+    s = _axis_suffix(row)
+    if x0 is None:
+        return {'type': 'line', 'xref': f"x{s} domain", 'yref': f"y{s}", 'x0': 0, 'x1': 1, 'y0': y, 'y1': y, 'line': line_kw}
+    return {'type': 'line', 'xref': f"x{s}", 'yref': f"y{s}", 'x0': x0, 'x1': x1, 'y0': y, 'y1': y, 'line': line_kw}
+
+
+def annotation(x, y, text, row=1, **kw):
+    s = _axis_suffix(row)
+    return {'x': x, 'y': y, 'text': text, 'xref': f"x{s}", 'yref': f"y{s}", **kw}
+
+
+def ma_deduction_markers(x_dates, lows, ma_specs, y_offset, row=1):
+    """
+    均線扣抵位置標記：每條均線在倒數第 N 根 K 棒下方畫圓圈 + 虛線
+    ma_specs: [(N, color), ...]；回傳 (單一 marker trace 或 None, 虛線 shapes)
+    """
+    xs, ys, texts, colors, shapes = [], [], [], [], []
+    n = len(x_dates)
+    for N, color in ma_specs:
+        if n < N: continue
+        x_val, c_low = x_dates[n - N], lows[n - N]
+        y_marker = c_low - y_offset
+        xs.append(x_val); ys.append(y_marker); texts.append(str(N)); colors.append(color)
+        shapes.append(vline_segment(x_val, y_marker, c_low, row=row, color=color, width=1.5, dash='dot'))
+    if not xs:
+        return None, shapes
+    trace = markers(
+        xs, ys, row=row, mode='markers+text', text=texts, hoverinfo='skip', showlegend=False,
+        marker={'symbol': 'circle', 'size': 22, 'color': 'white', 'line': {'color': colors, 'width': 2.5}},
+        textfont={'color': colors, 'size': 11, 'family': 'Arial Black'},
+    )
+    return trace, shapes
+
+
+def build_figure(traces, layout):
+    # 整份 spec 一次交給 plotly 驗證，只建立一個 Figure 物件
+    return go.Figure({'data': [t for t in traces if t is not None], 'layout': layout})
+
+
+# ===========================
+# 效能基準：同一份 spec，舊法 (make_subplots + add_trace) vs. 一次組裝
+# 執行：python kline_chart.py
+# ===========================
+def _benchmark(n_bars=150, n_runs=20):
+    import pandas as pd
+    import plotly.io as pio
+    from plotly.subplots import make_subplots
+
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_bars)))
+    df = pd.DataFrame({'open': close * 0.99, 'high': close * 1.02, 'low': close * 0.97, 'close': close})
+    x = pd.bdate_range('2025-01-01', periods=n_bars).strftime('%Y-%m-%d').to_numpy()
+
+    rows, row_heights = 6, [0.45, 0.11, 0.11, 0.11, 0.11, 0.11]
+    traces = [candlestick(x, df, row=1, showlegend=False)]
+    for w in (5, 10, 20, 60):
+        traces.append(line(x, pd.Series(close).rolling(w).mean(), row=1, name=f"{w}MA"))
+    for r in range(2, rows + 1):
+        traces.append(bar(x, rng.normal(0, 1, n_bars), row=r, marker_color=np.where(rng.random(n_bars) > 0.5, 'red', 'green')))
+        traces.append(line(x, rng.normal(0, 1, n_bars), row=r))
+    score_idx = np.flatnonzero(rng.random(n_bars) > 0.7)
+    notes = [annotation(x[i], df['high'].iat[i], "<b>+1</b>", row=1, showarrow=True, ay=-35, bgcolor="#FF3333") for i in score_idx]
+
+    def legacy():
+        fig = make_subplots(rows=rows, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=row_heights)
+        for t in traces:
+            t = dict(t); t_type = t.pop('type'); row = int(t.pop('yaxis')[1:] or 1); t.pop('xaxis')
+            cls = {'candlestick': go.Candlestick, 'bar': go.Bar, 'scatter': go.Scatter, 'scattergl': go.Scattergl}[t_type]
+            fig.add_trace(cls(**t), row=row, col=1)
+        for a in notes:
+            a = dict(a); a.pop('xref'); a.pop('yref')
+            fig.add_annotation(**a, row=1, col=1)
+        return fig
+
+    def fast():
+        return build_figure(traces, subplot_layout(row_heights, annotations=list(notes)))
+
+    for name, fn in [("make_subplots + add_trace", legacy), ("prebuilt dict", fast)]:
+        t0 = time.perf_counter()
+        for _ in range(n_runs): fig = fn()
+        t1 = time.perf_counter()
+        for _ in range(n_runs): pio.to_json(fig, validate=False)
+        t2 = time.perf_counter()
+        print(f"{name:<28} build {(t1 - t0) / n_runs * 1000:7.1f} ms | serialize {(t2 - t1) / n_runs * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark()
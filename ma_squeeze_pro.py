@@ -1,14 +1,16 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import sqlalchemy
 import os
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from datetime import datetime, timedelta
 import bcrypt
 
+from ta_kernels import kd_from_rsv
+from squeeze_backtest import prepare_screener_features, build_filter_mask, run_walk_forward_backtest, FORWARD_HORIZONS
+import kline_chart as kc
+from db_engine import get_engine, read_prepared
+
 # ===========================
 # 1. 頁面設定與 CSS
 # ===========================
@@ -30,7 +32,6 @@ st.markdown("""
 # ===========================
 # 2. 資料庫連線 & 登入模組
 # ===========================
-@st.cache_resource
 def get_db_engine():
     db_url = os.environ.get("SUPABASE_DB_URL")
     if not db_url and st.secrets:
@@ -38,7 +39,7 @@ def get_db_engine():
     if not db_url:
         st.error("❌ 找不到資料庫連線！請設定 SUPABASE_DB_URL。")
         st.stop()
-    return create_engine(db_url)
+    return get_engine(db_url)
 
 def check_login(username, password):
     engine = get_db_engine()
@@ -114,16 +115,15 @@ def add_to_watchlist_db(symbol, username):
 # ===========================
 # 3. 🚀 雙層快取架構 (終極提速)
 # ===========================
-@st.cache_data(ttl=600, show_spinner=False)
-def load_screener_data():
+def query_screener_frames(long_days, recent_days):
     engine = get_db_engine()
-    query_long = """
+    query_long = f"""
     SELECT date, symbol, close, volume 
     FROM daily_stock_indicators 
-    WHERE date >= current_date - INTERVAL '200 days'
+    WHERE date >= current_date - INTERVAL '{int(long_days)} days'
     ORDER BY symbol, date
     """
-    query_recent = """
+    query_recent = f"""
     SELECT d.date, d.symbol, d.name, d.industry, d.open, d.high, d.low, d.close, d.volume,
            d.pct_change, d.foreign_net, d.trust_net, d."MA5", d."MA10", d."MA20", d."MA60",
            d."K", d."D", d."MACD_OSC", d."DIF", d."Vol_Ratio",
@@ -131,61 +131,26 @@ def load_screener_data():
            e."Capital", e."2026EPS"
     FROM daily_stock_indicators d
     LEFT JOIN stock_eps e ON d.symbol = e."Symbol"
-    WHERE d.date >= current_date - INTERVAL '40 days'
+    WHERE d.date >= current_date - INTERVAL '{int(recent_days)} days'
     ORDER BY d.symbol, d.date
     """
+    with engine.connect() as conn:
+        df_long = pd.read_sql(query_long, conn)
+        df = pd.read_sql(query_recent, conn)
+    return df_long, df
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_screener_data():
     try:
-        with engine.connect() as conn:
-            df_long = pd.read_sql(query_long, conn)
-            df = pd.read_sql(query_recent, conn)
+        df_long, df = query_screener_frames(200, 40)
     except Exception as e:
         st.error(f"資料讀取失敗: {e}")
         return {}, {}, None, []
 
     if df.empty: return {}, {}, None, []
 
-    df_long['date'] = pd.to_datetime(df_long['date'])
-    df['date'] = pd.to_datetime(df['date'])
-    df_long['symbol'] = df_long['symbol'].astype(str).str.strip()
-    df['symbol'] = df['symbol'].astype(str).str.strip()
-
-    # 算 120MA 與均量
-    df_long['MA120'] = df_long['close'].rolling(120).mean()
-    df_long['Vol_MA5'] = df_long['volume'].rolling(5).mean()
-    df_long['Vol_MA10'] = df_long['volume'].rolling(10).mean()
-    df_long.loc[df_long['symbol'] != df_long['symbol'].shift(119), 'MA120'] = np.nan
-    df_long.loc[df_long['symbol'] != df_long['symbol'].shift(4), 'Vol_MA5'] = np.nan
-    df_long.loc[df_long['symbol'] != df_long['symbol'].shift(9), 'Vol_MA10'] = np.nan
-
-    df = pd.merge(df, df_long[['date', 'symbol', 'MA120', 'Vol_MA5', 'Vol_MA10']], on=['date', 'symbol'], how='left')
-    del df_long  
-
-    df['Total_Score'] = df['Total_Score'].fillna(0).astype(np.int16)
-    df['Signal_List'] = df['Signal_List'].fillna("")
-    for col in ['foreign_net', 'trust_net', 'K', 'D', 'MACD_OSC', 'DIF', 'Vol_Ratio']:
-        if col not in df.columns: df[col] = np.nan
-
-    # 產生「前一日」指標比較基準
-    is_same_sym = df['symbol'] == df['symbol'].shift(1)
-    for col in ['MA5', 'MA10', 'MA20', 'MA60', 'MA120', 'high', 'close', 'K', 'D', 'MACD_OSC', 'Vol_MA5', 'Vol_MA10']:
-        df[f'prev_{col}'] = np.where(is_same_sym, df[col].shift(1), np.nan)
-
-    # 籌碼面：計算前 1~5 日的外資/投信紀錄 (為了連買與初次買超過濾)
-    for i in range(1, 6):
-        is_same_i = df['symbol'] == df['symbol'].shift(i)
-        df[f'prev{i}_foreign_net'] = np.where(is_same_i, df['foreign_net'].shift(i), np.nan)
-        df[f'prev{i}_trust_net'] = np.where(is_same_i, df['trust_net'].shift(i), np.nan)
-
-    df['max_ma'] = np.maximum(df['MA5'], np.maximum(df['MA10'], df['MA20']))
-    df['min_ma'] = np.minimum(df['MA5'], np.minimum(df['MA10'], df['MA20']))
-    df['sq_pct'] = (df['max_ma'] - df['min_ma']) / df['min_ma']
-
-    # KD 金叉 35-65 中檔區
-    df['is_kd_gc'] = (df['K'] > df['D']) & (df['prev_K'] <= df['prev_D'])
-    df['is_kd_gc_mid'] = df['is_kd_gc'] & (df['K'] >= 35) & (df['K'] <= 65)
-    kd_mid_1 = df['is_kd_gc_mid'].shift(1).fillna(False) & is_same_sym
-    kd_mid_2 = df['is_kd_gc_mid'].shift(2).fillna(False) & (df['symbol'] == df['symbol'].shift(2))
-    df['kd_gc_3d_mid_flag'] = df['is_kd_gc_mid'] | kd_mid_1 | kd_mid_2
+    df = prepare_screener_features(df, df_long)
+    del df_long
 
     # 字典打包
     df_dict_by_date = {dt.date(): group for dt, group in df.groupby('date')}
@@ -195,19 +160,32 @@ def load_screener_data():
 
     return df_dict_by_date, df_dict_by_symbol, max_date, avail_dates
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def load_backtest_data(lookback_days=365):
+    # 回測需要完整一年的 date × symbol 明細，另外多抓 200 天補算 MA120
+    try:
+        df_long, df = query_screener_frames(lookback_days + 200, lookback_days)
+    except Exception as e:
+        st.error(f"回測資料讀取失敗: {e}")
+        return pd.DataFrame()
+
+    if df.empty: return df
+    return prepare_screener_features(df, df_long)
+
 @st.cache_data(ttl=600, show_spinner=False)
 def load_single_chart_data(symbol):
     engine = get_db_engine()
-    query = f"""
+    # 切換個股時最常執行的查詢 → server-side prepared statement
+    query = """
     SELECT date, open, high, low, close, volume, foreign_net, trust_net,
            "MA5", "MA10", "MA20", "MA60", "K", "D", "MACD_OSC", "DIF"
     FROM daily_stock_indicators
-    WHERE symbol = '{symbol}' AND date >= current_date - INTERVAL '400 days'
+    WHERE symbol = $1 AND date >= current_date - INTERVAL '400 days'
     ORDER BY date
     """
     try:
         with engine.connect() as conn:
-            chart = pd.read_sql(query, conn)
+            chart = read_prepared(conn, "single_chart_data", query, (symbol,))
         if chart.empty: return chart
         
         chart['date'] = pd.to_datetime(chart['date'])
@@ -231,13 +209,7 @@ def load_single_chart_data(symbol):
             chart['9d_high'] = chart['high'].rolling(9, min_periods=1).max()
             chart['9d_low'] = chart['low'].rolling(9, min_periods=1).min()
             chart['RSV'] = np.where((chart['9d_high'] - chart['9d_low']) == 0, 50, 100 * (chart['close'] - chart['9d_low']) / (chart['9d_high'] - chart['9d_low']))
-            k_list, d_list = [50], [50]
-            for rsv in chart['RSV'].tolist()[1:]:
-                if pd.isna(rsv):
-                    k_list.append(k_list[-1]); d_list.append(d_list[-1])
-                else:
-                    k_list.append(k_list[-1]*2/3 + rsv*1/3); d_list.append(d_list[-1]*2/3 + k_list[-1]*1/3)
-            chart['K'], chart['D'] = k_list, d_list
+            chart['K'], chart['D'] = kd_from_rsv(chart['RSV'])
 
         if 'MACD' not in chart.columns:
             chart['EMA12'] = chart['close'].ewm(span=12, adjust=False).mean()
@@ -262,47 +234,7 @@ def get_squeeze_candidates(df_dict_by_date, df_dict_by_symbol, max_date, target_
     if df_tgt is None or df_tgt.empty: return pd.DataFrame()
     df_tgt = df_tgt.copy()
 
-    # 基礎過濾
-    cond = (df_tgt['volume'] >= f['min_vol']) & (df_tgt['close'] >= f['min_price']) & (df_tgt['sq_pct'] <= f['sq_thresh'])
-    if f['filter_capital']: cond &= (df_tgt['Capital'] <= f['capital_limit'])
-
-    # [進階設定]
-    if f['short_bull']: cond &= (df_tgt['MA5'] > df_tgt['MA10']) & (df_tgt['MA10'] > df_tgt['MA20'])
-    if f['long_bull']: cond &= (df_tgt['MA60'] > df_tgt['MA120'])
-    if f['above_3ma']: cond &= (df_tgt['close'] > df_tgt['MA5']) & (df_tgt['close'] > df_tgt['MA10']) & (df_tgt['close'] > df_tgt['MA20'])
-    if f['above_5ma']: cond &= (df_tgt['close'] > df_tgt['MA5']) & (df_tgt['close'] > df_tgt['MA10']) & (df_tgt['close'] > df_tgt['MA20']) & (df_tgt['close'] > df_tgt['MA60']) & (df_tgt['close'] > df_tgt['MA120'])
-    if f['limit_bias_60']: cond &= (abs(df_tgt['close'] - df_tgt['MA60']) / df_tgt['MA60'] <= (f['bias_limit'] / 100.0))
-
-    # [攻擊型態與技術指標]
-    if f['break_high']: cond &= (df_tgt['close'] > df_tgt['prev_high'])
-    if f['up_2pct']: cond &= (((df_tgt['close'] - df_tgt['prev_close']) / df_tgt['prev_close'] * 100) >= 2.0) & (df_tgt['close'] > df_tgt['open'])
-    if f['solid_red']: cond &= ((df_tgt['close'] - df_tgt['open']) > 0) & ((df_tgt['close'] - df_tgt['open']) >= (df_tgt['high'] - df_tgt['low']) / 3.0)
-    if f['kd_about_gc']: cond &= (df_tgt['K'] < df_tgt['D']) & ((df_tgt['D'] - df_tgt['K']) <= 3) & (df_tgt['K'] > df_tgt['prev_K'])
-    if f['kd_3d_mid']: cond &= (df_tgt['kd_gc_3d_mid_flag'] == True)
-    if f['macd_about_red']: cond &= (df_tgt['MACD_OSC'] < 0) & (df_tgt['MACD_OSC'] > df_tgt['prev_MACD_OSC'])
-    if f['macd_red']: cond &= (df_tgt['MACD_OSC'] > 0)
-
-    ma5_up = df_tgt['MA5'] > df_tgt['prev_MA5']
-    ma10_up = df_tgt['MA10'] > df_tgt['prev_MA10']
-    ma20_up = df_tgt['MA20'] > df_tgt['prev_MA20']
-    ma60_up = df_tgt['MA60'] > df_tgt['prev_MA60']
-    ma120_up = df_tgt['MA120'] > df_tgt['prev_MA120']
-
-    if f['ma_all_up']: cond &= ma5_up & ma10_up & ma20_up & ma60_up & ma120_up
-    if f['ma5_up']: cond &= ma5_up
-    if f['ma10_up']: cond &= ma10_up
-    if f['ma20_up']: cond &= ma20_up
-    if f['ma60_up']: cond &= ma60_up
-    if f['ma120_up']: cond &= ma120_up
-
-    # [籌碼指標篩選]
-    if f['foreign_buy_3d']: cond &= (df_tgt['foreign_net'] > 0) & (df_tgt['prev1_foreign_net'] > 0) & (df_tgt['prev2_foreign_net'] > 0)
-    if f['trust_buy_3d']: cond &= (df_tgt['trust_net'] > 0) & (df_tgt['prev1_trust_net'] > 0) & (df_tgt['prev2_trust_net'] > 0)
-    if f['tu_yang']: cond &= (df_tgt['foreign_net'] > 0) & (df_tgt['trust_net'] > 0)
-    if f['foreign_buy']: cond &= (df_tgt['foreign_net'] >= f['foreign_buy_vol'])
-    if f['trust_buy']: cond &= (df_tgt['trust_net'] >= f['trust_buy_vol'])
-    if f['trust_first_buy']:
-        cond &= (df_tgt['trust_net'] > 0) & (df_tgt['prev1_trust_net'] <= 0) & (df_tgt['prev2_trust_net'] <= 0) & (df_tgt['prev3_trust_net'] <= 0) & (df_tgt['prev4_trust_net'] <= 0) & (df_tgt['prev5_trust_net'] <= 0)
+    cond = build_filter_mask(df_tgt, f)
 
     candidates_df = df_tgt[cond]
     is_past_date = target_date < max_date
@@ -443,6 +375,89 @@ def login_page():
                         if success: st.success(msg)
                         else: st.error(msg)
 
+# ===========================
+# 5. K 線圖 (一次組裝 figure spec，依股票/截止日/選項快取)
+# ===========================
+def plot_squeeze_kline(chart, selected_mas, show_ma_cross, show_vol_ma5, show_vol_ma10, show_kd, show_rsi, show_macd, show_foreign, show_trust):
+    active_subplots = []
+    if show_kd: active_subplots.append("KD (9,3,3)")
+    if show_rsi: active_subplots.append("RSI (6,12)")
+    if show_macd: active_subplots.append("MACD")
+    if show_foreign: active_subplots.append("外資買賣超(張)")
+    if show_trust: active_subplots.append("投信買賣超(張)")
+
+    row_heights = [0.4, 0.15] + [0.45 / max(1, len(active_subplots))] * len(active_subplots)
+    fig_height = 500 + (150 * len(active_subplots))
+
+    chart = chart.tail(150)
+    chart_dates = chart['date'].dt.strftime('%Y-%m-%d').to_numpy()
+    traces, shapes = [], []
+
+    traces.append(kc.candlestick(chart_dates, chart, increasing_line_color='#ef5350', decreasing_line_color='#26a69a', name='K線', showlegend=False))
+
+    ma_col_map = {'3MA': 'MA3', '5MA': 'MA5', '10MA': 'MA10', '20MA': 'MA20', '60MA': 'MA60', '120MA': 'MA120'}
+    ma_colors = {'3MA': '#FF69B4', '5MA': 'orange', '10MA': '#00FFFF', '20MA': 'purple', '60MA': 'blue', '120MA': 'green'}
+
+    y_range = chart['high'].max() - chart['low'].min()
+    y_offset = y_range * 0.08
+
+    deduct_specs = []
+    for ma_name in selected_mas:
+        col_name = ma_col_map.get(ma_name)
+        if col_name and col_name in chart.columns:
+            is_up = chart[col_name].iloc[-1] > chart[col_name].iloc[-2]
+            traces.append(kc.line(chart_dates, chart[col_name], line=dict(color=ma_colors.get(ma_name, 'black'), width=1.5), name=f"{ma_name} {'🔺' if is_up else '▼'}"))
+            deduct_specs.append((int(ma_name.replace('MA', '')), ma_colors.get(ma_name, 'black')))
+
+    deduct_trace, deduct_shapes = kc.ma_deduction_markers(chart_dates, chart['low'].to_numpy(), deduct_specs, y_offset)
+    traces.append(deduct_trace); shapes.extend(deduct_shapes)
+
+    if show_ma_cross:
+        gc_df = chart[chart['Golden_Cross']]
+        if not gc_df.empty: traces.append(kc.markers(gc_df['date'].dt.strftime('%Y-%m-%d'), gc_df['MA20'], marker=dict(symbol='triangle-up', size=14, color='gold', line=dict(width=1, color='darkgoldenrod')), name='20MA金叉60MA', showlegend=False))
+        dc_df = chart[chart['Death_Cross']]
+        if not dc_df.empty: traces.append(kc.markers(dc_df['date'].dt.strftime('%Y-%m-%d'), dc_df['MA20'], marker=dict(symbol='triangle-down', size=14, color='green', line=dict(width=1, color='darkgreen')), name='20MA死叉60MA', showlegend=False))
+
+    traces.append(kc.line(chart_dates, chart['BB_upper'], line=dict(color='rgba(150, 150, 150, 0.5)', width=1, dash='dash'), name='上軌 (3σ)', hoverinfo='skip', showlegend=False))
+    traces.append(kc.line(chart_dates, chart['BB_lower'], line=dict(color='rgba(150, 150, 150, 0.5)', width=1, dash='dash'), name='下軌 (3σ)', fill='tonexty', fillcolor='rgba(200, 200, 200, 0.1)', hoverinfo='skip', showlegend=False))
+
+    up_dn = lambda cond: np.where(cond, '#ef5350', '#26a69a')
+    traces.append(kc.bar(chart_dates, chart['volume'], row=2, marker_color=up_dn(chart['close'] >= chart['open']), name='成交量', showlegend=False))
+    if show_vol_ma5: traces.append(kc.line(chart_dates, chart['Vol_MA5'], row=2, line=dict(color='orange', width=1.5), name='5日均量', showlegend=False))
+    if show_vol_ma10: traces.append(kc.line(chart_dates, chart['Vol_MA10'], row=2, line=dict(color='#00FFFF', width=1.5), name='10日均量', showlegend=False))
+
+    current_row = 3
+    if show_kd:
+        traces.append(kc.line(chart_dates, chart['K'], row=current_row, name='K', line=dict(color='orange'), showlegend=False))
+        traces.append(kc.line(chart_dates, chart['D'], row=current_row, name='D', line=dict(color='cyan'), showlegend=False))
+        current_row += 1
+    if show_rsi:
+        traces.append(kc.line(chart_dates, chart['RSI6'], row=current_row, name='RSI 6', line=dict(color='orange'), showlegend=False))
+        traces.append(kc.line(chart_dates, chart['RSI12'], row=current_row, name='RSI 12', line=dict(color='cyan'), showlegend=False))
+        current_row += 1
+    if show_macd:
+        traces.append(kc.bar(chart_dates, chart['MACD_OSC'], row=current_row, marker_color=up_dn(chart['MACD_OSC'] >= 0), name='OSC', showlegend=False))
+        traces.append(kc.line(chart_dates, chart['DIF'], row=current_row, name='DIF', line=dict(color='orange'), showlegend=False))
+        traces.append(kc.line(chart_dates, chart['MACD'], row=current_row, name='MACD', line=dict(color='cyan'), showlegend=False))
+        current_row += 1
+    if show_foreign:
+        traces.append(kc.bar(chart_dates, chart['foreign_net'], row=current_row, marker_color=up_dn(chart['foreign_net'] >= 0), name='外資買賣超', showlegend=False))
+        current_row += 1
+    if show_trust:
+        traces.append(kc.bar(chart_dates, chart['trust_net'], row=current_row, marker_color=up_dn(chart['trust_net'] >= 0), name='投信買賣超', showlegend=False))
+        current_row += 1
+
+    layout = kc.subplot_layout(
+        row_heights, [f"日K線圖 (3倍布林帶寬)", "成交量"] + active_subplots, vertical_spacing=0.03, shapes=shapes,
+        height=fig_height, margin=dict(t=30,b=0,l=0,r=0), legend=dict(orientation="h", y=1.01, x=0.5, xanchor='center'), hovermode='x unified'
+    )
+    kc.update_axes(layout, 'x', type='category', nticks=15, rangeslider=dict(visible=False))
+    return kc.build_figure(traces, layout)
+
+@st.cache_resource(ttl=600, max_entries=64, show_spinner=False)
+def get_squeeze_figure(symbol, last_date, options, _chart):
+    return plot_squeeze_kline(_chart, *options)
+
 # ===========================
 # 6. 主應用程式與圖表渲染
 # ===========================
@@ -541,6 +556,30 @@ def main_app():
     diag_code = st.sidebar.text_input("輸入代號 (如 3563)")
     if diag_code: diagnose_stock(diag_code, df_dict_by_symbol, sel_date, filters)
 
+    with st.expander("🧪 歷史回測 (Walk-Forward：每個交易日套用目前條件)"):
+        bt_days = st.select_slider("回測區間 (日曆天)", options=[90, 180, 365], value=365)
+        if st.toggle("啟用歷史回測", key="ui_backtest"):
+            with st.spinner("📊 載入回測資料並向量化運算中..."):
+                df_bt = load_backtest_data(bt_days)
+                bt_daily, bt_summary = run_walk_forward_backtest(df_bt, filters)
+            if bt_daily.empty:
+                st.info("回測區間內沒有任何符合條件的訊號。")
+            else:
+                st.dataframe(bt_summary, hide_index=True, use_container_width=True, column_config={
+                    "horizon": "持有天數", "signals": "訊號數",
+                    "avg_return": st.column_config.NumberColumn("平均報酬", format="%.2f%%"),
+                    "median_return": st.column_config.NumberColumn("中位數報酬", format="%.2f%%"),
+                    "win_rate": st.column_config.NumberColumn("勝率", format="%.1f%%"),
+                })
+                bt_cfg = {"date": st.column_config.DateColumn("訊號日"), "hits": "命中檔數",
+                          "avg_drawdown": st.column_config.NumberColumn("平均最大回撤", format="%.2f%%"),
+                          "max_drawdown": st.column_config.NumberColumn("最差回撤", format="%.2f%%")}
+                for h in FORWARD_HORIZONS:
+                    bt_cfg[f"avg_{h}d"] = st.column_config.NumberColumn(f"{h}日均報酬", format="%.2f%%")
+                    bt_cfg[f"median_{h}d"] = st.column_config.NumberColumn(f"{h}日中位數", format="%.2f%%")
+                    bt_cfg[f"win_rate_{h}d"] = st.column_config.NumberColumn(f"{h}日勝率", format="%.1f%%")
+                st.dataframe(bt_daily.sort_values('date', ascending=False), hide_index=True, use_container_width=True, height=300, column_config=bt_cfg)
+
     if df_res.empty: st.warning(f"⚠️ 在 {sel_date} 無符合條件股票，請嘗試放寬側邊欄的篩選條件。")
     else:
         c_sort1, c_sort2 = st.columns([1, 1])
@@ -701,88 +740,8 @@ def main_app():
                     '</div></div>', unsafe_allow_html=True
                 )
 
-                active_subplots = []
-                if show_kd: active_subplots.append("KD (9,3,3)")
-                if show_rsi: active_subplots.append("RSI (6,12)")
-                if show_macd: active_subplots.append("MACD")
-                if show_foreign: active_subplots.append("外資買賣超(張)")
-                if show_trust: active_subplots.append("投信買賣超(張)")
-
-                total_rows = 2 + len(active_subplots)
-                row_heights = [0.4, 0.15] + [0.45 / max(1, len(active_subplots))] * len(active_subplots)
-                fig_height = 500 + (150 * len(active_subplots))
-
-                chart = chart.tail(150).copy()
-                chart_dates = chart['date'].dt.strftime('%Y-%m-%d')
-
-                fig = make_subplots(
-                    rows=total_rows, cols=1, shared_xaxes=True, vertical_spacing=0.03, 
-                    row_heights=row_heights, subplot_titles=[f"日K線圖 (3倍布林帶寬)", "成交量"] + active_subplots
-                )
-
-                fig.add_trace(go.Candlestick(x=chart_dates, open=chart['open'], high=chart['high'], low=chart['low'], close=chart['close'], increasing_line_color='#ef5350', decreasing_line_color='#26a69a', name='K線', showlegend=False), row=1, col=1)
-                
-                ma_col_map = {'3MA': 'MA3', '5MA': 'MA5', '10MA': 'MA10', '20MA': 'MA20', '60MA': 'MA60', '120MA': 'MA120'}
-                ma_colors = {'3MA': '#FF69B4', '5MA': 'orange', '10MA': '#00FFFF', '20MA': 'purple', '60MA': 'blue', '120MA': 'green'}
-                
-                y_range = chart['high'].max() - chart['low'].min()
-                y_offset = y_range * 0.08
-                
-                for ma_name in selected_mas:
-                    col_name = ma_col_map.get(ma_name)
-                    if col_name and col_name in chart.columns:
-                        is_up = chart[col_name].iloc[-1] > chart[col_name].iloc[-2]
-                        fig.add_trace(go.Scatter(x=chart_dates, y=chart[col_name], line=dict(color=ma_colors.get(ma_name, 'black'), width=1.5), name=f"{ma_name} {'🔺' if is_up else '▼'}"), row=1, col=1)
-                        
-                        N = int(ma_name.replace('MA', ''))
-                        if len(chart) >= N:
-                            deduct_idx = -N 
-                            x_val = chart_dates.iloc[deduct_idx]
-                            c_low = chart['low'].iloc[deduct_idx]
-                            y_marker = c_low - y_offset
-                            fig.add_trace(go.Scatter(x=[x_val, x_val], y=[y_marker, c_low], mode='lines', line=dict(color=ma_colors.get(ma_name, 'black'), width=1.5, dash='dot'), hoverinfo='skip', showlegend=False), row=1, col=1)
-                            fig.add_trace(go.Scatter(x=[x_val], y=[y_marker], mode='markers+text', marker=dict(symbol='circle', size=22, color='white', line=dict(color=ma_colors.get(ma_name, 'black'), width=2.5)), text=[str(N)], textfont=dict(color=ma_colors.get(ma_name, 'black'), size=11, family="Arial Black"), hoverinfo='skip', showlegend=False), row=1, col=1)
-
-                if show_ma_cross:
-                    gc_df = chart[(chart['MA20'] > chart['MA60']) & (chart['prev_MA20'] <= chart['prev_MA60'])]
-                    if not gc_df.empty: fig.add_trace(go.Scatter(x=gc_df['date'].dt.strftime('%Y-%m-%d'), y=gc_df['MA20'], mode='markers', marker=dict(symbol='triangle-up', size=14, color='gold', line=dict(width=1, color='darkgoldenrod')), name='20MA金叉60MA', showlegend=False), row=1, col=1)
-                    dc_df = chart[(chart['MA20'] < chart['MA60']) & (chart['prev_MA20'] >= chart['prev_MA60'])]
-                    if not dc_df.empty: fig.add_trace(go.Scatter(x=dc_df['date'].dt.strftime('%Y-%m-%d'), y=dc_df['MA20'], mode='markers', marker=dict(symbol='triangle-down', size=14, color='green', line=dict(width=1, color='darkgreen')), name='20MA死叉60MA', showlegend=False), row=1, col=1)
-
-                fig.add_trace(go.Scatter(x=chart_dates, y=chart['BB_upper'], line=dict(color='rgba(150, 150, 150, 0.5)', width=1, dash='dash'), name='上軌 (3σ)', hoverinfo='skip', showlegend=False), row=1, col=1)
-                fig.add_trace(go.Scatter(x=chart_dates, y=chart['BB_lower'], line=dict(color='rgba(150, 150, 150, 0.5)', width=1, dash='dash'), name='下軌 (3σ)', fill='tonexty', fillcolor='rgba(200, 200, 200, 0.1)', hoverinfo='skip', showlegend=False), row=1, col=1)
-
-                vol_colors = ['#ef5350' if c >= o else '#26a69a' for c, o in zip(chart['close'], chart['open'])]
-                fig.add_trace(go.Bar(x=chart_dates, y=chart['volume'], marker_color=vol_colors, name='成交量', showlegend=False), row=2, col=1)
-                if show_vol_ma5: fig.add_trace(go.Scatter(x=chart_dates, y=chart['Vol_MA5'], line=dict(color='orange', width=1.5), name='5日均量', showlegend=False), row=2, col=1)
-                if show_vol_ma10: fig.add_trace(go.Scatter(x=chart_dates, y=chart['Vol_MA10'], line=dict(color='#00FFFF', width=1.5), name='10日均量', showlegend=False), row=2, col=1)
-
-                current_row = 3
-                if show_kd:
-                    fig.add_trace(go.Scatter(x=chart_dates, y=chart['K'], name='K', line=dict(color='orange'), showlegend=False), row=current_row, col=1)
-                    fig.add_trace(go.Scatter(x=chart_dates, y=chart['D'], name='D', line=dict(color='cyan'), showlegend=False), row=current_row, col=1)
-                    current_row += 1
-                if show_rsi:
-                    fig.add_trace(go.Scatter(x=chart_dates, y=chart['RSI6'], name='RSI 6', line=dict(color='orange'), showlegend=False), row=current_row, col=1)
-                    fig.add_trace(go.Scatter(x=chart_dates, y=chart['RSI12'], name='RSI 12', line=dict(color='cyan'), showlegend=False), row=current_row, col=1)
-                    current_row += 1
-                if show_macd:
-                    osc_colors = ['#ef5350' if v >= 0 else '#26a69a' for v in chart['MACD_OSC']]
-                    fig.add_trace(go.Bar(x=chart_dates, y=chart['MACD_OSC'], marker_color=osc_colors, name='OSC', showlegend=False), row=current_row, col=1)
-                    fig.add_trace(go.Scatter(x=chart_dates, y=chart['DIF'], name='DIF', line=dict(color='orange'), showlegend=False), row=current_row, col=1)
-                    fig.add_trace(go.Scatter(x=chart_dates, y=chart['MACD'], name='MACD', line=dict(color='cyan'), showlegend=False), row=current_row, col=1)
-                    current_row += 1
-                if show_foreign:
-                    foreign_colors = ['#ef5350' if v >= 0 else '#26a69a' for v in chart['foreign_net']]
-                    fig.add_trace(go.Bar(x=chart_dates, y=chart['foreign_net'], marker_color=foreign_colors, name='外資買賣超', showlegend=False), row=current_row, col=1)
-                    current_row += 1
-                if show_trust:
-                    trust_colors = ['#ef5350' if v >= 0 else '#26a69a' for v in chart['trust_net']]
-                    fig.add_trace(go.Bar(x=chart_dates, y=chart['trust_net'], marker_color=trust_colors, name='投信買賣超', showlegend=False), row=current_row, col=1)
-                    current_row += 1
-
-                fig.update_xaxes(type='category', nticks=15)
-                fig.update_layout(xaxis_rangeslider_visible=False, height=fig_height, margin=dict(t=30,b=0,l=0,r=0), legend=dict(orientation="h", y=1.01, x=0.5, xanchor='center'), hovermode='x unified')
+                chart_opts = (tuple(selected_mas), show_ma_cross, show_vol_ma5, show_vol_ma10, show_kd, show_rsi, show_macd, show_foreign, show_trust)
+                fig = get_squeeze_figure(sym, chart['date'].iloc[-1], chart_opts, chart)
                 st.plotly_chart(fig, use_container_width=True)
 
 # ===========================
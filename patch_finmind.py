@@ -4,10 +4,11 @@ import requests
 import pandas as pd
 import sqlalchemy
 from sqlalchemy import text
-from sqlalchemy.pool import NullPool
 from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime, timedelta
 
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
 # ===========================
 # 1. 環境變數與連線設定
 # ===========================
@@ -19,7 +20,7 @@ if not SUPABASE_DB_URL:
 if not FINMIND_TOKEN:
     print("⚠️ 未偵測到 FINMIND_TOKEN，將使用免費用戶額度 (可能會有 Rate Limit 限制)")
 
-engine = sqlalchemy.create_engine(SUPABASE_DB_URL, poolclass=NullPool, connect_args={'connect_timeout': 30})
+engine = get_engine(SUPABASE_DB_URL, connect_timeout=30, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
 # ===========================
 # 2. FinMind 抓取核心函式
@@ -0,0 +1,247 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from dashboard_publisher import write_if_changed
+from stock_train_bundle import read_stock_csv
+from ta_kernels import prior_window_extreme
+
+# ===========================
+# stock_train 全市場型態離線掃描
+# 與 stock_train/js 的偵測邏輯一致，但一次對整段歷史的「每一天」求值 (等同練習器逐日前進時看到的結果)：
+# - patternWM.js：W 底 / M 頭 (pivot window 2，兩底/兩頂差 ≤ 8%，中間反彈/回落 ≥ 5%) 與頸線突破/跌破
+# - patternTriangle.js：收斂 / 上升 / 下降三角形 (pivot window 3)
+# - kpattern.js：三兵、三法、三空、吞噬貫穿、單 K 型態
+# - supportResistance.js：收盤突破前 20 日壓力 / 跌破前 20 日支撐
+# pivot 需要右側 window 根 K 棒才成立，所以第 t 天只使用 index ≤ t - window 的 pivot，不會偷看未來
+# 輸出 stock_train/pattern_index.csv：dataset, symbol, date, pattern, side, strength
+# strength 為型態幅度 (%)：W/M = 頸線與兩底(頂)均價距離、突破 = 收盤超過頸線/壓力的幅度、三角 = 起點高低差 / 收盤、K 線 = 最後一根實體 / 開盤
+# ===========================
+ROOTS = ["stock_train"]
+SKIP_DIRS = {"data_txf_5m_daily"}
+INDEX_PATH = os.path.join("stock_train", "pattern_index.csv")
+INDEX_COLUMNS = ["dataset", "symbol", "date", "pattern", "side", "strength"]
+SR_LOOKBACK = 20
+
+
+def pivot_indices(values, window, kind):
+    """與 js findPivots 相同：視窗 [i-w, i+w] 內沒有更高 (更低) 的值即為 pivot"""
+    n = len(values)
+    if n < 2 * window + 1: return np.zeros(0, dtype=int)
+    win = sliding_window_view(values, 2 * window + 1)
+    center = values[window:n - window]
+    mask = center >= win.max(axis=1) if kind == "high" else center <= win.min(axis=1)
+    return np.nonzero(mask)[0] + window
+
+
+def _events(rows, dates, idx, pattern, side, strength):
+    for i, s in zip(np.atleast_1d(idx), np.atleast_1d(strength)):
+        rows.append((dates[i], pattern, side, round(float(s), 2)))
+
+
+def scan_wm(o, h, l, c, dates, rows):
+    """W 底 / M 頭：每組「最近 4 個已成立 pivot」成形的第一天記一筆，組內首次收盤越過頸線再記一筆突破"""
+    n = len(c)
+    for kind, piv_src, ext, name, brk_name, side in [
+        ("low", l, h, "W底", "W底頸線突破", "bull"),
+        ("high", h, l, "M頭", "M頭頸線跌破", "bear"),
+    ]:
+        piv = pivot_indices(piv_src, 2, kind)
+        for k in range(4, len(piv) + 1):
+            p1, p3 = piv[k - 4], piv[k - 2]
+            # 這組 pivot 生效的日子：第 k 個 pivot 成立 (index + 2) 起，到下一個 pivot 成立前；且資料至少 30 根
+            start = max(piv[k - 1] + 2, 29)
+            end = (piv[k] + 2 if k < len(piv) else n) - 1
+            if start > end or start >= n: continue
+            v1, v3 = piv_src[p1], piv_src[p3]
+            if abs(v1 - v3) / ((v1 + v3) / 2) > 0.08: continue
+            mid = ext[p3 - (p3 - p1) // 2]
+            seg = ext[p1:p3 + 1]
+            if kind == "low":
+                if not (mid > v1 * 1.05 and mid > v3 * 1.05): continue
+                neck = seg.max()
+                crossed = c[start:end + 1] > neck
+            else:
+                if not (mid < v1 * 0.95 and mid < v3 * 0.95): continue
+                neck = seg.min()
+                crossed = c[start:end + 1] < neck
+            _events(rows, dates, start, name, side, abs(neck / ((v1 + v3) / 2) - 1) * 100)
+            if crossed.any():
+                t = start + int(np.argmax(crossed))
+                _events(rows, dates, t, brk_name, side, abs(c[t] / neck - 1) * 100)
+
+
+def scan_triangle(o, h, l, c, dates, rows):
+    """三角形：每天取最近兩個已成立的 pivot high / low 判斷，型態或 pivot 組合改變的第一天記一筆"""
+    n = len(c)
+    ph, pl = pivot_indices(h, 3, "high"), pivot_indices(l, 3, "low")
+    if n < 40 or len(ph) < 2 or len(pl) < 2: return
+    t = np.arange(39, n)
+    kh = np.searchsorted(ph, t - 3, side="right")
+    kl = np.searchsorted(pl, t - 3, side="right")
+    ok = (kh >= 2) & (kl >= 2)
+    t, kh, kl = t[ok], kh[ok], kl[ok]
+    if not len(t): return
+
+    top1, top2 = ph[kh - 2], ph[kh - 1]
+    bot1, bot2 = pl[kl - 2], pl[kl - 1]
+    up = (h[top2] - h[top1]) / (top2 - top1)
+    low = (l[bot2] - l[bot1]) / (bot2 - bot1)
+    kind = np.select(
+        [(up < 0) & (low > 0), (np.abs(up) < 0.02) & (low > 0), (up < 0) & (np.abs(low) < 0.02)],
+        [1, 2, 3], 0)
+    # 同一組 pivot、同一型態連續多天只記第一天
+    changed = np.r_[True, (kind[1:] != kind[:-1]) | (kh[1:] != kh[:-1]) | (kl[1:] != kl[:-1])]
+    for code, name, side in [(1, "收斂三角形", "neutral"), (2, "上升三角形", "bull"), (3, "下降三角形", "bear")]:
+        sel = changed & (kind == code)
+        _events(rows, dates, t[sel], name, side, (h[top1[sel]] - l[bot1[sel]]) / c[t[sel]] * 100)
+
+
+def _shift(a, k):
+    out = np.full(len(a), np.nan)
+    if k < len(a): out[k:] = a[:len(a) - k]
+    return out
+
+
+def scan_kpattern(o, h, l, c, dates, rows):
+    """kpattern.js 五組規則：每組依原本 if 順序取第一個成立的型態 (np.select)"""
+    n = len(c)
+    if n < 5: return
+    red, green = c > o, c < o
+    body = np.abs(c - o)
+    shifted = {k: tuple(_shift(a, k) for a in (o, h, l, c)) for k in range(1, 5)}
+    red_k = {k: shifted[k][3] > shifted[k][0] for k in shifted}
+    green_k = {k: shifted[k][3] < shifted[k][0] for k in shifted}
+
+    def gap_up(k1, k2):   # k1 天前 → k2 天前 跳空上漲 (k=0 為當天)
+        return (l if k2 == 0 else shifted[k2][2]) > shifted[k1][1]
+
+    def gap_down(k1, k2):
+        return (h if k2 == 0 else shifted[k2][1]) < shifted[k1][2]
+
+    o1, h1, l1, c1 = shifted[1]
+    o2, h2, l2, c2 = shifted[2]
+    o4, h4, l4, c4 = shifted[4]
+    _, h3, l3, _ = shifted[3]
+    mid1 = (o1 + c1) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = body / o
+    upper_sh = h - np.maximum(o, c)
+    lower_sh = np.minimum(o, c) - l
+
+    groups = [
+        ([red_k[2] & red_k[1] & red & (c1 > c2) & (c > c1) & (o1 > o2) & (o > o1),
+          green_k[2] & green_k[1] & green & (c1 < c2) & (c < c1)],
+         [("紅三兵：多頭穩健進攻", "bull"), ("黑三鴉：空頭主力倒貨", "bear")]),
+        ([red_k[4] & (np.abs(c4 - o4) > o4 * 0.015) & red & (c > c4) & (l3 > l4) & (l2 > l4) & (l1 > l4),
+          green_k[4] & (np.abs(c4 - o4) > o4 * 0.015) & green & (c < c4) & (h3 < h4) & (h2 < h4) & (h1 < h4)],
+         [("上升三法：N字攻擊發動", "bull"), ("下降三法：空頭中繼再殺", "bear")]),
+        ([gap_up(3, 2) & gap_up(2, 1) & gap_up(1, 0), gap_down(3, 2) & gap_down(2, 1) & gap_down(1, 0)],
+         [("三空陽：多頭力竭，隨時回檔", "bear"), ("三空陰：空頭力竭，醞釀反彈", "bull")]),
+        ([green_k[1] & red & (c > h1) & (o < l1),
+          red_k[1] & green & (c < l1) & (o > h1),
+          green_k[1] & red & (o < l1) & (c > mid1),
+          red_k[1] & green & (o > h1) & (c < mid1)],
+         [("陽包陰：多頭吞噬", "bull"), ("陰包陽：空頭吞噬", "bear"),
+          ("貫穿線：低檔反轉訊號", "bull"), ("烏雲蓋頂：高檔反轉訊號", "bear")]),
+        ([red & (ratio > 0.025), green & (ratio > 0.025),
+          (ratio < 0.002) & ((upper_sh > body * 2) | (lower_sh > body * 2))],
+         [("大陽線：強勢表態", "bull"), ("大陰線：恐慌殺盤", "bear"), ("十字星：多空變盤", "bull")]),
+    ]
+    valid = np.arange(n) >= 4   # 練習器至少 5 根 K 棒才偵測
+    for conds, labels in groups:
+        choice = np.select(conds, np.arange(1, len(labels) + 1), 0)
+        for code, (name, side) in enumerate(labels, start=1):
+            idx = np.nonzero(valid & (choice == code))[0]
+            _events(rows, dates, idx, name.split("：")[0], side, ratio[idx] * 100)
+
+
+def scan_support_resistance(o, h, l, c, dates, rows):
+    """收盤突破前 20 日最高 / 跌破前 20 日最低；連續成立只記第一天"""
+    hi, _, _, _ = prior_window_extreme(h, SR_LOOKBACK)
+    _, _, lo, _ = prior_window_extreme(l, SR_LOOKBACK)
+    with np.errstate(invalid="ignore"):
+        for cond, level, name, side in [(c > hi, hi, "突破20日壓力", "bull"), (c < lo, lo, "跌破20日支撐", "bear")]:
+            first = cond & ~np.r_[False, cond[:-1]]
+            idx = np.nonzero(first)[0]
+            _events(rows, dates, idx, name, side, np.abs(c[idx] / level[idx] - 1) * 100)
+
+
+SCANNERS = [scan_wm, scan_triangle, scan_kpattern, scan_support_resistance]
+
+
+def scan_file(task):
+    dataset, path = task
+    try:
+        df = read_stock_csv(path)
+    except Exception as e:
+        print(f"   ⚠️ {path} 讀取失敗，略過: {e}")
+        return []
+    # yfinance 停牌 / 缺資料的佔位 K 棒價格為 0，會讓 pivot 與比值失真，掃描前先剔除
+    ohlc = df[["open", "high", "low", "close"]].apply(pd.to_numeric, errors="coerce")
+    df = df[(ohlc > 0).all(axis=1)].reset_index(drop=True)
+    if df.empty: return []
+    arrays = [df[col].to_numpy(dtype=float) for col in ("open", "high", "low", "close")]
+    dates = df["date"].astype(str).to_numpy()
+    rows = []
+    for scanner in SCANNERS:
+        scanner(*arrays, dates, rows)
+    sym = os.path.splitext(os.path.basename(path))[0]
+    return [(dataset, sym) + r for r in rows]
+
+
+def collect_files():
+    """同一檔出現在多個資料夾時只掃歷史最長的那份"""
+    best = {}
+    for root in ROOTS:
+        for data_dir in sorted(glob.glob(os.path.join(root, "data_*"))):
+            if os.path.basename(data_dir) in SKIP_DIRS: continue
+            for path in glob.glob(os.path.join(data_dir, "*.csv")):
+                sym = os.path.splitext(os.path.basename(path))[0]
+                size = os.path.getsize(path)
+                if sym not in best or size > best[sym][2]:
+                    best[sym] = (os.path.basename(data_dir), path, size)
+    return [(d, p) for d, p, _ in best.values()]
+
+
+def scan_all(workers=None):
+    tasks = collect_files()
+    print(f"🔍 掃描 {len(tasks)} 檔股票...")
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for res in pool.map(scan_file, tasks, chunksize=16):
+            rows.extend(res)
+    df = pd.DataFrame(rows, columns=INDEX_COLUMNS)
+    df = df[np.isfinite(df["strength"])]
+    return df.sort_values(["symbol", "date", "pattern"], kind="stable").reset_index(drop=True)
+
+
+def load_pattern_index(path=INDEX_PATH):
+    """給 Streamlit / 其他程式查詢用：回傳型態索引 DataFrame (不存在時回傳空表)"""
+    if not os.path.exists(path): return pd.DataFrame(columns=INDEX_COLUMNS)
+    return pd.read_csv(path, encoding="utf-8-sig", dtype={"symbol": str})
+
+
+def pattern_examples(pattern, index=None, limit=50):
+    """某型態強度最高的範例 (symbol, date ...)"""
+    index = load_pattern_index() if index is None else index
+    return index[index["pattern"] == pattern].sort_values("strength", ascending=False).head(limit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="stock_train 全市場型態離線掃描")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    t0 = time.time()
+    index = scan_all(args.workers)
+    write_if_changed(args.out, index.to_csv(index=False), precompress=False)
+    print(f"✅ 共 {len(index):,} 筆型態 ({time.time() - t0:.1f}s) → {args.out}")
+    print(index["pattern"].value_counts().to_string())
@@ -0,0 +1,98 @@
+import json
+from collections import deque
+
+import pandas as pd
+from sqlalchemy import text
+
+# ===========================
+# 200 日新高 / 新低：逐股單調佇列 (monotonic deque) 狀態
+# 每個交易日只需當天收盤價 + 上一次保存的佇列，即可判斷是否創 200 日新高/低，
+# 不必每天重新撈 200 天全市場價格做 rolling max/min
+# ===========================
+EXTREME_WINDOW = 200
+STATE_TABLE = "price_extreme_state"
+
+
+def _new_symbol_state():
+    return {'max': deque(), 'min': deque()}
+
+
+def advance_extremes(state, date_str, closes, window_start):
+    """
+    將單一交易日的收盤價推進到狀態中
+    state: {symbol: {'max': deque[(date, close)], 'min': deque[(date, close)]}} (原地更新)
+    closes: {symbol: close}，只含當日有收盤價的股票
+    window_start: 200 日視窗的第一個交易日 (含)；早於此日的佇列元素會被移除
+    回傳 {symbol: (is_new_high, is_new_low)}，與 rolling(200, min_periods=1) 的 close >= max / close <= min 相同
+    """
+    flags = {}
+    for sym, close in closes.items():
+        st = state.get(sym)
+        if st is None:
+            st = state[sym] = _new_symbol_state()
+        q_max, q_min = st['max'], st['min']
+        while q_max and q_max[0][0] < window_start: q_max.popleft()
+        while q_min and q_min[0][0] < window_start: q_min.popleft()
+
+        flags[sym] = (not q_max or close >= q_max[0][1], not q_min or close <= q_min[0][1])
+
+        while q_max and q_max[-1][1] <= close: q_max.pop()
+        q_max.append((date_str, close))
+        while q_min and q_min[-1][1] >= close: q_min.pop()
+        q_min.append((date_str, close))
+    return flags
+
+
+def window_start_for(trading_dates, idx):
+    # trading_dates 為遞增排序的交易日字串；回傳第 idx 天所在 200 日視窗的起始日
+    return trading_dates[max(0, idx - EXTREME_WINDOW + 1)]
+
+
+def load_extreme_state(conn):
+    """讀取保存的佇列狀態，回傳 (as_of 日期字串或 None, state)"""
+    exists = conn.execute(text(f"SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = '{STATE_TABLE}')")).scalar()
+    if not exists: return None, {}
+
+    df = pd.read_sql(text(f"SELECT symbol, as_of, max_deque, min_deque FROM {STATE_TABLE}"), conn)
+    if df.empty: return None, {}
+
+    as_of = str(pd.to_datetime(df['as_of']).max().date())
+    state = {
+        sym: {'max': deque(map(tuple, json.loads(q_max))), 'min': deque(map(tuple, json.loads(q_min)))}
+        for sym, q_max, q_min in zip(df['symbol'], df['max_deque'], df['min_deque'])
+    }
+    return as_of, state
+
+
+def load_latest_extremes(conn):
+    """只讀最後一天的收盤與新高/新低旗標 (不解析佇列)，回傳 (as_of 日期字串或 None, DataFrame)"""
+    exists = conn.execute(text(f"SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = '{STATE_TABLE}')")).scalar()
+    if not exists: return None, pd.DataFrame()
+    df = pd.read_sql(text(f"SELECT symbol, as_of, close, is_new_high, is_new_low FROM {STATE_TABLE}"), conn)
+    if df.empty: return None, df
+    return str(pd.to_datetime(df['as_of']).max().date()), df
+
+
+def save_extreme_state(engine, state, as_of, last_flags, last_closes):
+    """整表覆寫 (約 2000 列)：每檔的佇列 + 最後一天的收盤與新高/新低旗標"""
+    rows = []
+    for sym, st in state.items():
+        is_high, is_low = last_flags.get(sym, (False, False))
+        rows.append({
+            'symbol': sym, 'as_of': as_of, 'close': last_closes.get(sym),
+            'is_new_high': is_high, 'is_new_low': is_low,
+            'max_deque': json.dumps(list(st['max'])), 'min_deque': json.dumps(list(st['min'])),
+        })
+    df = pd.DataFrame(rows)
+    df['as_of'] = pd.to_datetime(df['as_of']).dt.date
+    df.to_sql(STATE_TABLE, engine, if_exists='replace', index=False)
+
+
+def closes_by_date(df_raw):
+    """SELECT symbol, date, close 的結果 → {date_str: {symbol: close}} (依日期排序)"""
+    df_raw = df_raw.dropna(subset=['close'])
+    dates = pd.to_datetime(df_raw['date']).dt.strftime('%Y-%m-%d')
+    out = {}
+    for d, grp in df_raw.groupby(dates, sort=True):
+        out[d] = dict(zip(grp['symbol'], grp['close'].astype(float)))
+    return out
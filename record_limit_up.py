@@ -6,9 +6,10 @@ import os
 import time
 import requests
 import concurrent.futures
-import sqlalchemy
 from sqlalchemy import text
 
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
 # ===========================
 # 1. 基本設定與資料庫連線
 # ===========================
@@ -20,7 +21,7 @@ SUPABASE_DB_URL = os.environ.get("SUPABASE_DB_URL")
 if not SUPABASE_DB_URL:
     raise ValueError("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
 
-engine = sqlalchemy.create_engine(SUPABASE_DB_URL)
+engine = get_engine(SUPABASE_DB_URL, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
 # ===========================
 # 2. 爬蟲工作函式
@@ -0,0 +1,182 @@
+import argparse
+import datetime
+import hashlib
+import importlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ===========================
+# 報表建置圖 (tw_report_generator / us_report_generator 共用)
+# - 每個輸出 (Target) 宣告自己的輸入檔；輸入內容 (含產生器程式碼) 與上次建置相同且輸出都在，就不重新渲染
+# - 同一波彼此獨立的 Target 丟進 process pool 渲染；current 連結等依賴其他輸出的 Target 等前一波完成再跑
+#   (CI 的台股 / 美股 workflow 各自只建一個市場，一次建兩個市場時 (python report_build.py) 兩份日報才會平行)
+# - 渲染函式失敗時必須 raise；只 print 就 return 會被當成成功，舊輸出檔會被記成這次輸入的建置結果
+# - 建置紀錄存在各 base_dir 的 .report_build.json，隨報表一起 commit，CI 下次執行也能略過未變更的輸出
+# 用法：python report_build.py [tw|us ...] [--force]
+# ===========================
+MANIFEST_NAME = ".report_build.json"
+
+GENERATORS = {
+    'tw': 'tw_report_generator',
+    'us': 'us_report_generator',
+}
+
+
+class Target:
+    """
+    name: 唯一名稱；render: 'module:function' 字串 (子行程內才 import，才能跨行程傳遞)
+    inputs: 必要輸入 (缺任何一個就不建置)；optional: 可有可無的輸入 (有變動一樣會觸發重建)
+    deps: 必須先完成的 Target 名稱
+    """
+
+    def __init__(self, name, base_dir, render, inputs, outputs, optional=(), deps=()):
+        self.name = name
+        self.base_dir = base_dir
+        self.render = render
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.optional = list(optional)
+        self.deps = list(deps)
+
+
+def _manifest_path(base_dir):
+    return os.path.join(base_dir, MANIFEST_NAME)
+
+
+def load_manifest(base_dir):
+    try:
+        with open(_manifest_path(base_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'targets': {}, 'files': {}}
+
+
+def save_manifest(base_dir, manifest):
+    path = _manifest_path(base_dir)
+    os.makedirs(base_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_digest(path, file_cache):
+    """
+    檔案內容雜湊；大小與 mtime 都和上次紀錄相同時直接沿用紀錄 (不重讀檔案)
+    git checkout 會重設 mtime，此時才真的重算雜湊，內容沒變結果仍相同
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    cached = file_cache.get(path)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()[:16]
+    file_cache[path] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+
+def input_signature(target, file_cache):
+    """回傳 {path: 雜湊}；必要輸入缺檔時回傳 None"""
+    sig = {}
+    for path in target.inputs:
+        digest = file_digest(path, file_cache)
+        if digest is None: return None
+        sig[path] = digest
+    for path in target.optional:
+        sig[path] = file_digest(path, file_cache)
+    return sig
+
+
+def _run_render(render):
+    module_name, func_name = render.split(":")
+    getattr(importlib.import_module(module_name), func_name)()
+
+
+def run_build(targets, force=False, max_workers=None):
+    """依 deps 分波執行；每波只把輸入有變的 Target 丟進 process pool。回傳 {name: 'built' | 'skipped' | 'failed'}"""
+    names = {t.name for t in targets}
+    manifests = {t.base_dir: load_manifest(t.base_dir) for t in targets}
+    pending = {t.name: t for t in targets}
+    status = {}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while pending:
+            ready = [t for t in pending.values() if all(d in status or d not in names for d in t.deps)]
+            if not ready:
+                raise ValueError(f"❌ 建置圖有循環依賴: {', '.join(pending)}")
+
+            futures = {}
+            for t in ready:
+                del pending[t.name]
+                manifest = manifests[t.base_dir]
+                if any(status.get(d) == 'failed' for d in t.deps):
+                    print(f"   ⏭️ {t.name}: 前置輸出失敗，略過")
+                    status[t.name] = 'failed'
+                    continue
+                sig = input_signature(t, manifest['files'])
+                if sig is None:
+                    missing = [p for p in t.inputs if not os.path.exists(p)]
+                    print(f"   ❌ {t.name}: 缺少輸入 {', '.join(missing)}")
+                    status[t.name] = 'failed'
+                    continue
+                prev = manifest['targets'].get(t.name, {})
+                if not force and prev.get('inputs') == sig and all(os.path.exists(p) for p in t.outputs):
+                    print(f"   ✨ {t.name}: 輸入未變更，略過")
+                    status[t.name] = 'skipped'
+                    continue
+                futures[pool.submit(_run_render, t.render)] = (t, sig)
+
+            for fut in as_completed(futures):
+                t, sig = futures[fut]
+                try:
+                    fut.result()
+                except Exception as e:
+                    print(f"   ❌ {t.name} 渲染失敗: {e}")
+                    status[t.name] = 'failed'
+                    continue
+                if not all(os.path.exists(p) for p in t.outputs):
+                    print(f"   ❌ {t.name}: 渲染完成但缺少輸出 {', '.join(p for p in t.outputs if not os.path.exists(p))}")
+                    status[t.name] = 'failed'
+                    continue
+                manifests[t.base_dir]['targets'][t.name] = {
+                    'inputs': sig, 'outputs': t.outputs,
+                    'built_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                }
+                status[t.name] = 'built'
+
+    for base_dir, manifest in manifests.items():
+        # 檔案雜湊快取只留目前各 Target 用得到的路徑，避免每天的日期檔名一直累積
+        used = {p for rec in manifest['targets'].values() for p in rec['inputs']}
+        manifest['files'] = {p: v for p, v in manifest['files'].items() if p in used}
+        save_manifest(base_dir, manifest)
+    return status
+
+
+def collect_targets(groups):
+    targets = []
+    for group in groups:
+        targets += importlib.import_module(GENERATORS[group]).build_targets()
+    return targets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="只重建輸入有變動的報表")
+    parser.add_argument("groups", nargs="*", help=f"要建置的市場 ({' / '.join(GENERATORS)}，預設全部)")
+    parser.add_argument("--force", action="store_true", help="忽略建置紀錄，全部重建")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    groups = args.groups or list(GENERATORS)
+    unknown = [g for g in groups if g not in GENERATORS]
+    if unknown: parser.error(f"未知的市場: {', '.join(unknown)}")
+    print(f"🚀 建置報表: {', '.join(groups)}")
+    status = run_build(collect_targets(groups), force=args.force, max_workers=args.workers)
+    counts = {s: sum(1 for v in status.values() if v == s) for s in ('built', 'skipped', 'failed')}
+    print(f"✅ 建置完成：重建 {counts['built']}、略過 {counts['skipped']}、失敗 {counts['failed']}")
@@ -0,0 +1,241 @@
+import time
+
+import numpy as np
+import pandas as pd
+from jinja2 import Environment
+
+# ===========================
+# 日報排行榜：Top-N 選取 + 精簡資料 payload
+# - 每個分頁只把 DataFrame 轉成一次 numpy 欄位陣列，各排行榜以 argpartition 取前 N 名 (不整表排序)
+# - 每列只輸出已格式化的欄位 (代號、名稱、產業、收盤、漲跌、量、數值)，同一檔在多個榜上共用
+# - 排行榜資料存成每日一份 JSON，頁面由共用的 RANKING_JS 載入後產生表格；
+#   指數表等小表格仍以預先編譯的模板在頁面上直接輸出
+# ===========================
+TOP_N = 100
+COLORED_COLS = ['change_pct', 'foreign_net', 'trust_net', 'dealer_net']
+
+_env = Environment(autoescape=False)
+_env.filters['sign_class'] = lambda v: ' class="t-up"' if v > 0 else (' class="t-down"' if v < 0 else '')
+
+# 列欄位順序：代號, 顯示名稱, 產業, 收盤字串, 漲跌幅, 成交量字串, 是否為指數, 數值字串, 數值正負 (0 = 不上色)
+TAB_TEMPLATE = _env.from_string(
+    '{% macro ranking(t) %}'
+    '<div class="card"><h3>{{ t.title }}</h3><div class="table-wrapper"><table><thead><tr>'
+    '{% if t.rank %}<th>排名</th>{% endif %}'
+    '<th>名稱</th><th>產業</th><th>收盤</th><th>漲跌</th><th>成交量</th><th>數值</th></tr></thead><tbody>'
+    '{% for sym, name, ind, close, pct, vol, is_idx, target, sign in t.rows %}<tr>'
+    '{% if t.rank %}<td>{{ loop.index }}</td>{% endif %}'
+    '<td><a href="{{ "https://finance.yahoo.com/quote/" if is_idx else "https://tw.stock.yahoo.com/quote/" }}{{ sym }}" '
+    'target="_blank" class="stock-link">{{ name }}<br><small>{{ sym }}</small></a></td>'
+    '<td>{% if ind %}<span class="ind-badge">{{ ind }}</span>{% endif %}</td><td>{{ close }}</td>'
+    '<td{{ pct|sign_class }}>{{ "%+.2f"|format(pct) }}%</td><td>{{ vol }}</td>'
+    '<td{{ sign|sign_class }}><strong>{{ target }}</strong></td></tr>{% endfor %}'
+    '</tbody></table></div></div>'
+    '{% endmacro %}'
+    '<h2>統計日期: {{ display_date }}</h2>'
+    '{% if index_table %}<div class="grid-container" style="grid-template-columns: 1fr;">{{ ranking(index_table) }}</div>{% endif %}'
+    '{{ sector_html }}'
+    '<div class="grid-container" data-rank-tab="{{ tab_key }}"></div>'
+)
+
+# 與 TAB_TEMPLATE 的 ranking macro 產生相同的表格標記
+RANKING_JS = r"""
+function rankSignClass(v) { return v > 0 ? ' class="t-up"' : (v < 0 ? ' class="t-down"' : ''); }
+function rankRow(r, i, showRank) {
+    var host = r[6] ? 'https://finance.yahoo.com/quote/' : 'https://tw.stock.yahoo.com/quote/';
+    return '<tr>' + (showRank ? '<td>' + (i + 1) + '</td>' : '') +
+        '<td><a href="' + host + r[0] + '" target="_blank" class="stock-link">' + r[1] + '<br><small>' + r[0] + '</small></a></td>' +
+        '<td>' + (r[2] ? '<span class="ind-badge">' + r[2] + '</span>' : '') + '</td><td>' + r[3] + '</td>' +
+        '<td' + rankSignClass(r[4]) + '>' + (r[4] >= 0 ? '+' : '') + r[4].toFixed(2) + '%</td><td>' + r[5] + '</td>' +
+        '<td' + rankSignClass(r[8]) + '><strong>' + r[7] + '</strong></td></tr>';
+}
+function rankCard(t) {
+    return '<div class="card"><h3>' + t.title + '</h3><div class="table-wrapper"><table><thead><tr>' +
+        (t.rank ? '<th>排名</th>' : '') +
+        '<th>名稱</th><th>產業</th><th>收盤</th><th>漲跌</th><th>成交量</th><th>數值</th></tr></thead><tbody>' +
+        t.rows.map(function (r, i) { return rankRow(r, i, t.rank); }).join('') + '</tbody></table></div></div>';
+}
+function renderRankTables(payload) {
+    document.querySelectorAll('[data-rank-tab]').forEach(function (box) {
+        var tab = payload[box.getAttribute('data-rank-tab')];
+        if (tab) box.innerHTML = tab.map(rankCard).join('');
+    });
+}
+function loadRankTables(url) {
+    fetch(url).then(function (r) { return r.json(); }).then(renderRankTables).catch(function (e) {
+        document.querySelectorAll('[data-rank-tab]').forEach(function (box) {
+            box.innerHTML = "<div class='error-msg'>排行資料載入失敗: " + e + "</div>";
+        });
+    });
+}
+"""
+
+
+def is_index_symbol(symbol):
+    return symbol.startswith("^") or symbol.endswith(".SS") or symbol == "VIXTWN"
+
+
+def display_name(symbol, name):
+    if is_index_symbol(symbol): return name
+    name = name if name and str(name) != "nan" else symbol
+    return str(name)[:6] + ".." if len(str(name)) > 6 else name
+
+def format_number(val, is_price=False, is_idx=False):
+    if pd.isna(val): return "-"
+    if is_idx: return f"{val:,.2f}"
+    if is_price: return f"{val:.2f}"
+    return f"{int(val):,}"
+
+def value_sign(val):
+    try:
+        if val > 0: return 1
+        if val < 0: return -1
+    except: pass
+    return 0
+
+
+def ranking_arrays(df):
+    """DataFrame → 欄位陣列 (每個分頁只轉換一次)；'_fields' 為已產生過的列欄位快取"""
+    cols = {c: df[c].to_numpy() for c in df.columns}
+    n = len(df)
+    cols.setdefault('name', cols['symbol'])
+    cols.setdefault('industry', np.full(n, '', dtype=object))
+    cols['_n'] = n
+    cols['_fields'] = {}
+    return cols
+
+
+def top_n_indices(values, limit, ascending, subset=None):
+    """
+    回傳排序後前 limit 名的列索引 (等同 sort_values(...).head(limit))，NaN 排在最後
+    數值欄位以 argpartition 先取出前 N 名，只對這 N 筆排序
+    """
+    idx = np.arange(len(values)) if subset is None else np.asarray(subset)
+    vals = values[idx]
+    if vals.dtype.kind not in 'fiub':
+        order = np.argsort(vals, kind='stable')
+        return idx[order[::-1] if not ascending else order][:limit]
+
+    key = vals.astype(float)
+    if not ascending: key = -key
+    key[np.isnan(key)] = np.inf
+    if limit < len(key):
+        part = np.argpartition(key, limit - 1)[:limit]
+        return idx[part[np.argsort(key[part], kind='stable')]]
+    return idx[np.argsort(key, kind='stable')]
+
+
+def _row_fields(arrays, i):
+    # 名稱 / 產業 / 收盤 / 漲跌 / 成交量 與排行榜無關，同一檔在多個榜上只產生一次
+    fields = arrays['_fields'].get(i)
+    if fields is None:
+        sym, name, ind = arrays['symbol'][i], arrays['name'][i], arrays['industry'][i]
+        if not ind or pd.isna(ind): ind = ''
+        is_idx = is_index_symbol(sym)
+        pct = arrays['change_pct'][i]
+        fields = [
+            sym, display_name(sym, name), ind if not is_idx else '',
+            format_number(arrays['close'][i], is_price=True, is_idx=is_idx),
+            round(float(pct), 2) if pd.notna(pct) else 0.0,
+            format_number(arrays['volume'][i]) if not is_idx else "-",
+            1 if is_idx else 0,
+        ]
+        arrays['_fields'][i] = fields
+    return fields
+
+
+def ranking_table(arrays, title, sort_col, ascend, value_fmt_func=None, limit=TOP_N, show_rank=True, subset=None):
+    """單一排行榜的資料 (可直接 JSON 化)；欄位不存在或無資料時回傳 None (不顯示)"""
+    if arrays is None or arrays['_n'] == 0 or sort_col not in arrays: return None
+    if subset is not None and len(subset) == 0: return None
+
+    values = arrays[sort_col]
+    colored = sort_col in COLORED_COLS
+    rows = []
+    for i in top_n_indices(values, limit, ascend, subset):
+        target_val = values[i]
+        target_str = str(target_val)
+        if value_fmt_func:
+            try: target_str = value_fmt_func(target_val)
+            except: pass
+        rows.append(_row_fields(arrays, i) + [target_str, value_sign(target_val) if colored else 0])
+    return {'title': title, 'rank': show_rank, 'rows': rows}
+
+
+def render_tab(display_date, tab_key, index_table=None, sector_html=""):
+    """分頁外框 (日期、指數表、產業資金流向)；排行榜容器由 RANKING_JS 依 tab_key 填入"""
+    return TAB_TEMPLATE.render(display_date=display_date, tab_key=tab_key, index_table=index_table, sector_html=sector_html)
+
+
+def tab_payload(tables):
+    return [t for t in tables if t is not None]
+
+
+# ===========================
+# 效能基準：2,000 檔合成市場 × 3 個分頁
+# 舊法 (每榜整表排序 + 每列串接完整 HTML) vs. Top-N + 精簡 payload，並比較輸出大小
+# 執行：python report_tables.py
+# ===========================
+def _benchmark(n_symbols=2000, n_runs=5):
+    import json
+
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'symbol': [f"{1000 + i}.TW" for i in range(n_symbols)],
+        'name': [f"股票{i}" for i in range(n_symbols)],
+        'industry': rng.choice(['半導體', '電子零組件', '航運', '金融', '其他'], n_symbols),
+        'close': rng.uniform(10, 1000, n_symbols),
+        'change_pct': rng.normal(0, 3, n_symbols),
+        'volume': rng.integers(0, 50_000_000, n_symbols).astype(float),
+        'foreign_net': rng.normal(0, 1e6, n_symbols),
+        'trust_net': rng.normal(0, 3e5, n_symbols),
+        'dealer_net': rng.normal(0, 3e5, n_symbols),
+    })
+    df['turnover_billion'] = df['close'] * df['volume'] / 1e8
+    lots = lambda x: f"{int(x/1000):,} 張"
+    specs = [
+        ("👑 高價股", "close", False, lambda x: f"${x:,.0f}", 50),
+        ("🚀 強勢股", "change_pct", False, lambda x: f"{x:+.2f}%", TOP_N),
+        ("📉 弱勢股", "change_pct", True, lambda x: f"{x:+.2f}%", TOP_N),
+        ("🔥 熱門量", "volume", False, lots, TOP_N),
+        ("💰 成交值", "turnover_billion", False, lambda x: f"{x:.2f} 億", TOP_N),
+        ("✈️ 外資買超", "foreign_net", False, lots, TOP_N),
+        ("💸 外資賣超", "foreign_net", True, lots, TOP_N),
+        ("🏦 投信買超", "trust_net", False, lots, TOP_N),
+        ("📉 投信賣超", "trust_net", True, lots, TOP_N),
+        ("📊 自營買超", "dealer_net", False, lots, TOP_N),
+        ("📉 自營賣超", "dealer_net", True, lots, TOP_N),
+    ]
+
+    def legacy_table(df, title, sort_col, ascend, value_fmt_func, limit):
+        df_sorted = df.sort_values(sort_col, ascending=ascend).head(limit).copy()
+        html = f'''<div class="card"><h3>{title}</h3><div class="table-wrapper"><table><thead><tr><th>排名</th><th>名稱</th><th>產業</th><th>收盤</th><th>漲跌</th><th>成交量</th><th>數值</th></tr></thead><tbody>'''
+        for i, row in enumerate(df_sorted.itertuples(), 1):
+            target_val = getattr(row, sort_col)
+            ind_html = f'<span class="ind-badge">{row.industry}</span>' if row.industry else ''
+            target_style = {1: 'class="t-up"', -1: 'class="t-down"'}.get(value_sign(target_val), '') if sort_col in COLORED_COLS else ""
+            pct_style = {1: 'class="t-up"', -1: 'class="t-down"'}.get(value_sign(row.change_pct), '')
+            link = f'<a href="https://tw.stock.yahoo.com/quote/{row.symbol}" target="_blank" class="stock-link">{display_name(row.symbol, row.name)}<br><small>{row.symbol}</small></a>'
+            html += f'''<tr><td>{i}</td><td>{link}</td><td>{ind_html}</td><td>{format_number(row.close, is_price=True)}</td><td {pct_style}>{row.change_pct:+.2f}%</td><td>{format_number(row.volume)}</td><td {target_style}><strong>{value_fmt_func(target_val)}</strong></td></tr>'''
+        return html + '</tbody></table></div></div>'
+
+    def legacy():
+        html = "<h2>統計日期: 2025-01-02</h2>"
+        return html + '<div class="grid-container">' + "".join(legacy_table(df, *s) for s in specs) + '</div>'
+
+    def fast():
+        arrays = ranking_arrays(df)
+        tables = tab_payload([ranking_table(arrays, t, c, a, f, limit=n) for t, c, a, f, n in specs])
+        return render_tab("2025-01-02", "D"), json.dumps(tables, ensure_ascii=False, separators=(",", ":"))
+
+    for name, fn in [("sort_values + 字串串接", legacy), ("argpartition + payload", fast)]:
+        t0 = time.perf_counter()
+        for _ in range(n_runs):
+            out = [fn() for _tab in ('D', 'W', 'M')]
+        elapsed = (time.perf_counter() - t0) / n_runs * 1000
+        size = sum(len("".join(o if isinstance(o, tuple) else (o,)).encode("utf-8")) for o in out)
+        print(f"{name:<24} 3 個分頁 {elapsed:7.1f} ms | 輸出 {size / 1024:7.1f} KB")
+
+
+if __name__ == "__main__":
+    _benchmark()
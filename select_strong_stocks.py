@@ -1,8 +1,11 @@
 import os
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from datetime import datetime, timedelta
 
+from dashboard_publisher import publish_html
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
+
 # ===========================
 # 1. 配置與連線
 # ===========================
@@ -15,7 +18,7 @@ if not SUPABASE_DB_URL:
     exit(1)
 
 try:
-    engine = create_engine(SUPABASE_DB_URL)
+    engine = get_engine(SUPABASE_DB_URL, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 except Exception as e:
     print(f"❌ 資料庫連線失敗: {e}")
     exit(1)
@@ -133,11 +136,8 @@ def generate_html_report(df, target_date):
     mm = target_dt.strftime("%m")
     date_str = target_dt.strftime("%Y%m%d")
     
-    output_dir = os.path.join(BASE_OUTPUT_DIR, yyyy, mm)
-    os.makedirs(output_dir, exist_ok=True)
-    
     filename = f"strong_stocks_{date_str}.html"
-    filepath = os.path.join(output_dir, filename)
+    filepath = os.path.join(BASE_OUTPUT_DIR, yyyy, mm, filename)
 
     # HTML 樣板 (內嵌優化版 JavaScript)
     html_content = f"""
@@ -183,7 +183,7 @@ def generate_html_report(df, target_date):
             .down {{ color: var(--green); font-weight: bold; }}
             .vol-tag {{ color: #ffa726; font-size: 0.8rem; }}
         </style>
-        <script>
+        <script data-shared>
             document.addEventListener('DOMContentLoaded', function() {{
                 const table = document.getElementById("stockTable");
                 const headers = table.querySelectorAll("th");
@@ -318,8 +318,7 @@ def generate_html_report(df, target_date):
     </html>
     """
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(html_content)
+    publish_html(BASE_OUTPUT_DIR, f"{yyyy}/{mm}/{filename}", html_content, "strong_stocks")
     
     print(f"✅ [HTML] 篩選報表已生成: {filepath}")
 
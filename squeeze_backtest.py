@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+
+from ta_kernels import consecutive_true_count
+
+# ===========================
+# 均線糾結 Walk-Forward 回測引擎
+# ===========================
+FORWARD_HORIZONS = (1, 5, 10, 20)
+
+
+def prepare_screener_features(df, df_long):
+    """
+    整理糾結選股所需的衍生欄位 (前一日指標、籌碼紀錄、糾結度、KD 中檔金叉)
+    df: daily_stock_indicators 明細 (依 symbol, date 排序)
+    df_long: 較長區間的 close / volume，用來補算 MA120 與均量
+    """
+    df_long['date'] = pd.to_datetime(df_long['date'])
+    df['date'] = pd.to_datetime(df['date'])
+    df_long['symbol'] = df_long['symbol'].astype(str).str.strip()
+    df['symbol'] = df['symbol'].astype(str).str.strip()
+
+    # 算 120MA 與均量
+    df_long['MA120'] = df_long['close'].rolling(120).mean()
+    df_long['Vol_MA5'] = df_long['volume'].rolling(5).mean()
+    df_long['Vol_MA10'] = df_long['volume'].rolling(10).mean()
+    df_long.loc[df_long['symbol'] != df_long['symbol'].shift(119), 'MA120'] = np.nan
+    df_long.loc[df_long['symbol'] != df_long['symbol'].shift(4), 'Vol_MA5'] = np.nan
+    df_long.loc[df_long['symbol'] != df_long['symbol'].shift(9), 'Vol_MA10'] = np.nan
+
+    df = pd.merge(df, df_long[['date', 'symbol', 'MA120', 'Vol_MA5', 'Vol_MA10']], on=['date', 'symbol'], how='left')
+
+    df['Total_Score'] = df['Total_Score'].fillna(0).astype(np.int16)
+    df['Signal_List'] = df['Signal_List'].fillna("")
+    for col in ['foreign_net', 'trust_net', 'K', 'D', 'MACD_OSC', 'DIF', 'Vol_Ratio']:
+        if col not in df.columns: df[col] = np.nan
+
+    # 產生「前一日」指標比較基準
+    is_same_sym = df['symbol'] == df['symbol'].shift(1)
+    for col in ['MA5', 'MA10', 'MA20', 'MA60', 'MA120', 'high', 'close', 'K', 'D', 'MACD_OSC', 'Vol_MA5', 'Vol_MA10']:
+        df[f'prev_{col}'] = np.where(is_same_sym, df[col].shift(1), np.nan)
+
+    # 籌碼面：計算前 1~5 日的外資/投信紀錄 (為了連買與初次買超過濾)
+    for i in range(1, 6):
+        is_same_i = df['symbol'] == df['symbol'].shift(i)
+        df[f'prev{i}_foreign_net'] = np.where(is_same_i, df['foreign_net'].shift(i), np.nan)
+        df[f'prev{i}_trust_net'] = np.where(is_same_i, df['trust_net'].shift(i), np.nan)
+
+    df['max_ma'] = np.maximum(df['MA5'], np.maximum(df['MA10'], df['MA20']))
+    df['min_ma'] = np.minimum(df['MA5'], np.minimum(df['MA10'], df['MA20']))
+    df['sq_pct'] = (df['max_ma'] - df['min_ma']) / df['min_ma']
+
+    # KD 金叉 35-65 中檔區
+    df['is_kd_gc'] = (df['K'] > df['D']) & (df['prev_K'] <= df['prev_D'])
+    df['is_kd_gc_mid'] = df['is_kd_gc'] & (df['K'] >= 35) & (df['K'] <= 65)
+    kd_mid_1 = df['is_kd_gc_mid'].shift(1, fill_value=False) & is_same_sym
+    kd_mid_2 = df['is_kd_gc_mid'].shift(2, fill_value=False) & (df['symbol'] == df['symbol'].shift(2))
+    df['kd_gc_3d_mid_flag'] = df['is_kd_gc_mid'] | kd_mid_1 | kd_mid_2
+
+    # 近 10 日最大量增比 (先前有出攻擊量)
+    df['Vol_Ratio_max10'] = df.groupby('symbol', sort=False)['Vol_Ratio'].rolling(10, min_periods=1).max().reset_index(level=0, drop=True)
+    return df
+
+
+def build_filter_mask(df, f):
+    """
+    單列條件過濾 (不需要歷史序列的條件)，可同時套用在單日橫斷面或全期間 date × symbol 明細
+    """
+    cond = (df['volume'] >= f['min_vol']) & (df['close'] >= f['min_price']) & (df['sq_pct'] <= f['sq_thresh'])
+    if f['filter_capital']: cond &= (df['Capital'] <= f['capital_limit'])
+
+    # [進階設定]
+    if f['short_bull']: cond &= (df['MA5'] > df['MA10']) & (df['MA10'] > df['MA20'])
+    if f['long_bull']: cond &= (df['MA60'] > df['MA120'])
+    if f['above_3ma']: cond &= (df['close'] > df['MA5']) & (df['close'] > df['MA10']) & (df['close'] > df['MA20'])
+    if f['above_5ma']: cond &= (df['close'] > df['MA5']) & (df['close'] > df['MA10']) & (df['close'] > df['MA20']) & (df['close'] > df['MA60']) & (df['close'] > df['MA120'])
+    if f['limit_bias_60']: cond &= (abs(df['close'] - df['MA60']) / df['MA60'] <= (f['bias_limit'] / 100.0))
+
+    # [攻擊型態與技術指標]
+    if f['break_high']: cond &= (df['close'] > df['prev_high'])
+    if f['up_2pct']: cond &= (((df['close'] - df['prev_close']) / df['prev_close'] * 100) >= 2.0) & (df['close'] > df['open'])
+    if f['solid_red']: cond &= ((df['close'] - df['open']) > 0) & ((df['close'] - df['open']) >= (df['high'] - df['low']) / 3.0)
+    if f['kd_about_gc']: cond &= (df['K'] < df['D']) & ((df['D'] - df['K']) <= 3) & (df['K'] > df['prev_K'])
+    if f['kd_3d_mid']: cond &= (df['kd_gc_3d_mid_flag'] == True)
+    if f['macd_about_red']: cond &= (df['MACD_OSC'] < 0) & (df['MACD_OSC'] > df['prev_MACD_OSC'])
+    if f['macd_red']: cond &= (df['MACD_OSC'] > 0)
+
+    ma5_up = df['MA5'] > df['prev_MA5']
+    ma10_up = df['MA10'] > df['prev_MA10']
+    ma20_up = df['MA20'] > df['prev_MA20']
+    ma60_up = df['MA60'] > df['prev_MA60']
+    ma120_up = df['MA120'] > df['prev_MA120']
+
+    if f['ma_all_up']: cond &= ma5_up & ma10_up & ma20_up & ma60_up & ma120_up
+    if f['ma5_up']: cond &= ma5_up
+    if f['ma10_up']: cond &= ma10_up
+    if f['ma20_up']: cond &= ma20_up
+    if f['ma60_up']: cond &= ma60_up
+    if f['ma120_up']: cond &= ma120_up
+
+    # [籌碼指標篩選]
+    if f['foreign_buy_3d']: cond &= (df['foreign_net'] > 0) & (df['prev1_foreign_net'] > 0) & (df['prev2_foreign_net'] > 0)
+    if f['trust_buy_3d']: cond &= (df['trust_net'] > 0) & (df['prev1_trust_net'] > 0) & (df['prev2_trust_net'] > 0)
+    if f['tu_yang']: cond &= (df['foreign_net'] > 0) & (df['trust_net'] > 0)
+    if f['foreign_buy']: cond &= (df['foreign_net'] >= f['foreign_buy_vol'])
+    if f['trust_buy']: cond &= (df['trust_net'] >= f['trust_buy_vol'])
+    if f['trust_first_buy']:
+        cond &= (df['trust_net'] > 0) & (df['prev1_trust_net'] <= 0) & (df['prev2_trust_net'] <= 0) & (df['prev3_trust_net'] <= 0) & (df['prev4_trust_net'] <= 0) & (df['prev5_trust_net'] <= 0)
+    return cond
+
+
+def build_signal_mask(df, f):
+    """
+    全期間訊號遮罩：單列條件 + 攻擊量 + 連續糾結天數，回傳 (mask, 連續糾結天數)
+    """
+    cond = build_filter_mask(df, f)
+    if f['attack_vol']: cond &= (df['Vol_Ratio_max10'] >= f['attack_vol_ratio'])
+    sq_days = consecutive_true_count((df['sq_pct'] <= f['sq_thresh']).to_numpy(), df['symbol'].to_numpy())
+    cond &= (sq_days >= f['min_days'])
+    return cond.to_numpy(dtype=bool), sq_days
+
+
+def build_forward_return_matrix(close_mat, horizons=FORWARD_HORIZONS):
+    """
+    由 date × symbol 收盤價矩陣預先算出各持有天數的未來報酬 (%)，
+    以及最大持有期間內的最大回撤 (以收盤價計，%)
+    """
+    fwd = {h: (np.roll(close_mat, -h, axis=0) / close_mat - 1.0) * 100 for h in horizons}
+    for h in horizons:
+        fwd[h][-h:, :] = np.nan
+
+    max_h = max(horizons)
+    future_min = (
+        pd.DataFrame(close_mat[::-1]).rolling(max_h, min_periods=1).min()
+        .shift(1).to_numpy()[::-1]
+    )
+    drawdown = np.minimum(future_min / close_mat - 1.0, 0.0) * 100
+    return fwd, drawdown
+
+
+def run_walk_forward_backtest(df, f, horizons=FORWARD_HORIZONS):
+    """
+    一次向量化運算：在每個歷史交易日套用篩選條件，統計各訊號日的命中數、
+    平均/中位數報酬、勝率與最大回撤
+    回傳 (每日統計 DataFrame, 全期間彙總 DataFrame)
+    """
+    if df is None or df.empty: return pd.DataFrame(), pd.DataFrame()
+
+    mask, _ = build_signal_mask(df, f)
+    date_idx, dates = pd.factorize(df['date'], sort=True)
+    sym_idx, symbols = pd.factorize(df['symbol'])
+
+    close_mat = np.full((len(dates), len(symbols)), np.nan)
+    close_mat[date_idx, sym_idx] = df['close'].to_numpy(dtype=float)
+    close_mat[close_mat <= 0] = np.nan
+
+    fwd, drawdown = build_forward_return_matrix(close_mat, horizons)
+
+    hit_d, hit_s = date_idx[mask], sym_idx[mask]
+    if len(hit_d) == 0: return pd.DataFrame(), pd.DataFrame()
+
+    hits = pd.DataFrame({'date': dates[hit_d], 'symbol': symbols[hit_s]})
+    for h in horizons:
+        hits[f'ret_{h}d'] = fwd[h][hit_d, hit_s]
+    hits['drawdown'] = drawdown[hit_d, hit_s]
+
+    for h in horizons:
+        col = f'ret_{h}d'
+        hits[f'win_{h}d'] = np.where(hits[col].notna(), (hits[col] > 0).astype(float), np.nan)
+
+    g = hits.groupby('date')
+    per_date = pd.DataFrame({'hits': g.size()})
+    for h in horizons:
+        col = f'ret_{h}d'
+        per_date[f'avg_{h}d'] = g[col].mean()
+        per_date[f'median_{h}d'] = g[col].median()
+        per_date[f'win_rate_{h}d'] = g[f'win_{h}d'].mean() * 100
+    per_date['avg_drawdown'] = g['drawdown'].mean()
+    per_date['max_drawdown'] = g['drawdown'].min()
+    per_date = per_date.reset_index()
+
+    summary = pd.DataFrame([{
+        'horizon': f'{h}日',
+        'signals': int(hits[f'ret_{h}d'].notna().sum()),
+        'avg_return': hits[f'ret_{h}d'].mean(),
+        'median_return': hits[f'ret_{h}d'].median(),
+        'win_rate': hits[f'win_{h}d'].mean() * 100,
+    } for h in horizons])
+    return per_date, summary
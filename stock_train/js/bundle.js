@@ -0,0 +1,81 @@
+// js/bundle.js
+// 讀取 stock_train_bundle.py 產生的 bundle.json / bundle.bin
+// 每個資料夾的 index 只抓一次；切換股票時以 HTTP Range 只抓該檔那一段，再用 Float32Array 切成各欄
+// 找不到 bundle 或該檔不在 bundle 內時回傳 null，由呼叫端退回逐檔 CSV
+(function (global) {
+  "use strict";
+
+  const indexCache = {};
+
+  function loadIndex(folder) {
+    if (!indexCache[folder]) {
+      indexCache[folder] = fetch(`${folder}/bundle.json`, { cache: "no-cache" })
+        .then(r => (r.ok ? r.json() : null))
+        .catch(() => null);
+    }
+    return indexCache[folder];
+  }
+
+  // float32 存價格會有 0.00001 級誤差，台股價格最小到 0.01，四捨五入回原值
+  const price = v => Math.round(v * 100) / 100;
+  const nullable = arr => Array.from(arr, v => (Number.isNaN(v) ? null : v));
+  const dayToDate = day => new Date(day * 86400000).toISOString().slice(0, 10);
+
+  async function load(folder, stock) {
+    const idx = await loadIndex(folder);
+    if (!idx || !idx.symbols[stock]) return null;
+
+    const [offset, rows] = idx.symbols[stock];
+    const cols = idx.columns;
+    const start = offset * 4;
+    const end = start + rows * cols.length * 4 - 1;
+
+    const r = await fetch(`${folder}/bundle.bin`, { headers: { Range: `bytes=${start}-${end}` } });
+    if (!r.ok) return null;
+    let buf = await r.arrayBuffer();
+    if (r.status !== 206) buf = buf.slice(start, end + 1);   // 伺服器不支援 Range 時回整檔
+
+    const view = new Float32Array(buf);
+    const col = name => {
+      const i = cols.indexOf(name);
+      return view.subarray(i * rows, (i + 1) * rows);
+    };
+
+    const day = col("day"), open = col("open"), high = col("high"), low = col("low"),
+          close = col("close"), volume = col("volume");
+    const data = new Array(rows);
+    for (let i = 0; i < rows; i++) {
+      data[i] = {
+        time: dayToDate(day[i]),
+        open: price(open[i]), high: price(high[i]), low: price(low[i]), close: price(close[i]),
+        volume: Math.round(volume[i])
+      };
+    }
+
+    // 與 Indicators.computeAll 相同的結構，另外附上 MA5/10/20
+    const macd = Array.from(col("macd"));
+    const signal = Array.from(col("macd_signal"));
+    const ma20 = nullable(col("ma20"));
+    const std = nullable(col("bb_std"));
+    const indicators = {
+      K: Array.from(col("k")),
+      D: Array.from(col("d")),
+      RSI: Array.from(col("rsi")),
+      MACD: macd,
+      MACDSignal: signal,
+      MACDHist: macd.map((v, i) => v - signal[i]),
+      BB: {
+        upper: ma20.map((m, i) => (m != null && std[i] != null ? m + std[i] * 2 : null)),
+        mid: ma20,
+        lower: ma20.map((m, i) => (m != null && std[i] != null ? m - std[i] * 2 : null)),
+      },
+      MA5: nullable(col("ma5")),
+      MA10: nullable(col("ma10")),
+      MA20: ma20,
+    };
+    return { data, indicators };
+  }
+
+  global.Bundle = { load };
+
+})(window);
@@ -135,20 +135,22 @@
 
     const visibleBars = opt.visibleBars || 40;
     const indType = opt.indicatorType;
+    // 打包檔已預先算好 MA (indicators.MA5 ...)，沒有才現算
+    const maOf = (closes, p) => (indicators["MA" + p] ? indicators["MA" + p].slice(0, closes.length) : U.sma(closes, p));
 
     // ===== build cache once =====
     if (!cacheReady) {
       const closes = shown.map(c => c.close);
 
-      maCache.ma5  = U.sma(closes, 5)
+      maCache.ma5  = maOf(closes, 5)
         .map((v,i)=>v!=null?{ time: shown[i].time, value: v }:null)
         .filter(Boolean);
 
-      maCache.ma10 = U.sma(closes,10)
+      maCache.ma10 = maOf(closes, 10)
         .map((v,i)=>v!=null?{ time: shown[i].time, value: v }:null)
         .filter(Boolean);
 
-      maCache.ma20 = U.sma(closes,20)
+      maCache.ma20 = maOf(closes, 20)
         .map((v,i)=>v!=null?{ time: shown[i].time, value: v }:null)
         .filter(Boolean);
 
@@ -184,15 +186,15 @@
     if (opt.showMA) {
       const closes = shown.map(c => c.close);
 
-      const ma5Pts = U.sma(closes, 5)
+      const ma5Pts = maOf(closes, 5)
         .map((v,i)=> (v != null ? { time: shown[i].time, value: v } : null))
         .filter(Boolean);
 
-      const ma10Pts = U.sma(closes, 10)
+      const ma10Pts = maOf(closes, 10)
         .map((v,i)=> (v != null ? { time: shown[i].time, value: v } : null))
         .filter(Boolean);
 
-      const ma20Pts = U.sma(closes, 20)
+      const ma20Pts = maOf(closes, 20)
         .map((v,i)=> (v != null ? { time: shown[i].time, value: v } : null))
         .filter(Boolean);
 
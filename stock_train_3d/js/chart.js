@@ -158,9 +158,11 @@
 
     // 3. 均線
     const closes = shown.map(c => c.close);
-    const ma5Data = cleanData(U.sma(closes, 5).map((v,i)=>({ time: shown[i].time, value: v })));
-    const ma10Data = cleanData(U.sma(closes, 10).map((v,i)=>({ time: shown[i].time, value: v })));
-    const ma20Data = cleanData(U.sma(closes, 20).map((v,i)=>({ time: shown[i].time, value: v })));
+    // 打包檔已預先算好 MA (indicators.MA5 ...)，沒有才現算
+    const maOf = (closes, p) => (indicators && indicators["MA" + p] ? indicators["MA" + p].slice(0, closes.length) : U.sma(closes, p));
+    const ma5Data = cleanData(maOf(closes, 5).map((v,i)=>({ time: shown[i].time, value: v })));
+    const ma10Data = cleanData(maOf(closes, 10).map((v,i)=>({ time: shown[i].time, value: v })));
+    const ma20Data = cleanData(maOf(closes, 20).map((v,i)=>({ time: shown[i].time, value: v })));
 
     ma5.setData(ma5Data); ma5.applyOptions({ visible: !!opt.showMA });
     ma10.setData(ma10Data); ma10.applyOptions({ visible: !!opt.showMA });
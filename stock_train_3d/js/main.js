@@ -269,12 +269,16 @@
     U.el("stockName").innerText = ""; // 一開始隱藏
 	U.el("feedback").innerText = "";  // 一開始隱藏
 
-    fetch(csvPath)
-      .then(r => r.text())
-      .then(text => {
+    // 日 K 先走打包檔 (bundle.bin，指標已預先算好)，沒有再退回逐檔 CSV
+    const bundleLoad = (tradeMode === "future" || !global.Bundle)
+      ? Promise.resolve(null)
+      : global.Bundle.load(folder, stock).catch(() => null);
+
+    bundleLoad
+      .then(bundle => bundle || fetch(csvPath).then(r => r.text()).then(text => {
         const lines = text.split("\n").slice(1);
 
-		data = lines
+		const rows = lines
 		  .map(l => l.trim())
 		  .filter(l => l)   // ✅ 先濾掉空行
 		  .map(l => {
@@ -308,6 +312,11 @@
 		  })
 		  .filter(Boolean);   // ✅ 最後再清一次
 
+        return { data: rows, indicators: null };
+      }))
+      .then(loaded => {
+        data = loaded.data;
+
         if (!data.length) return alert("CSV 空白");
 
         // ⭐ 起始交易日 = 2025-01-02
@@ -329,7 +338,7 @@
         currentIndex = startIdx;
 
         // MA / 指標相關資料
-        indicators = Indicators.computeAll(data);
+        indicators = loaded.indicators || Indicators.computeAll(data);
         allSignals = Signals.evaluateSignalsForAll(Signals.buildSignalContext(data));
 
         Chart.init();
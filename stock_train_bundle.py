@@ -0,0 +1,117 @@
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from dashboard_publisher import write_if_changed
+from ta_kernels import kd_from_rsv, rsi_wilder
+
+# ===========================
+# stock_train 練習器資料打包
+# 每個 data_* 資料夾輸出兩個檔案 (原本的 CSV 保留，前端載入失敗時仍可退回逐檔 CSV)：
+# - bundle.bin：所有股票串接的 float32 區塊；每檔一段，段內為「欄優先」(先全部日期、再全部開盤價 ...)
+# - bundle.json：欄位名稱 + 每檔在 bin 中的 [起始 float 位置, 筆數]
+# 前端先抓 bundle.json，切換股票時用 HTTP Range 只抓該檔那一段，再以 Float32Array 直接切成各欄
+# 指標在這裡算好 (與 js/indicators.js、chart.js 的定義一致)，瀏覽器不必再逐檔重算
+# 用法：python stock_train_bundle.py [資料夾 ...]  (預設 stock_train / stock_train_3d 下全部日 K 資料夾)
+# ===========================
+ROOTS = ["stock_train", "stock_train_3d"]
+SKIP_DIRS = {"data_txf_5m_daily"}   # 5 分 K 的時間戳 float32 放不下，維持 CSV
+BUNDLE_BIN = "bundle.bin"
+BUNDLE_INDEX = "bundle.json"
+BUNDLE_VERSION = 1
+
+# day = 1970-01-01 起算的天數 (float32 可精確表示)；MACD 柱 = macd - macd_signal、布林 = ma20 ± 2 × bb_std 由前端推得
+COLUMNS = ["day", "open", "high", "low", "close", "volume",
+           "ma5", "ma10", "ma20", "k", "d", "rsi", "macd", "macd_signal", "bb_std"]
+
+
+def sma(values, period):
+    # 不足 period 筆為 NaN (前端視為 null)
+    return pd.Series(values).rolling(period).mean().to_numpy()
+
+
+def ema(values, period):
+    # 與 js/util.js 的 Util.ema 相同：第一筆為起點，k = 2 / (period + 1)
+    return pd.Series(values).ewm(alpha=2 / (period + 1), adjust=False).mean().to_numpy()
+
+
+def compute_columns(df):
+    """回傳 {欄位: float64 陣列}，df 需有 date/open/high/low/close/volume 且依日期排序"""
+    close = df["close"].to_numpy(dtype=float)
+    high = df["high"].to_numpy(dtype=float)
+    low = df["low"].to_numpy(dtype=float)
+
+    hh = pd.Series(high).rolling(9).max().to_numpy()
+    ll = pd.Series(low).rolling(9).min().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = np.where(hh == ll, 50.0, (close - ll) / (hh - ll) * 100)
+    rsv[np.isnan(hh)] = np.nan
+    k, d = kd_from_rsv(rsv)
+
+    macd = ema(close, 12) - ema(close, 26)
+    days = (pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]").astype(np.int64)).astype(float)
+
+    return {
+        "day": days, "open": df["open"].to_numpy(dtype=float), "high": high, "low": low, "close": close,
+        "volume": df["volume"].to_numpy(dtype=float),
+        "ma5": sma(close, 5), "ma10": sma(close, 10), "ma20": sma(close, 20),
+        "k": k, "d": d, "rsi": rsi_wilder(close, 14),
+        "macd": macd, "macd_signal": ema(macd, 9),
+        "bb_std": pd.Series(close).rolling(20).std(ddof=0).to_numpy(),
+    }
+
+
+def read_stock_csv(path):
+    df = pd.read_csv(path, encoding="utf-8-sig")
+    df.columns = df.columns.str.strip().str.lower()
+    df = df.dropna(subset=["date", "close"])
+    return df.sort_values("date").reset_index(drop=True)
+
+
+def build_bundle(data_dir):
+    """打包單一資料夾；回傳 (股票數, bin 大小)。內容沒變就不重寫"""
+    blocks, symbols, offset = [], {}, 0
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.csv"))):
+        sym = os.path.splitext(os.path.basename(path))[0]
+        try:
+            df = read_stock_csv(path)
+        except Exception as e:
+            print(f"   ⚠️ {path} 讀取失敗，略過: {e}")
+            continue
+        if df.empty: continue
+        cols = compute_columns(df)
+        block = np.concatenate([cols[c] for c in COLUMNS]).astype("<f4")
+        blocks.append(block)
+        symbols[sym] = [offset, len(df)]
+        offset += block.size
+
+    if not blocks: return 0, 0
+    data = np.concatenate(blocks).tobytes()
+    index = {"version": BUNDLE_VERSION, "dtype": "float32", "columns": COLUMNS, "symbols": symbols}
+    # 先寫 bin 再寫 index：前端看到新 index 時 bin 一定已是新的
+    write_if_changed(os.path.join(data_dir, BUNDLE_BIN), data, precompress=False)
+    write_if_changed(os.path.join(data_dir, BUNDLE_INDEX), json.dumps(index, separators=(",", ":")), precompress=False)
+    return len(symbols), len(data)
+
+
+def default_dirs():
+    dirs = []
+    for root in ROOTS:
+        dirs += [d for d in sorted(glob.glob(os.path.join(root, "data_*")))
+                 if os.path.isdir(d) and os.path.basename(d) not in SKIP_DIRS]
+    return dirs
+
+
+def main(dirs=None):
+    for data_dir in dirs or default_dirs():
+        n, size = build_bundle(data_dir)
+        print(f"📦 {data_dir}: {n} 檔 → {BUNDLE_BIN} {size / 1024:,.0f} KB")
+    print("全部完成！")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
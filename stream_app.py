@@ -1,13 +1,14 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import sqlalchemy
 import os
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from datetime import datetime, timedelta
 
+from db_engine import get_engine
+
 # ===========================
 # 1. 頁面設定與 CSS
 # ===========================
@@ -29,7 +30,6 @@ st.markdown("""
 # ===========================
 # 2. 資料庫連線
 # ===========================
-@st.cache_resource
 def get_db_engine():
     db_url = os.environ.get("SUPABASE_DB_URL")
     if not db_url and st.secrets:
@@ -37,7 +37,7 @@ def get_db_engine():
     if not db_url:
         st.error("❌ 找不到資料庫連線！請設定 SUPABASE_DB_URL。")
         st.stop()
-    return create_engine(db_url)
+    return get_engine(db_url)
 
 # ===========================
 # 3. 核心邏輯 (使用預計算資料)
@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
 import numpy as np  # 用於數學運算
-import sqlalchemy
 from sqlalchemy import text
-from sqlalchemy.pool import NullPool
 import os
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import bcrypt
 
+from db_engine import get_engine
+
 # ===========================
 # 1. 資料庫連線與設定
 # ===========================
@@ -19,11 +19,7 @@ if not SUPABASE_DB_URL:
     st.error("❌ 未偵測到 SUPABASE_DB_URL，請設定環境變數。")
     st.stop()
 
-@st.cache_resource
-def get_engine():
-    return sqlalchemy.create_engine(SUPABASE_DB_URL, poolclass=NullPool)
-
-engine = get_engine()
+engine = get_engine(SUPABASE_DB_URL)
 
 # ===========================
 # 2. 身份驗證與註冊模組
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+# ===========================
+# 共用數值運算核心 (純 numpy / pandas，不依賴 streamlit)
+# ===========================
+
+def segment_starts(keys):
+    """
+    回傳每個分段 (例如同一檔股票) 第一列的布林陣列
+    keys 必須已依分段排序 (如 ORDER BY symbol, date)
+    """
+    k = np.asarray(keys)
+    starts = np.ones(len(k), dtype=bool)
+    if len(k) > 1:
+        starts[1:] = k[1:] != k[:-1]
+    return starts
+
+
+def consecutive_true_count(mask, keys=None):
+    """
+    分段感知的「連續成立天數」計數器
+    每一列回傳：截至該列為止、同一分段內連續為 True 的天數 (該列為 False 則為 0)
+    """
+    m = np.asarray(mask, dtype=bool)
+    if len(m) == 0:
+        return np.zeros(0, dtype=np.int32)
+    csum = np.cumsum(m)
+    base = np.where(~m, csum, 0)
+    if keys is not None:
+        # 分段起點若成立，基準設為前一列累計值，使計數從 1 重新開始
+        starts = segment_starts(keys)
+        base = np.where(starts & m, csum - 1, base)
+    base = np.maximum.accumulate(base)
+    return (csum - base).astype(np.int32)
+
+
+def kd_from_rsv(rsv, seed=50.0):
+    """
+    KD (9,3,3) 遞迴式的向量化版本：K = 2/3 * K' + 1/3 * RSV，D = 2/3 * D' + 1/3 * K
+    第一筆以 seed 起算，RSV 為 NaN 的日子沿用前一日 K/D (與逐筆迴圈結果一致)
+    """
+    rsv = pd.Series(np.asarray(rsv, dtype=float))
+    if rsv.empty:
+        return rsv.to_numpy(), rsv.to_numpy()
+    k_src = rsv.copy()
+    k_src.iloc[0] = seed
+    k = k_src.ewm(alpha=1/3, adjust=False, ignore_na=True).mean()
+    d_src = k.where(rsv.notna())
+    d_src.iloc[0] = seed
+    d = d_src.ewm(alpha=1/3, adjust=False, ignore_na=True).mean()
+    return k.to_numpy(), d.to_numpy()
+
+
+def prior_window_extreme(values, window):
+    """
+    前 window 日 (不含當日) 的最大/最小值及其位置，回傳 (max, argmax_idx, min, argmin_idx)
+    位置為原陣列索引；資料不足的列為 NaN / -1
+    """
+    v = np.asarray(values, dtype=float)
+    n = len(v)
+    hi = np.full(n, np.nan); lo = np.full(n, np.nan)
+    hi_idx = np.full(n, -1); lo_idx = np.full(n, -1)
+    if n <= window:
+        return hi, hi_idx, lo, lo_idx
+    win = np.lib.stride_tricks.sliding_window_view(v, window)[:-1]
+    offs = np.arange(n - window)
+    hi[window:] = win.max(axis=1); lo[window:] = win.min(axis=1)
+    hi_idx[window:] = offs + win.argmax(axis=1)
+    lo_idx[window:] = offs + win.argmin(axis=1)
+    return hi, hi_idx, lo, lo_idx
+
+
+def rsi_wilder(close, period=14, fill=50.0):
+    """
+    Wilder RSI：前 period 個漲跌取簡單平均為起點，之後以 1/period 平滑
+    資料不足 period+1 筆的位置填 fill (與 stock_train/js/indicators.js 一致)
+    """
+    c = np.asarray(close, dtype=float)
+    out = np.full(len(c), fill)
+    if len(c) <= period:
+        return out
+    diff = np.diff(c)
+    up, down = np.clip(diff, 0, None), np.clip(-diff, 0, None)
+    # 第 period 根的平均作為 ewm 起點，之後 avg = (avg * (period-1) + x) / period
+    gain = pd.Series(np.r_[up[:period].mean(), up[period:]]).ewm(alpha=1/period, adjust=False).mean().to_numpy()
+    loss = pd.Series(np.r_[down[:period].mean(), down[period:]]).ewm(alpha=1/period, adjust=False).mean().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / loss))
+    out[period:] = rsi
+    return out
+
+
+def ema(values, span):
+    """EMA (k = 2 / (span + 1))，第一筆為起點，與 pandas ewm(span, adjust=False) 相同"""
+    return pd.Series(np.asarray(values, dtype=float)).ewm(span=span, adjust=False).mean().to_numpy()
+
+
+def rsv_from_hlc(high, low, close, period=9, fill=50.0):
+    """RSV = (收 - N 日最低) / (N 日最高 - N 日最低) × 100；資料不足或高低相同的位置填 fill"""
+    hh = pd.Series(np.asarray(high, dtype=float)).rolling(period).max().to_numpy()
+    ll = pd.Series(np.asarray(low, dtype=float)).rolling(period).min().to_numpy()
+    c = np.asarray(close, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsv = (c - ll) / (hh - ll) * 100
+    return np.where(np.isfinite(rsv), rsv, fill)
+
+
+def cdp_levels(high, low, close):
+    """
+    CDP 逆勢操作五線 (以前一日高低收推得當日價位)，回傳 (AH, NH, CDP, NL, AL)
+    CDP = (H + L + 2C) / 4；AH/AL = CDP ± (H - L)；NH = 2CDP - L；NL = 2CDP - H
+    """
+    h = np.r_[np.nan, np.asarray(high, dtype=float)[:-1]]
+    l = np.r_[np.nan, np.asarray(low, dtype=float)[:-1]]
+    c = np.r_[np.nan, np.asarray(close, dtype=float)[:-1]]
+    cdp = (h + l + 2 * c) / 4
+    rng = h - l
+    return cdp + rng, 2 * cdp - l, cdp, 2 * cdp - h, cdp - rng
+
+
+def volume_profile(prices, volumes, bins=80, price_range=None):
+    """
+    分價量表：把成交量依價格分到 bins 個等寬區間加總 (np.bincount)，回傳 (各區間量, 區間中點)
+    price_range 預設為價格最小 ~ 最大 (與 np.histogram 相同；全部同價時上下各放寬 0.5)
+    """
+    p = np.asarray(prices, dtype=float)
+    v = np.asarray(volumes, dtype=float)
+    ok = ~(np.isnan(p) | np.isnan(v))
+    p, v = p[ok], v[ok]
+    if len(p) == 0:
+        return np.zeros(0), np.zeros(0)
+    lo, hi = price_range if price_range is not None else (p.min(), p.max())
+    if hi <= lo:
+        lo, hi = lo - 0.5, hi + 0.5
+    inside = (p >= lo) & (p <= hi)
+    edges = np.linspace(lo, hi, bins + 1)
+    # 依實際邊界值分箱 (落在邊界上的價格歸右邊那格，最高價歸最後一格)，與 np.histogram 一致；改用浮點除法時，剛好落在跳動點邊界的價格會被分錯格
+    idx = np.minimum(np.searchsorted(edges, p[inside], side="right") - 1, bins - 1)
+    hist = np.bincount(idx, weights=v[inside], minlength=bins)
+    return hist, (edges[:-1] + edges[1:]) / 2
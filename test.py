@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+
+from db_engine import BATCH_STATEMENT_TIMEOUT_MS, get_engine
 
 def test_connection():
     print("="*50)
@@ -24,7 +26,7 @@ def test_connection():
 
     try:
         # 2. 建立引擎
-        engine = create_engine(db_url)
+        engine = get_engine(db_url, statement_timeout_ms=BATCH_STATEMENT_TIMEOUT_MS)
 
         # 3. 嘗試連線並執行查詢
         with engine.connect() as conn:
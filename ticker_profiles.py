@@ -0,0 +1,107 @@
+import contextlib
+import datetime
+import os
+import sqlite3
+
+import yfinance as yf
+
+from fetch_pool import run_concurrently
+
+# ===========================
+# 美股個股基本資料快取 (sector / industry / 流通股數)
+# 每檔最多每 PROFILE_TTL_DAYS 天才呼叫一次 yf.Ticker(...).info；
+# 市值 = 快取的流通股數 × 當日收盤，不必每天逐檔查詢
+# ===========================
+PROFILE_DB = os.path.join("us_stock_dashboard", "cache", "ticker_profiles.sqlite")
+PROFILE_TTL_DAYS = 7
+PROFILE_WORKERS = 4       # yfinance 的 info 端點容易被限流，並行數保守一點
+PROFILE_DEADLINE = 180    # 秒；超過就先用舊資料，下次再補
+
+# 不需要查詢的代號 (指數 / 期貨 / 加密貨幣)
+FIXED_PROFILES = {
+    "BTC-USD": ("Crypto", "Cryptocurrency"),
+}
+
+
+def fixed_profile(symbol):
+    if symbol in FIXED_PROFILES: return FIXED_PROFILES[symbol]
+    if symbol.startswith("^") or "=F" in symbol: return "Index", "Market Index"
+    return None
+
+
+def _connect(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ticker_profiles (
+            symbol TEXT PRIMARY KEY, sector TEXT, industry TEXT,
+            shares_outstanding REAL, market_cap REAL, updated_at TEXT
+        )
+    """)
+    return conn
+
+
+def load_profiles(path=PROFILE_DB):
+    """回傳 {symbol: {'sector', 'industry', 'shares_outstanding', 'market_cap', 'updated_at'}}"""
+    if not os.path.exists(path): return {}
+    with contextlib.closing(_connect(path)) as conn:
+        rows = conn.execute("SELECT symbol, sector, industry, shares_outstanding, market_cap, updated_at FROM ticker_profiles").fetchall()
+    return {
+        r[0]: {'sector': r[1], 'industry': r[2], 'shares_outstanding': r[3], 'market_cap': r[4], 'updated_at': r[5]}
+        for r in rows
+    }
+
+
+def stale_symbols(profiles, symbols, ttl_days=PROFILE_TTL_DAYS, now=None):
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    cutoff = (now - datetime.timedelta(days=ttl_days)).isoformat()
+    return [s for s in symbols if fixed_profile(s) is None and (s not in profiles or (profiles[s]['updated_at'] or "") < cutoff)]
+
+
+def fetch_profile(symbol):
+    info = yf.Ticker(symbol).info or {}
+    shares = info.get('sharesOutstanding') or info.get('impliedSharesOutstanding')
+    # 被限流時 info 幾乎是空的；不能當成有效資料存 PROFILE_TTL_DAYS 天，回傳 None 保留舊快取、下次再試
+    if not info.get('sector') and not shares and not info.get('marketCap'): return None
+    return {
+        'sector': info.get('sector', 'Other'), 'industry': info.get('industry', 'Other'),
+        'shares_outstanding': shares,
+        'market_cap': info.get('marketCap', 0),
+    }
+
+
+def refresh_profiles(symbols, path=PROFILE_DB, ttl_days=PROFILE_TTL_DAYS):
+    """只查詢過期或沒見過的代號並寫回快取；查詢失敗的保留舊資料，下次再試。回傳完整 profiles"""
+    profiles = load_profiles(path)
+    stale = stale_symbols(profiles, symbols, ttl_days)
+    if not stale:
+        print(f"   ✨ 基本資料快取全數有效 ({len(symbols)} 檔)")
+        return profiles
+
+    print(f"   🔄 更新基本資料 {len(stale)} 檔 (快取命中 {len(symbols) - len(stale)} 檔)...")
+    fetched = run_concurrently({s: (lambda s=s: fetch_profile(s)) for s in stale}, PROFILE_DEADLINE, max_workers=PROFILE_WORKERS)
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    rows = []
+    for sym, p in fetched.items():
+        if not p: continue
+        p['updated_at'] = now
+        profiles[sym] = p
+        rows.append((sym, p['sector'], p['industry'], p['shares_outstanding'], p['market_cap'], now))
+
+    if rows:
+        # sqlite3 連線的 with 只負責 commit，不會關閉連線
+        with contextlib.closing(_connect(path)) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO ticker_profiles VALUES (?, ?, ?, ?, ?, ?)", rows)
+    print(f"   💾 基本資料快取寫入 {len(rows)} 檔")
+    return profiles
+
+
+def profile_for(symbol, profiles, close):
+    """回傳 (sector, industry, 市值)；市值優先以 流通股數 × 收盤 計算"""
+    fixed = fixed_profile(symbol)
+    if fixed: return fixed[0], fixed[1], 0
+    p = profiles.get(symbol)
+    if not p: return "Other", "Other", 0
+    shares = p.get('shares_outstanding')
+    mkt_cap = shares * close if shares else (p.get('market_cap') or 0)
+    return p.get('sector') or 'Other', p.get('industry') or 'Other', mkt_cap
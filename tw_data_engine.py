@@ -1,16 +1,16 @@
 import pandas as pd
 import numpy as np
-import requests
 import json
 import os
 import datetime
 import time
-import random
 import re
 from io import StringIO
 import yfinance as yf
 import urllib3
 
+from fetch_pool import http_get, run_concurrently, set_host_limit
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # ==========================================
@@ -32,6 +32,12 @@ FINMIND_API = "https://api.finmindtrade.com/api/v4/data"
 
 STD_COLS = ['Code', 'Name', 'Close', 'Daily_Chg%', 'Daily_Amount_B', 'Volume', 'Sector', 'Industry']
 
+# 所有來源同時抓取，整體最多等這麼久 (秒)；各主機的禮貌間隔由 fetch_pool 控制
+FETCH_DEADLINE = 90
+SECTOR_FIX_MIN_DEADLINE = 15   # 產業補強至少保留的秒數 (第一階段用完 FETCH_DEADLINE 時也照跑)
+set_host_limit("tw.stock.yahoo.com", min_interval=0.6, max_concurrent=2, jitter=0.6)
+set_host_limit("api.finmindtrade.com", min_interval=0.05, max_concurrent=8)
+
 # ==========================================
 # 1. 名單
 # ==========================================
@@ -77,7 +83,7 @@ def fetch_fear_and_greed():
     result = None
     try:
         url_api = "https://production.dataviz.cnn.io/index/fearandgreed/graphdata"
-        resp = requests.get(url_api, headers=headers, timeout=5)
+        resp = http_get(url_api, headers=headers, timeout=5)
         if resp.status_code == 200:
             data = resp.json()
             latest = data['fear_and_greed']
@@ -89,7 +95,7 @@ def fetch_fear_and_greed():
     if result is None:
         try:
             url_web = "https://edition.cnn.com/markets/fear-and-greed"
-            resp = requests.get(url_web, headers=headers, timeout=10)
+            resp = http_get(url_web, headers=headers, timeout=10)
             if resp.status_code == 200:
                 match_score = re.search(r'"score":([\d\.]+)', resp.text)
                 match_rating = re.search(r'"rating":"([a-zA-Z\s]+)"', resp.text)
@@ -113,7 +119,7 @@ def get_tw_vix_from_taifex():
     headers = { "User-Agent": "Mozilla/5.0", "Accept-Language": "zh-TW" }
     for i in range(3):
         try:
-            r = requests.get(url, headers=headers, timeout=15, verify=False)
+            r = http_get(url, headers=headers, timeout=15, verify=False)
             dfs = pd.read_html(StringIO(r.text))
             for df in dfs:
                 if len(df) > 0:
@@ -140,7 +146,7 @@ def fetch_finmind_individual(stock_id_raw):
         "end_date": end_date.strftime("%Y-%m-%d")
     }
     try:
-        r = requests.get(FINMIND_API, params=params, timeout=5)
+        r = http_get(FINMIND_API, params=params, timeout=5)
         data = r.json()
         if data.get('msg') == 'success' and data.get('data'):
             df = pd.DataFrame(data['data'])
@@ -159,29 +165,25 @@ def fetch_finmind_individual(stock_id_raw):
     except: pass
     return None
 
-def fetch_finmind_batch_targets(target_list):
-    print(f"   🚀 [FinMind] 啟動逐檔點名 ({len(target_list)} 檔)...")
-    results = []
+def fetch_finmind_names():
     name_map = {}
     try:
-        r = requests.get(FINMIND_API, params={"dataset": "TaiwanStockInfo"}, timeout=10)
+        r = http_get(FINMIND_API, params={"dataset": "TaiwanStockInfo"}, timeout=10)
         if r.status_code == 200:
             infos = r.json().get('data', [])
             for i in infos: name_map[i['stock_id']] = i.get('stock_name', '')
     except: pass
+    return name_map
 
-    count = 0
-    for code in target_list:
-        if code in INDICES_CODES: continue
-        data = fetch_finmind_individual(code)
-        if data:
-            pure_id = code.split('.')[0]
-            data['Name'] = name_map.get(pure_id, code)
-            if code in HP_SECTOR_MAP: data['Sector'] = HP_SECTOR_MAP[code]
-            results.append(data)
-            count += 1
-            if count % 10 == 0: print(f"      進度: {count}...")
-        time.sleep(0.05)
+def build_finmind_targets(rows, name_map):
+    # rows: {code: fetch_finmind_individual 結果}；依 HIGH_PRICE_CODES 原順序組表並補上名稱與產業
+    results = []
+    for code in HIGH_PRICE_CODES:
+        data = rows.get(code)
+        if not data: continue
+        data['Name'] = name_map.get(code.split('.')[0], code)
+        if code in HP_SECTOR_MAP: data['Sector'] = HP_SECTOR_MAP[code]
+        results.append(data)
     return pd.DataFrame(results)
 
 # ==========================================
@@ -190,31 +192,30 @@ def fetch_finmind_batch_targets(target_list):
 def call_yahoo_api(url):
     headers = { "User-Agent": "Mozilla/5.0", "Referer": "https://tw.stock.yahoo.com/" }
     try:
-        time.sleep(random.uniform(0.6, 1.2))
-        r = requests.get(url, headers=headers, timeout=10)
+        r = http_get(url, headers=headers, timeout=10)
         return r.json() if r.status_code == 200 else None
     except: return None
 
-def fetch_yahoo_rankings(rank_type, limit=200):
-    print(f"   [Yahoo] 抓取 {rank_type} 排行榜...")
+def fetch_yahoo_ranking(rank_type, ex, limit=200):
+    # 單一交易所 (TAI / TWO) 的單一排行榜
+    print(f"   [Yahoo] 抓取 {rank_type} 排行榜 ({ex})...")
     results = []
-    for ex in ['TAI', 'TWO']:
-        url = f"https://tw.stock.yahoo.com/_td-stock/api/resource/StockServices.rank;exchange={ex};rankCategory={rank_type};limit={limit}"
-        data = call_yahoo_api(url)
-        if data and 'list' in data:
-            for item in data['list']:
-                p = float(item.get('price', 0) or 0)
-                vol = float(item.get('volume', 0) or 0)
-                if vol == 0: vol = float(item.get('volumeK', 0) or 0) * 1000
-                amt = float(item.get('turnoverM', 0) or 0) / 100 
-                if amt == 0 and p > 0 and vol > 0: amt = (p * vol) / 100_000_000
-
-                results.append({
-                    "Code": item.get('symbol', ''), "Name": item.get('name', ''), "Close": p,
-                    "Daily_Chg%": float(item.get('changePercent', 0) or 0),
-                    "Daily_Amount_B": amt, "Volume": vol,
-                    "Sector": item.get('sectorName', '其他')
-                })
+    url = f"https://tw.stock.yahoo.com/_td-stock/api/resource/StockServices.rank;exchange={ex};rankCategory={rank_type};limit={limit}"
+    data = call_yahoo_api(url)
+    if data and 'list' in data:
+        for item in data['list']:
+            p = float(item.get('price', 0) or 0)
+            vol = float(item.get('volume', 0) or 0)
+            if vol == 0: vol = float(item.get('volumeK', 0) or 0) * 1000
+            amt = float(item.get('turnoverM', 0) or 0) / 100 
+            if amt == 0 and p > 0 and vol > 0: amt = (p * vol) / 100_000_000
+
+            results.append({
+                "Code": item.get('symbol', ''), "Name": item.get('name', ''), "Close": p,
+                "Daily_Chg%": float(item.get('changePercent', 0) or 0),
+                "Daily_Amount_B": amt, "Volume": vol,
+                "Sector": item.get('sectorName', '其他')
+            })
     return pd.DataFrame(results)
 
 def fetch_yfinance_indices():
@@ -237,14 +238,17 @@ def fetch_yfinance_indices():
     except: pass
     return pd.DataFrame(results)
 
-def fetch_yahoo_quotes(symbols):
+def fetch_yahoo_quotes(symbols, deadline_s=FETCH_DEADLINE):
     if not symbols: return pd.DataFrame()
-    results = []
     batch_size = 20
+    tasks = {}
     for i in range(0, len(symbols), batch_size):
         batch = symbols[i:i+batch_size]
         url = f"https://tw.stock.yahoo.com/_td-stock/api/resource/StockServices.quote;symbols={','.join(batch)}"
-        data = call_yahoo_api(url)
+        tasks[i] = lambda url=url: call_yahoo_api(url)
+
+    results = []
+    for i, data in sorted(run_concurrently(tasks, deadline_s).items()):
         if data and 'list' in data:
             for item in data['list']:
                 sym = item.get('symbol', '')
@@ -255,25 +259,49 @@ def fetch_yahoo_quotes(symbols):
 # ==========================================
 # 5. 主流程
 # ==========================================
+RANK_TYPES = ['turnover', 'changeUp', 'changeDown']  # 成交值 + 漲幅 + 跌幅排行
+
 def fetch_and_process_data():
-    fetch_fear_and_greed()
-    tw_vix = get_tw_vix_from_taifex()
-    
-    print("🚀 啟動 V31.0 數據引擎 (含跌幅排行)...")
-    
-    # 1. 高價股
-    df_targets = fetch_finmind_batch_targets(HIGH_PRICE_CODES)
-    
-    # 2. 排行榜 (Turnover + Gainers + Losers)
-    df_rank_t = fetch_yahoo_rankings('turnover', 200)
-    df_rank_bull = fetch_yahoo_rankings('changeUp', 200)
-    df_rank_bear = fetch_yahoo_rankings('changeDown', 200) # ✨ 新增：抓取跌幅排行
-    
-    # 3. 指數 & 原物料
-    df_indices = fetch_yfinance_indices()
-    
-    # 4. 合併
-    df_final = pd.concat([df_targets, df_rank_t, df_rank_bull, df_rank_bear, df_indices], ignore_index=True)
+    print("🚀 啟動 V31.0 數據引擎 (含跌幅排行，並行抓取)...")
+    t0 = time.monotonic()
+    deadline_at = t0 + FETCH_DEADLINE
+
+    # 1. 所有獨立來源同時抓：CNN、期交所 VIX、FinMind 高價股 (逐檔)、Yahoo 排行榜、yfinance 指數
+    tasks = {
+        'cnn': fetch_fear_and_greed,
+        'taifex_vix': get_tw_vix_from_taifex,
+        'finmind_names': fetch_finmind_names,
+        'yfinance': fetch_yfinance_indices,
+    }
+    for code in HIGH_PRICE_CODES:
+        if code in INDICES_CODES: continue
+        tasks[('finmind', code)] = lambda code=code: fetch_finmind_individual(code)
+    for rank_type in RANK_TYPES:
+        for ex in ['TAI', 'TWO']:
+            tasks[('yahoo', rank_type, ex)] = lambda rank_type=rank_type, ex=ex: fetch_yahoo_ranking(rank_type, ex, 200)
+
+    finmind_rows, rankings = {}, {}
+    def on_result(key, res):
+        # 結果一到就歸位；最後依固定優先順序合併，去重結果與逐一抓取時相同
+        if res is None: return
+        if key[0] == 'finmind':
+            finmind_rows[key[1]] = res
+            if len(finmind_rows) % 10 == 0: print(f"      FinMind 進度: {len(finmind_rows)}...")
+        elif key[0] == 'yahoo':
+            rankings[key[1:]] = res
+
+    results = run_concurrently(tasks, FETCH_DEADLINE, on_result=on_result)
+    tw_vix = results.get('taifex_vix')
+    print(f"   ⚡ 來源抓取完成 ({len(results)}/{len(tasks)})，耗時 {time.monotonic() - t0:.1f}s")
+
+    # 2. 合併 (高價股 → 成交值 → 漲幅 → 跌幅 → 指數)
+    df_targets = build_finmind_targets(finmind_rows, results.get('finmind_names') or {})
+    frames = [df_targets]
+    for rank_type in RANK_TYPES:
+        frames += [rankings.get((rank_type, ex)) for ex in ['TAI', 'TWO']]
+    frames.append(results.get('yfinance'))
+    frames = [f for f in frames if f is not None and not f.empty]
+    df_final = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
     
     if tw_vix:
         vix_row = {"Code": "^VIXTWN", "Name": "台指 VIX", "Sector": "波動率", "Close": tw_vix, "Daily_Chg%": 0, "Daily_Amount_B": 0, "Volume": 0}
@@ -296,8 +324,10 @@ def fetch_and_process_data():
         
         if targets:
             print(f"      優化產業分類 ({len(targets[:100])} 檔)...")
-            sector_df = fetch_yahoo_quotes(targets[:100])
-            if not sector_df.empty:
+            sector_df = fetch_yahoo_quotes(targets[:100], deadline_s=max(deadline_at - time.monotonic(), SECTOR_FIX_MIN_DEADLINE))
+            if sector_df.empty:
+                print("      ⚠️ 產業分類查詢逾時或失敗，沿用排行榜產業")
+            else:
                 s_map = sector_df.set_index('Code')['Sector'].to_dict()
                 df_final['Sector'] = df_final['Code'].map(s_map).fillna(df_final['Sector'])
 
@@ -53,16 +53,22 @@ def style_table(df, table_id, period_col='Daily_Chg%', is_watchlist=False):
     styler = df_show.style.format({'股價': "{:,.2f}", display_chg_col: "{:+.2f}%", '成交額(億)': "{:.2f}"}).map(color_chg, subset=[display_chg_col]).hide(axis='index')
     return styler.to_html(table_id=table_id, table_attributes='class="sortable"')
 
-def generate_html_report():
-    csv_path = os.path.join(TARGET_DIR, f"rank_all_{DATE_STR}.csv")
-    if not os.path.exists(csv_path): print("❌ No CSV"); return
+CSV_PATH = os.path.join(TARGET_DIR, f"rank_all_{DATE_STR}.csv")
+SENTIMENT_PATH = os.path.join(TARGET_DIR, f"sentiment_{DATE_STR}.json")
+DATED_PATH = os.path.join(TARGET_DIR, f"market_dashboard_{DATE_STR}.html")
+CURRENT_PATH = os.path.join(BASE_DIR, "market_dashboard_current.html")
+
+def render_daily():
+    csv_path = CSV_PATH
+    # 失敗一律 raise：report_build 才不會把舊的輸出檔當成這次的建置結果
+    if not os.path.exists(csv_path): raise RuntimeError(f"❌ No CSV: {csv_path}")
 
     try: df = pd.read_csv(csv_path, encoding='utf-8-sig')
     except: df = pd.read_csv(csv_path) 
     df.columns = df.columns.str.strip().str.replace('\ufeff', '')
 
     try:
-        with open(os.path.join(TARGET_DIR, f"sentiment_{DATE_STR}.json"), "r") as f: sentiment = json.load(f)
+        with open(SENTIMENT_PATH, "r") as f: sentiment = json.load(f)
     except: sentiment = {"score": 50, "rating": "N/A"}
     
     score = sentiment.get('score', 50)
@@ -141,15 +147,27 @@ def generate_html_report():
     </body></html>
     """
     
-    filename_dated = f"market_dashboard_{DATE_STR}.html"
-    path_dated = os.path.join(TARGET_DIR, filename_dated)
-    with open(path_dated, "w", encoding="utf-8") as f: f.write(html)
-    print(f"✅ 報表生成: {path_dated}")
-
-    filename_current = "market_dashboard_current.html"
-    path_current = os.path.join(BASE_DIR, filename_current)
-    shutil.copy(path_dated, path_current)
-    print(f"✅ 更新連結: {path_current}")
+    with open(DATED_PATH, "w", encoding="utf-8") as f: f.write(html)
+    print(f"✅ 報表生成: {DATED_PATH}")
+
+def link_current():
+    shutil.copy(DATED_PATH, CURRENT_PATH)
+    print(f"✅ 更新連結: {CURRENT_PATH}")
+
+def generate_html_report():
+    try: render_daily()
+    except RuntimeError as e: print(e)
+    if os.path.exists(DATED_PATH): link_current()
+
+def build_targets():
+    # 給 report_build 用：日報只在 CSV / 情緒指數 / 本程式有變動時重建，current 依賴日報
+    from report_build import Target
+    return [
+        Target("tw_daily", BASE_DIR, "tw_report_generator:render_daily",
+               inputs=[CSV_PATH, "tw_report_generator.py"], optional=[SENTIMENT_PATH], outputs=[DATED_PATH]),
+        Target("tw_current", BASE_DIR, "tw_report_generator:link_current",
+               inputs=[DATED_PATH], outputs=[CURRENT_PATH], deps=["tw_daily"]),
+    ]
 
 if __name__ == "__main__":
     generate_html_report()
@@ -1,14 +1,15 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import requests
 import json
 import os
 import datetime
-import time
 import re
 from io import StringIO
 
+from ticker_profiles import profile_for, refresh_profiles
+from us_price_history import period_metrics, update_history
+
 # ==========================================
 # 0. 全域設定與目錄準備
 # ==========================================
@@ -196,13 +197,30 @@ def get_market_screeners():
             if sym not in ALL_TICKER_INFO: ALL_TICKER_INFO[sym] = {"Name": sym, "Theme": "Backup"}
     return list(set(found_tickers))
 
-def get_stock_profile(ticker_obj, symbol):
-    try:
-        if symbol == "BTC-USD": return "Crypto", "Cryptocurrency", 0
-        if symbol.startswith("^") or "=F" in symbol: return "Index", "Market Index", 0
-        info = ticker_obj.info
-        return info.get('sector', 'Other'), info.get('industry', 'Other'), info.get('marketCap', 0)
-    except: return "Other", "Other", 0
+# 指數成分股 (選用)：設定 US_UNIVERSE=full 時把 S&P 500 + Nasdaq-100 全部納入
+# 價格走本地增量歷史、基本資料走每週快取，全市場規模的每日執行成本只多一次批次下載
+INDEX_CONSTITUENTS = [
+    ("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies", "Symbol", "Security"),
+    ("https://en.wikipedia.org/wiki/Nasdaq-100", "Ticker", "Company"),
+]
+
+def get_index_constituents():
+    print("🔍 正在讀取 S&P 500 / Nasdaq-100 成分股...")
+    found = []
+    headers = {"User-Agent": "Mozilla/5.0"}
+    for url, sym_col, name_col in INDEX_CONSTITUENTS:
+        try:
+            r = requests.get(url, headers=headers, timeout=10)
+            for df in pd.read_html(StringIO(r.text)):
+                if sym_col not in df.columns or name_col not in df.columns: continue
+                for sym, name in zip(df[sym_col], df[name_col]):
+                    sym = str(sym).strip().replace(".", "-")  # BRK.B → BRK-B (Yahoo 格式)
+                    found.append(sym)
+                    if sym not in ALL_TICKER_INFO: ALL_TICKER_INFO[sym] = {"Name": str(name), "Theme": "Index Member"}
+                break
+        except Exception as e:
+            print(f"⚠️ 成分股讀取失敗 ({url}): {e}")
+    return list(set(found))
 
 # ==========================================
 # 4. 主程式
@@ -210,80 +228,51 @@ def get_stock_profile(ticker_obj, symbol):
 def fetch_and_process_data():
     fetch_fear_and_greed()
     dynamic_tickers = get_market_screeners()
-    final_tickers = list(set(list(STATIC_TICKERS.keys()) + dynamic_tickers))
-    
-    print(f"🚀 準備下載 {len(final_tickers)} 檔數據...")
-    
-    results = []
-    BATCH_SIZE = 8
-    chunks = [final_tickers[i:i + BATCH_SIZE] for i in range(0, len(final_tickers), BATCH_SIZE)]
+    index_tickers = get_index_constituents() if os.getenv("US_UNIVERSE") == "full" else []
+    final_tickers = list(set(list(STATIC_TICKERS.keys()) + dynamic_tickers + index_tickers))
     
-    for i, chunk in enumerate(chunks):
-        data = pd.DataFrame()
-        for attempt in range(3):
-            try:
-                print(f"⏳ 下載批次 {i+1}/{len(chunks)}: {chunk[:3]}...")
-                data = yf.download(chunk, period="3mo", progress=False, auto_adjust=False, threads=False)
-                if not data.empty: break
-            except: time.sleep(1)
-            time.sleep(1)
+    # 產業 / 流通股數走本地快取 (每週更新)，不再每檔每天呼叫 yf.Ticker().info
+    profiles = refresh_profiles(final_tickers)
 
-        if data.empty: continue
-        
-        for ticker in chunk:
-            try:
-                if len(chunk) == 1: closes, volumes = data['Close'], data['Volume']
-                else: 
-                    try: closes, volumes = data['Close'][ticker].dropna(), data['Volume'][ticker].dropna()
-                    except: continue
-
-                if closes.empty: continue
-                current_price = closes.iloc[-1]
-                if current_price < 1.0: continue
+    # 價格走本地歷史庫：只下載最後已存日期之後的 K 棒，週 / 月指標由歷史一次算出
+    print(f"🚀 更新 {len(final_tickers)} 檔價格歷史...")
+    histories = update_history(final_tickers)
+    metrics = period_metrics(histories)
 
-                current_vol = 0 if volumes.empty else volumes.iloc[-1]
-                rvol = 0
-                if len(volumes) >= 6:
-                    avg_vol_5d = volumes.iloc[-6:-1].mean()
-                    rvol = (current_vol / avg_vol_5d) if avg_vol_5d > 0 else 0
+    daily = metrics['Daily']
+    daily = daily[daily['Close'] >= 1.0]
+    if daily.empty:
+        print("❌ 嚴重錯誤：未抓取到任何有效數據")
+        return
 
-                def calc_chg(s, shift):
-                    if len(s) > shift:
-                        prev = s.iloc[-(shift + 1)]
-                        return ((s.iloc[-1] - prev) / prev) * 100 if prev != 0 else 0
-                    return 0
-                
-                daily_chg = calc_chg(closes, 1)
-                amount_b = (current_price * current_vol) / 1_000_000_000
-                
-                t_obj = yf.Ticker(ticker)
-                sector, industry, mkt_cap_raw = get_stock_profile(t_obj, ticker)
-                mkt_cap_b = mkt_cap_raw / 1_000_000_000 if mkt_cap_raw else 0
-                name = ALL_TICKER_INFO.get(ticker, {}).get('Name', ticker)
+    base = pd.DataFrame(index=daily.index)
+    base['Code'] = daily.index
+    base['Name'] = [ALL_TICKER_INFO.get(t, {}).get('Name', t) for t in daily.index]
+    prof = [profile_for(t, profiles, c) for t, c in daily['Close'].items()]
+    base['Sector'] = [p[0] for p in prof]
+    base['Industry'] = [p[1] for p in prof]
+    base['Close'] = daily['Close'].round(2)
+    base['Market_Cap_B'] = [round(p[2] / 1_000_000_000, 2) if p[2] else 0 for p in prof]
+    base[['Sector', 'Industry']] = base[['Sector', 'Industry']].fillna('Other')
 
-                results.append({
-                    "Code": ticker, "Name": name, "Sector": sector, "Industry": industry,
-                    "Close": round(current_price, 2), "Volume": current_vol, "RVOL": round(rvol, 2),
-                    "Daily_Chg%": round(daily_chg, 2), "Weekly_Chg%": round(calc_chg(closes, 5), 2), "Monthly_Chg%": round(calc_chg(closes, 21), 2),
-                    "Daily_Amount_B": round(amount_b, 2), "Weekly_Amount_B": round(amount_b, 2), "Monthly_Amount_B": round(amount_b, 2),
-                    "Market_Cap_B": round(mkt_cap_b, 2)
-                })
-            except: continue
-        time.sleep(1)
+    # 三份 CSV 欄位相同 (報表沿用)，但 Volume / RVOL / 漲跌幅 / 成交額 各為該週期的值
+    for period_name, prefix in [('Daily', 'daily'), ('Weekly', 'weekly'), ('Monthly', 'monthly')]:
+        m = metrics[period_name].reindex(daily.index)
+        df = base.copy()
+        df['Volume'] = m['Volume'].fillna(0)
+        df['RVOL'] = m['RVOL'].round(2)
+        for p in ['Daily', 'Weekly', 'Monthly']:
+            pm = metrics[p].reindex(daily.index)
+            df[f'{p}_Chg%'] = pm['Chg%'].round(2)
+            df[f'{p}_Amount_B'] = pm['Amount_B'].round(2)
+        df = df[['Code', 'Name', 'Sector', 'Industry', 'Close', 'Volume', 'RVOL',
+                 'Daily_Chg%', 'Weekly_Chg%', 'Monthly_Chg%',
+                 'Daily_Amount_B', 'Weekly_Amount_B', 'Monthly_Amount_B', 'Market_Cap_B']]
 
-    if results:
-        df = pd.DataFrame(results)
-        df['Sector'] = df.fillna('Other')['Sector']
-        df['Industry'] = df.fillna('Other')['Industry']
-        
         # ✨ 存檔時使用 DATE_STR (美股日期)
-        for fname in [f"rank_daily_{DATE_STR}.csv", f"rank_weekly_{DATE_STR}.csv", f"rank_monthly_{DATE_STR}.csv"]:
-            csv_path = os.path.join(TARGET_DIR, fname)
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-        
-        print(f"\n✅ 數據更新完成: {TARGET_DIR}/rank_daily_{DATE_STR}.csv")
-    else:
-        print("❌ 嚴重錯誤：未抓取到任何有效數據")
+        df.to_csv(os.path.join(TARGET_DIR, f"rank_{prefix}_{DATE_STR}.csv"), index=False, encoding='utf-8-sig')
+
+    print(f"\n✅ 數據更新完成: {TARGET_DIR}/rank_daily_{DATE_STR}.csv ({len(daily)} 檔)")
 
 if __name__ == "__main__":
     fetch_and_process_data()
@@ -0,0 +1,203 @@
+import os
+import time
+
+import pandas as pd
+import yfinance as yf
+
+# ===========================
+# 美股本地日 K 歷史庫 (每檔一個 CSV，只追加)
+# - 每次只向 yfinance 要「倒數第二根已存 K 棒」之後的資料 (含最後一根，盤中跑的未完成 K 棒會被覆蓋)
+# - 讀取時以日期去重、保留最新一筆；檔案累積過長時才整檔重寫，只留最近 HISTORY_BARS 根
+# - yfinance 的 Close / Volume 即使 auto_adjust=False 也會依分割調整：增量下載多抓一根已收盤的舊 K 棒比對，
+#   收盤價差超過 RESTATE_TOLERANCE 或期間有分割紀錄，就整檔以 INITIAL_PERIOD 重抓覆寫 (否則新舊 K 棒口徑不同，週 / 月漲跌幅與 RVOL 會失真)
+# - period_metrics：以整張長表一次 groupby 算出 日 / 週 / 月 的漲跌幅、成交額與 RVOL
+# ===========================
+HISTORY_DIR = os.path.join("us_stock_dashboard", "cache", "prices")
+HISTORY_BARS = 120        # 每檔保留的交易日數 (月 RVOL 需要本月 + 前 60 根)
+COMPACT_SLACK = 20        # 追加超過這麼多列才整檔重寫
+INITIAL_PERIOD = "6mo"    # 沒有歷史的新代號第一次下載的區間
+BATCH_SIZE = 100          # yfinance 內部以多執行緒下載整批
+COLUMNS = ['date', 'open', 'high', 'low', 'close', 'volume']
+RESTATE_TOLERANCE = 0.02  # 重疊 K 棒收盤價相對差超過 2% 視為歷史已被調整 (分割比例最小也有 3:2)
+
+# 週期定義：(pandas period 頻率, 計算 RVOL 時往前比較的 K 棒數)；D 的頻率為 None 代表每根 K 棒自成一期
+PERIODS = {
+    'Daily': (None, 5),
+    'Weekly': ('W-SUN', 20),
+    'Monthly': ('M', 60),
+}
+
+
+def history_path(symbol, base_dir=HISTORY_DIR):
+    # ^GSPC / GC=F 之類的代號換成安全的檔名
+    safe = symbol.replace("^", "_IDX_").replace("=", "_EQ_").replace("/", "_")
+    return os.path.join(base_dir, f"{safe}.csv")
+
+
+def load_history(symbol, base_dir=HISTORY_DIR):
+    path = history_path(symbol, base_dir)
+    if not os.path.exists(path): return None
+    try:
+        df = pd.read_csv(path)
+    except Exception as e:
+        print(f"   ⚠️ {symbol} 歷史檔讀取失敗，將重新下載: {e}")
+        return None
+    if df.empty: return None
+    # 追加寫入可能留下同一天的舊 K 棒 (盤中快照)，保留最後寫入的那筆
+    return df.drop_duplicates('date', keep='last').sort_values('date').reset_index(drop=True)
+
+
+def append_bars(symbol, bars, existing=None, base_dir=HISTORY_DIR):
+    """把新 K 棒追加到歷史檔 (只寫 >= 最後已存日期的部分)；回傳合併後的歷史"""
+    if existing is not None:
+        bars = bars[bars['date'] >= existing['date'].iloc[-1]]
+    if bars.empty: return existing
+
+    path = history_path(symbol, base_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    bars = bars[COLUMNS]
+    if existing is None or not os.path.exists(path):
+        bars.tail(HISTORY_BARS).to_csv(path, index=False)
+        return bars.tail(HISTORY_BARS).reset_index(drop=True)
+
+    bars.to_csv(path, mode='a', header=False, index=False)
+    merged = pd.concat([existing, bars]).drop_duplicates('date', keep='last').reset_index(drop=True)
+    if len(existing) + len(bars) > HISTORY_BARS + COMPACT_SLACK:
+        merged = rewrite_history(symbol, merged, base_dir)
+    return merged
+
+
+def rewrite_history(symbol, bars, base_dir=HISTORY_DIR):
+    """整檔覆寫 (只留最近 HISTORY_BARS 根；暫存檔 + os.replace)；回傳寫入的歷史"""
+    path = history_path(symbol, base_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    bars = bars[COLUMNS].tail(HISTORY_BARS).reset_index(drop=True)
+    tmp_path = path + ".tmp"
+    bars.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return bars
+
+
+def needs_restate(existing, bars):
+    """
+    新下載的 K 棒與本地歷史口徑不同 (分割調整過) → True
+    只比對本地最後一根之前的重疊 K 棒 (最後一根可能是盤中快照，本來就會被覆蓋)
+    """
+    if 'split' in bars.columns:
+        # 分割日 <= 本地最後一根的，上次下載時已經看過 (當時就已重抓)
+        split_dates = bars.loc[bars['split'].fillna(0) > 0, 'date']
+        if (split_dates > existing['date'].iloc[-1]).any(): return True
+    old = existing[existing['date'] < existing['date'].iloc[-1]].set_index('date')['close']
+    new = bars.set_index('date')['close']
+    common = old.index.intersection(new.index)
+    if common.empty: return False
+    diff = (new[common] / old[common].replace(0, float('nan')) - 1).abs()
+    return bool((diff > RESTATE_TOLERANCE).any())
+
+
+def _split_download(data, chunk):
+    """yf.download 的結果拆成 {symbol: 標準欄位 DataFrame}"""
+    out = {}
+    if data is None or data.empty: return out
+    multi = isinstance(data.columns, pd.MultiIndex)
+    for sym in chunk:
+        try:
+            sub = data.xs(sym, axis=1, level=1) if multi else data
+        except KeyError:
+            continue
+        sub = sub.rename(columns=str.lower).rename(columns={'stock splits': 'split'})
+        extra = ['split'] if 'split' in sub.columns else []
+        sub = sub[COLUMNS[1:] + extra].dropna(subset=['close'])
+        if sub.empty: continue
+        sub = sub.reset_index()
+        sub['date'] = pd.to_datetime(sub.iloc[:, 0]).dt.strftime('%Y-%m-%d')
+        out[sym] = sub[COLUMNS + extra]
+    return out
+
+
+def _download(symbols, **kwargs):
+    bars = {}
+    chunks = [symbols[i:i + BATCH_SIZE] for i in range(0, len(symbols), BATCH_SIZE)]
+    for chunk in chunks:
+        data = pd.DataFrame()
+        for attempt in range(3):
+            try:
+                data = yf.download(chunk, progress=False, auto_adjust=False, actions=True, threads=True, **kwargs)
+                if not data.empty: break
+            except Exception as e:
+                print(f"   ⚠️ 下載失敗 (第 {attempt + 1} 次): {e}")
+            time.sleep(1)
+        bars.update(_split_download(data, chunk))
+    return bars
+
+
+def update_history(symbols, base_dir=HISTORY_DIR):
+    """補齊每檔缺少的 K 棒並寫回本地；回傳 {symbol: 歷史 DataFrame} (下載失敗的沿用舊資料)"""
+    histories = {s: load_history(s, base_dir) for s in symbols}
+
+    # 依「倒數第二根已存日期」分組 (多抓一根已收盤的 K 棒比對是否被分割調整)，同一組一次批次下載；沒有歷史的代號下載 INITIAL_PERIOD
+    groups, restate = {}, []
+    for sym, hist in histories.items():
+        groups.setdefault(None if hist is None else hist['date'].iloc[max(len(hist) - 2, 0)], []).append(sym)
+
+    for start, group in sorted(groups.items(), key=lambda kv: kv[0] or ""):
+        if start is None:
+            print(f"   🆕 {len(group)} 檔無本地歷史，下載近 {INITIAL_PERIOD}...")
+            bars = _download(group, period=INITIAL_PERIOD)
+        else:
+            print(f"   🔄 {len(group)} 檔自 {start} 起增量下載...")
+            bars = _download(group, start=start)
+        for sym in group:
+            if sym not in bars: continue
+            if histories[sym] is not None and needs_restate(histories[sym], bars[sym]):
+                restate.append(sym)
+                continue
+            histories[sym] = append_bars(sym, bars[sym], histories[sym], base_dir)
+
+    if restate:
+        print(f"   ✂️ {len(restate)} 檔歷史價格已調整 (分割等)，重抓近 {INITIAL_PERIOD} 覆寫: {', '.join(restate[:5])}{' ...' if len(restate) > 5 else ''}")
+        bars = _download(restate, period=INITIAL_PERIOD)
+        for sym in restate:
+            if sym in bars:
+                histories[sym] = rewrite_history(sym, bars[sym], base_dir)
+
+    missing = [s for s, h in histories.items() if h is None]
+    if missing:
+        print(f"   ⚠️ {len(missing)} 檔無任何價格資料: {', '.join(missing[:5])}{' ...' if len(missing) > 5 else ''}")
+    return {s: h for s, h in histories.items() if h is not None}
+
+
+def period_metrics(histories):
+    """
+    回傳 {'Daily' | 'Weekly' | 'Monthly': DataFrame(index=symbol)}，欄位：
+    Close, Volume (本期累計), Chg% (本期收盤 vs 上一期最後收盤), Amount_B (本期累計成交額), RVOL (本期日均量 / 前 N 根日均量)
+    週 / 月以日曆週期計算 (週一 ~ 週日 / 當月)，不再用固定 5 / 21 根近似
+    """
+    if not histories: return {name: pd.DataFrame() for name in PERIODS}
+
+    df = pd.concat(histories, names=['symbol', None]).reset_index(level=0)
+    df = df.dropna(subset=['close']).sort_values(['symbol', 'date'], kind='stable').reset_index(drop=True)
+    df['date'] = pd.to_datetime(df['date'])
+    df['volume'] = df['volume'].fillna(0)
+    df['amount'] = df['close'] * df['volume']
+
+    last_close = df.groupby('symbol', sort=False)['close'].last()
+
+    out = {}
+    for name, (freq, lookback) in PERIODS.items():
+        key = df['date'] if freq is None else df['date'].dt.to_period(freq).dt.start_time
+        in_cur = key == key.groupby(df['symbol']).transform('last')
+
+        cur, prev = df[in_cur].groupby('symbol'), df[~in_cur]
+        base_close = prev.groupby('symbol')['close'].last().replace(0, float('nan'))
+        # 前 lookback 根 (不含本期) 的日均量
+        prev_recent = prev[prev.groupby('symbol').cumcount(ascending=False) < lookback]
+        prev_avg_vol = prev_recent.groupby('symbol')['volume'].mean().replace(0, float('nan'))
+        cur_avg_vol = cur['volume'].mean()
+
+        res = pd.DataFrame({'Close': last_close, 'Volume': cur['volume'].sum()})
+        res['Chg%'] = (res['Close'] - base_close) / base_close * 100
+        res['Amount_B'] = cur['amount'].sum() / 1_000_000_000
+        res['RVOL'] = cur_avg_vol / prev_avg_vol
+        out[name] = res.fillna({'Chg%': 0, 'Amount_B': 0, 'RVOL': 0})
+    return out
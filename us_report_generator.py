@@ -5,6 +5,8 @@ import json
 import os
 import shutil
 
+from dashboard_publisher import print_publish_stats, publish_html, publish_redirect
+
 # ==========================================
 # 0. 設定與路徑
 # ==========================================
@@ -27,9 +29,11 @@ MM = us_date.strftime("%m")
 BASE_DIR = "us_stock_dashboard"
 TARGET_DIR = os.path.join(BASE_DIR, YYYY, MM)
 
-if not os.path.exists(TARGET_DIR):
-    print(f"❌ 目錄不存在: {TARGET_DIR}，請先執行 us_data_engine.py")
-    exit()
+RANK_CSV = {p: os.path.join(TARGET_DIR, f"rank_{p}_{US_FILENAME_STR}.csv") for p in ('daily', 'weekly', 'monthly')}
+SENTIMENT_PATH = os.path.join(TARGET_DIR, f"sentiment_{US_FILENAME_STR}.json")
+AI_REPORT_PATH = os.path.join(TARGET_DIR, f"ai_report_{US_FILENAME_STR}.json")
+PAGE_REL = f"{YYYY}/{MM}/market_dashboard_{US_FILENAME_STR}.html"
+CURRENT_REL = "market_dashboard_current.html"
 
 # 更新時間 (顯示用 UTC+8)
 now_tw = datetime.datetime.now(TZ_TW)
@@ -56,13 +60,13 @@ TV_MAPPING = {
 # 1. 資料讀取函式
 # ==========================================
 def load_sentiment_data():
-    filepath = os.path.join(TARGET_DIR, f"sentiment_{US_FILENAME_STR}.json")
+    filepath = SENTIMENT_PATH
     if os.path.exists(filepath):
         with open(filepath, "r", encoding="utf-8") as f: return json.load(f)
     return {"score": 50, "rating": "N/A"}
 
 def load_ai_data():
-    filepath = os.path.join(TARGET_DIR, f"ai_report_{US_FILENAME_STR}.json")
+    filepath = AI_REPORT_PATH
     if os.path.exists(filepath):
         with open(filepath, "r", encoding="utf-8") as f: return json.load(f)
     return []
@@ -284,7 +288,8 @@ def style_dataframe(df, table_id, period_type, is_watchlist=False, sort_by_rvol=
     if is_watchlist: styler = styler.set_properties(**{'font-size': '1.05em', 'border-bottom': '1px solid #444'})
     styler = styler.set_properties(subset=['細分產業'], **{'font-size': '0.8em', 'color': '#aaa'})
 
-    html = styler.to_html(table_id=table_id)
+    # 固定 uuid：同樣的資料重跑會得到相同的 HTML，發佈時可略過未變更的檔案
+    html = styler.set_uuid(table_id).to_html(table_id=table_id)
     html = html.replace('<table id="', '<table class="sortable" id="')
     return html
 
@@ -387,27 +392,30 @@ def generate_watchlist_html(df):
     """
 
 def create_current_link(path):
-    with open(os.path.join(BASE_DIR, "market_dashboard_current.html"), "w", encoding="utf-8") as f:
-        f.write(f'<!DOCTYPE html><html><head><meta http-equiv="refresh" content="0; url={path}" /></head></html>')
+    publish_redirect(BASE_DIR, CURRENT_REL, path)
+
+def render_daily():
+    # 失敗一律 raise：report_build 才不會把舊的輸出檔當成這次的建置結果
+    if not os.path.exists(TARGET_DIR):
+        raise RuntimeError(f"❌ 目錄不存在: {TARGET_DIR}，請先執行 us_data_engine.py")
 
-def generate_html_report():
     sentiment = load_sentiment_data()
     ai_data = load_ai_data()
     
     try:
         # ✨ [關鍵修正] 使用美股日期 (US_FILENAME_STR) 讀取 CSV
         # 確保讀到的 CSV 與 Data Engine 產生的檔名一致
-        df_daily = pd.read_csv(os.path.join(TARGET_DIR, f"rank_daily_{US_FILENAME_STR}.csv"))
+        df_daily = pd.read_csv(RANK_CSV['daily'])
         for col in ['Sector', 'Industry']:
             if col not in df_daily.columns: df_daily[col] = 'Other'
             df_daily[col] = df_daily[col].fillna('Other')
             
-        try: df_weekly = pd.read_csv(os.path.join(TARGET_DIR, f"rank_weekly_{US_FILENAME_STR}.csv"))
+        try: df_weekly = pd.read_csv(RANK_CSV['weekly'])
         except: df_weekly = pd.DataFrame()
-        try: df_monthly = pd.read_csv(os.path.join(TARGET_DIR, f"rank_monthly_{US_FILENAME_STR}.csv"))
+        try: df_monthly = pd.read_csv(RANK_CSV['monthly'])
         except: df_monthly = pd.DataFrame()
     except Exception as e:
-        print(f"❌ 讀取 CSV 失敗: {e}"); return
+        raise RuntimeError(f"❌ 讀取 CSV 失敗: {e}") from e
 
     # 生成各組件
     html_gauge = generate_gauge_html(sentiment)
@@ -501,7 +509,7 @@ def generate_html_report():
         
         {html_heatmap_script}
         
-        <script>
+        <script data-shared>
             function openTab(name) {{
                 var contents = document.getElementsByClassName("tab-content");
                 for(var i=0; i<contents.length; i++) contents[i].style.display = "none";
@@ -534,10 +542,31 @@ def generate_html_report():
     """
     
     # 使用美股日期命名 HTML
-    out_path = os.path.join(TARGET_DIR, f"market_dashboard_{US_FILENAME_STR}.html")
-    with open(out_path, "w", encoding="utf-8") as f: f.write(full_html)
-    print(f"✅ 報表生成: {out_path}")
-    create_current_link(f"{YYYY}/{MM}/market_dashboard_{US_FILENAME_STR}.html")
+    publish_html(BASE_DIR, PAGE_REL, full_html, "us_dashboard")
+    print(f"✅ 報表生成: {os.path.join(BASE_DIR, PAGE_REL)}")
+    print_publish_stats()
+
+def link_current():
+    create_current_link(PAGE_REL)
+    print(f"✅ 更新連結: {os.path.join(BASE_DIR, CURRENT_REL)}")
+
+def generate_html_report():
+    try: render_daily()
+    except RuntimeError as e: print(e)
+    if os.path.exists(os.path.join(BASE_DIR, PAGE_REL)): link_current()
+
+def build_targets():
+    # 給 report_build 用：日報只在排行 CSV / 情緒 / AI 摘要 / 本程式有變動時重建，current 依賴日報
+    from report_build import Target
+    page_path = os.path.join(BASE_DIR, PAGE_REL)
+    return [
+        Target("us_daily", BASE_DIR, "us_report_generator:render_daily",
+               inputs=[RANK_CSV['daily'], "us_report_generator.py", "dashboard_publisher.py"],
+               optional=[RANK_CSV['weekly'], RANK_CSV['monthly'], SENTIMENT_PATH, AI_REPORT_PATH],
+               outputs=[page_path]),
+        Target("us_current", BASE_DIR, "us_report_generator:link_current",
+               inputs=[page_path], outputs=[os.path.join(BASE_DIR, CURRENT_REL)], deps=["us_daily"]),
+    ]
 
 if __name__ == "__main__":
     generate_html_report()